@@ -9,15 +9,92 @@ class Config:
     GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
 
     LLM_MODEL = os.environ.get('LLM_MODEL', 'qwen-qwq-32b')
+    LLM_FALLBACK_MODEL = os.environ.get('LLM_FALLBACK_MODEL', 'llama-3.3-70b-versatile')
+    LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 30.0))
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2))
+    LLM_BACKOFF_BASE = float(os.environ.get('LLM_BACKOFF_BASE', 0.5))
+    LLM_BACKOFF_MAX = float(os.environ.get('LLM_BACKOFF_MAX', 4.0))
+    LLM_BREAKER_FAILURES = int(os.environ.get('LLM_BREAKER_FAILURES', 5))
+    LLM_BREAKER_RESET = float(os.environ.get('LLM_BREAKER_RESET', 30.0))
+    LLM_LATENCY_WINDOW = int(os.environ.get('LLM_LATENCY_WINDOW', 1000))
     EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+    EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 64))
+    EMBEDDING_CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH', os.path.join(os.getcwd(), 'data', 'embedding_cache.sqlite3'))
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES', 500000))
+    EMBEDDING_MICRO_BATCHING = os.environ.get('EMBEDDING_MICRO_BATCHING', 'true').lower() == 'true'
+    EMBEDDING_MAX_BATCH = int(os.environ.get('EMBEDDING_MAX_BATCH', 64))
+    EMBEDDING_MAX_WAIT_MS = float(os.environ.get('EMBEDDING_MAX_WAIT_MS', 5))
+    # 0 leaves the runtime's default; every process sets its own, so keep workers x threads <= cores.
+    EMBEDDING_THREADS = int(os.environ.get('EMBEDDING_THREADS', 0))
+    ONNX_MODEL_DIR = os.environ.get('ONNX_MODEL_DIR', os.path.join(os.getcwd(), 'data', 'onnx_models'))
     CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', 500))
     CHUNK_OVERLAP = int(os.environ.get('CHUNK_OVERLAP', 200))
     USER_SEMANTIC_CHUNKING = os.environ.get('USER_SEMANTIC_CHUNKING', True)
+    CHUNK_VECTOR_MODE = os.environ.get('CHUNK_VECTOR_MODE', 'model')
     INDEX_PATH = os.environ.get('INDEX_PATH', os.path.join(os.getcwd(), 'data', 'faiss_index'))
-    SIMILARITY_THRESHOLD = float(os.environ.get('SIMILARITY_THRESHOLD', 0.7))
+    WAL_COMPACT_BYTES = int(os.environ.get('WAL_COMPACT_BYTES', 16 * 1024 * 1024))
+    INDEX_TYPE = os.environ.get('INDEX_TYPE', 'flat')
+    ANN_MIN_CHUNKS = int(os.environ.get('ANN_MIN_CHUNKS', 50000))
+    ANN_TRAIN_SAMPLE = int(os.environ.get('ANN_TRAIN_SAMPLE', 100000))
+    IVF_NLIST = int(os.environ.get('IVF_NLIST', 0))
+    IVF_NPROBE = int(os.environ.get('IVF_NPROBE', 16))
+    PQ_M = int(os.environ.get('PQ_M', 0))
+    PQ_NBITS = int(os.environ.get('PQ_NBITS', 8))
+    HNSW_M = int(os.environ.get('HNSW_M', 32))
+    HNSW_EF_CONSTRUCTION = int(os.environ.get('HNSW_EF_CONSTRUCTION', 200))
+    HNSW_EF_SEARCH = int(os.environ.get('HNSW_EF_SEARCH', 64))
+    SIMILARITY_THRESHOLD = float(os.environ.get('SIMILARITY_THRESHOLD', 0.35))
+    ADAPTIVE_K_MAX_DROP = float(os.environ.get('ADAPTIVE_K_MAX_DROP', 0.15))
+    LEXICAL_MIN_RATIO = float(os.environ.get('LEXICAL_MIN_RATIO', 0.5))
+    CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 2000))
+    CONTEXT_TOKENIZER = os.environ.get('CONTEXT_TOKENIZER', 'Qwen/QwQ-32B')
+    CONTEXT_DUPLICATE_THRESHOLD = float(os.environ.get('CONTEXT_DUPLICATE_THRESHOLD', 0.9))
+    WEB_SEARCH_MODE = os.environ.get('WEB_SEARCH_MODE', 'fallback')
+    WEB_SEARCH_PROVIDER = os.environ.get('WEB_SEARCH_PROVIDER', 'tavily')
+    WEB_SEARCH_STUB_FILE = os.environ.get('WEB_SEARCH_STUB_FILE', '')
+    WEB_SEARCH_DEPTH = os.environ.get('WEB_SEARCH_DEPTH', 'basic')
+    WEB_SEARCH_RESULTS = int(os.environ.get('WEB_SEARCH_RESULTS', 5))
+    WEB_SEARCH_TIMEOUT = float(os.environ.get('WEB_SEARCH_TIMEOUT', 3.0))
+    LOCAL_SEARCH_TIMEOUT = float(os.environ.get('LOCAL_SEARCH_TIMEOUT', 2.0))
+    WEB_SEARCH_CACHE_TTL = int(os.environ.get('WEB_SEARCH_CACHE_TTL', 3600))
+    WEB_SEARCH_CACHE_SIZE = int(os.environ.get('WEB_SEARCH_CACHE_SIZE', 1024))
+    HISTORY_MODEL = os.environ.get('HISTORY_MODEL', 'llama-3.1-8b-instant')
+    HISTORY_TIMEOUT = float(os.environ.get('HISTORY_TIMEOUT', 5.0))
+    HISTORY_WINDOW = int(os.environ.get('HISTORY_WINDOW', 6))
+    HISTORY_TOKEN_BUDGET = int(os.environ.get('HISTORY_TOKEN_BUDGET', 600))
+    HISTORY_SUMMARY_TOKENS = int(os.environ.get('HISTORY_SUMMARY_TOKENS', 250))
+    HISTORY_MESSAGE_TOKENS = int(os.environ.get('HISTORY_MESSAGE_TOKENS', 150))
+    HISTORY_SUMMARY_BATCH = int(os.environ.get('HISTORY_SUMMARY_BATCH', 4))
+    HISTORY_CACHE_TTL = int(os.environ.get('HISTORY_CACHE_TTL', 24 * 3600))
+    SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', 0.95))
+    SEMANTIC_CACHE_TTL = int(os.environ.get('SEMANTIC_CACHE_TTL', 24 * 3600))
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get('SEMANTIC_CACHE_MAX_ENTRIES', 256))
+    SINGLEFLIGHT_LOCK_TTL = int(os.environ.get('SINGLEFLIGHT_LOCK_TTL', 120))
+    # Only hands the result to workers polling for it; it is not a cache.
+    SINGLEFLIGHT_RESULT_TTL = int(os.environ.get('SINGLEFLIGHT_RESULT_TTL', 2))
+    SINGLEFLIGHT_WAIT_TIMEOUT = float(os.environ.get('SINGLEFLIGHT_WAIT_TIMEOUT', 120.0))
+    SINGLEFLIGHT_POLL_INTERVAL = float(os.environ.get('SINGLEFLIGHT_POLL_INTERVAL', 0.1))
+    ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 32))
+    ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 64))
+    ADMISSION_TENANT_SHARE = float(os.environ.get('ADMISSION_TENANT_SHARE', 0.25))
+    ADMISSION_MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', 10.0))
+    # Every admitted request runs at most one local and one web search at a time.
+    LOCAL_SEARCH_WORKERS = int(os.environ.get('LOCAL_SEARCH_WORKERS', ADMISSION_MAX_CONCURRENT))
+    WEB_SEARCH_WORKERS = int(os.environ.get('WEB_SEARCH_WORKERS', ADMISSION_MAX_CONCURRENT))
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE', 4096))
+    RETRIEVAL_CACHE_TTL = int(os.environ.get('RETRIEVAL_CACHE_TTL', 24 * 3600))
+    HYBRID_RETRIEVAL = os.environ.get('HYBRID_RETRIEVAL', 'true').lower() == 'true'
+    HYBRID_CANDIDATES = int(os.environ.get('HYBRID_CANDIDATES', 20))
+    RRF_K = int(os.environ.get('RRF_K', 60))
+    DENSE_WEIGHT = float(os.environ.get('DENSE_WEIGHT', 1.0))
+    LEXICAL_WEIGHT = float(os.environ.get('LEXICAL_WEIGHT', 1.0))
 
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', os.path.join(os.getcwd(), 'data', 'input_data'))
     ALLOWED_EXTENSIONS = set(os.environ.get('ALLOWED_EXTENSIONS', 'pdf,doc,docx').split(','))
+    EXTRACTION_WORKERS = int(os.environ.get('EXTRACTION_WORKERS', min(4, os.cpu_count() or 1)))
+    PARALLEL_EXTRACTION_MIN_PAGES = int(os.environ.get('PARALLEL_EXTRACTION_MIN_PAGES', 32))
+    EXTRACTION_PAGE_BATCH = int(os.environ.get('EXTRACTION_PAGE_BATCH', 8))
+    EXTRACTION_BLOCK_CHARS = int(os.environ.get('EXTRACTION_BLOCK_CHARS', 4000))
     JWT_COOKIE_NAME = os.environ.get('JWT_COOKIE_NAME', 'jwt_token')
     
     DB_PASSWORD = os.environ.get('DB_PASSWORD')
@@ -25,6 +102,9 @@ class Config:
     DB_NAME = os.environ.get('DB_NAME', 'document_chat')
     DB_PORT = os.environ.get('DB_PORT', '5432')
     DB_HOST = os.environ.get('DB_HOST')
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 32))
+    ASYNC_DB_POOL_SIZE = int(os.environ.get('ASYNC_DB_POOL_SIZE', 50))
+    ASGI_EXECUTOR_WORKERS = int(os.environ.get('ASGI_EXECUTOR_WORKERS', min(32, (os.cpu_count() or 1) + 4)))
 
     def validate(self):
         """Validate required configuration variables."""
@@ -34,6 +114,9 @@ class Config:
             raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
         if not self.TAVILY_API_KEY or not self.GROQ_API_KEY:
             raise ValueError("TAVILY_API_KEY and GROQ_API_KEY are required")
+        if self.ADMISSION_MAX_CONCURRENT > self.DB_POOL_SIZE:
+            # Admitted requests beyond the pool would fail with PoolError instead of a 429/503.
+            raise ValueError(f"ADMISSION_MAX_CONCURRENT ({self.ADMISSION_MAX_CONCURRENT}) must not exceed DB_POOL_SIZE ({self.DB_POOL_SIZE})")
 
 config = Config()
 config.validate()
\ No newline at end of file
@@ -1,6 +1,6 @@
 import os
 import logging
-from flask import Flask, request, jsonify, send_from_directory, render_template, redirect, url_for, make_response
+from flask import Flask, request, jsonify, send_from_directory, render_template, redirect, url_for, make_response, Response, stream_with_context
 from flask_cors import CORS
 from langchain_core.runnables.utils import Output
 from flask_limiter import Limiter
@@ -9,8 +9,11 @@ import bleach
 import psycopg2
 from celery import Celery
 import uuid
+import json
+import time
 import bcrypt
 import re
+import math
 from datetime import datetime, timedelta
 import jwt
 from functools import wraps
@@ -19,13 +22,20 @@ from werkzeug.exceptions import RequestEntityTooLarge
 from src.indexers import FAISSVectorStore
 from src.chunking import RAGChunker
 from src.generator import ChatDocs
-from langchain_huggingface import HuggingFaceEmbeddings
-import PyPDF2
-import docx
+from src.extraction import is_pdf
+from src.web_search import WebSearch
+from src.resilience import LLMUnavailableError
+from src.embeddings import load_embeddings, embedding_stats
 from Configuration import config
-from modules.database import init_db, create_user, get_user_by_email, create_chat_db, get_chats_db, delete_chat_db, verify_otp, get_db_connection, connection_pool
+from modules.database import init_db, create_user, get_user_by_email, create_chat_db, get_chats_db, delete_chat_db, verify_otp, get_db_connection, connection_pool, get_document_status, update_document_status, chat_belongs_to_user, create_message
 from modules.redis_client import RedisClient
-from modules.tasks import index_document_task, send_otp_task
+from modules.semantic_cache import SemanticCache
+from modules.retrieval_cache import RetrievalCache
+from modules.web_cache import WebSearchCache
+from modules.history import ChatHistory
+from modules.singleflight import SingleFlight, flight_key
+from modules.admission import AdmissionController, AdmissionRejected, PRIORITIES
+from modules.tasks import index_document_task, send_otp_task, summarize_chat_task
 
 # Configure logging
 logging.basicConfig(
@@ -64,7 +74,7 @@ ALLOWED_EXTENSIONS = config.ALLOWED_EXTENSIONS
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 redis_client = RedisClient()
-embeddings = HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL)
+embeddings = load_embeddings()
 chunker = RAGChunker(
     chunk_size=config.CHUNK_SIZE,
     chunk_overlap=config.CHUNK_OVERLAP,
@@ -75,15 +85,21 @@ vector_store = FAISSVectorStore(
     index_path=config.INDEX_PATH,
     use_semantic_chunking=config.USER_SEMANTIC_CHUNKING,
     chunker=chunker,
-    embeddings=embeddings
+    embeddings=embeddings,
+    result_cache=RetrievalCache(redis_client)
 )
 rag_system = ChatDocs(
     llm_model=config.LLM_MODEL,
     similarity_threshold=config.SIMILARITY_THRESHOLD,
     use_semantic_chunking=config.USER_SEMANTIC_CHUNKING,
     vector_store=vector_store,
-    embeddings=embeddings
+    embeddings=embeddings,
+    web_search=WebSearch(cache=WebSearchCache(redis_client))
 )
+semantic_cache = SemanticCache(redis_client, embeddings)
+chat_history = ChatHistory(redis_client)
+singleflight = SingleFlight(redis_client)
+admission = AdmissionController()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -96,27 +112,6 @@ def format_file_size(bytes):
     else:
         return f"{bytes / 1048576:.1f} MB"
 
-def extract_text_from_file(file_path, extension):
-    try:
-        if extension == 'pdf':
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ''
-                for page in pdf_reader.pages:
-                    text += page.extract_text() or ''
-                return text
-        elif extension == 'docx':
-            doc = docx.Document(file_path)
-            return '\n'.join([para.text for para in doc.paragraphs])
-        elif extension == 'txt':
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-        else:
-            return ''
-    except Exception as e:
-        logger.error(f"Error extracting text from {file_path}: {str(e)}")
-        return ''
-
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -386,14 +381,10 @@ def upload_document(current_user_id, current_user_name):
             file_size = os.path.getsize(file_path)
             upload_date = datetime.now()
 
-            if file_ext == 'pdf':
-                try:
-                    with open(file_path, 'rb') as f:
-                        PyPDF2.PdfReader(f)
-                except Exception as e:
-                    os.remove(file_path)
-                    logger.error(f"Invalid PDF uploaded by {current_user_id}: {str(e)}")
-                    return jsonify({'error': 'Invalid PDF file'}), 400
+            if file_ext == 'pdf' and not is_pdf(file_path):
+                os.remove(file_path)
+                logger.error(f"Invalid PDF uploaded by {current_user_id}")
+                return jsonify({'error': 'Invalid PDF file'}), 400
 
             conn = get_db_connection()
             try:
@@ -407,9 +398,9 @@ def upload_document(current_user_id, current_user_name):
                     return jsonify({'error': 'File already exists'}), 400
 
                 c.execute('''
-                    INSERT INTO documents (id, filename, size, upload_date, extension, chat_id)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                ''', (file_id, filename, file_size, upload_date, file_ext, chat_id))
+                    INSERT INTO documents (id, filename, size, upload_date, extension, chat_id, status)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ''', (file_id, filename, file_size, upload_date, file_ext, chat_id, 'queued'))
                 conn.commit()
             except Exception as e:
                 conn.rollback()
@@ -420,28 +411,27 @@ def upload_document(current_user_id, current_user_name):
                 if conn:
                     connection_pool.putconn(conn)
 
-            text = extract_text_from_file(file_path, file_ext)
-            print(text)
-            if not text:
-                os.remove(file_path)
-                logger.error(f"Failed to extract text from {filename} by {current_user_id}")
-                return jsonify({'error': 'Unable to extract text from file'}), 400
-
+            redis_client.delete_cache(f"documents:chat:{chat_id}")
+            semantic_cache.invalidate(chat_id)
             try:
-                index_document_task(file_id, text, chat_id, filename, f"{file_id}.{file_ext}")
+                job = index_document_task.delay(file_id, file_path, file_ext, chat_id, filename, f"{file_id}.{file_ext}")
             except Exception as e:
                 logger.error(f"Error scheduling index task for {file_id}: {str(e)}")
+                update_document_status(file_id, 'failed', error='Unable to schedule indexing')
+                return jsonify({'error': 'Unable to schedule document indexing'}), 503
 
-            redis_client.delete_cache(f"documents:chat:{chat_id}")
-            logger.info(f"Document {filename} uploaded by {current_user_id}")
+            logger.info(f"Document {filename} uploaded by {current_user_id}, indexing job {job.id}")
             return jsonify({
                 'id': file_id,
+                'job_id': job.id,
                 'filename': filename,
                 'size': format_file_size(file_size),
                 'upload_date': upload_date.strftime('%B %d, %Y'),
                 'extension': file_ext,
-                'chat_id': chat_id
-            }), 200
+                'chat_id': chat_id,
+                'status': 'queued',
+                'progress': {'done': 0, 'total': 0}
+            }), 202
         logger.warning(f"Invalid file type uploaded by {current_user_id}: {file.filename}")
         return jsonify({'error': 'File type not allowed'}), 400
     except RequestEntityTooLarge:
@@ -467,7 +457,7 @@ def get_documents(current_user_id, current_user_name):
     try:
         c = conn.cursor()
         c.execute('''
-            SELECT id, filename, size, upload_date, extension 
+            SELECT id, filename, size, upload_date, extension, status, progress_done, progress_total
             FROM documents 
             WHERE chat_id = %s 
             ORDER BY upload_date DESC
@@ -479,7 +469,9 @@ def get_documents(current_user_id, current_user_name):
             'filename': doc[1],
             'size': format_file_size(doc[2]),
             'upload_date': doc[3].strftime('%B %d, %Y'),
-            'extension': doc[4]
+            'extension': doc[4],
+            'status': doc[5],
+            'progress': {'done': doc[6], 'total': doc[7]}
         } for doc in documents]
 
         redis_client.set_cache(cache_key, formatted_documents)
@@ -492,6 +484,59 @@ def get_documents(current_user_id, current_user_name):
         if conn:
             connection_pool.putconn(conn)
 
+@app.route('/api/documents/<id>/status', methods=['GET'])
+@token_required
+@limiter.limit("120 per minute")
+def document_status(current_user_id, current_user_name, id):
+    id = bleach.clean(id)
+    status = get_document_status(id, current_user_id)
+    if not status:
+        logger.warning(f"Status request for document {id} not found or access denied for {current_user_id}")
+        return jsonify({'error': 'Document not found'}), 404
+    return jsonify(status), 200
+
+@app.route('/api/stats/embeddings', methods=['GET'])
+@token_required
+@limiter.limit("20 per minute")
+def get_embedding_stats(current_user_id, current_user_name):
+    return jsonify(embedding_stats(embeddings)), 200
+
+@app.route('/api/stats/semantic-cache', methods=['GET'])
+@token_required
+@limiter.limit("20 per minute")
+def get_semantic_cache_stats(current_user_id, current_user_name):
+    return jsonify(semantic_cache.stats()), 200
+
+@app.route('/api/stats/context', methods=['GET'])
+@token_required
+@limiter.limit("20 per minute")
+def get_context_stats(current_user_id, current_user_name):
+    return jsonify(rag_system.context_builder.stats()), 200
+
+@app.route('/api/stats/llm', methods=['GET'])
+@token_required
+@limiter.limit("20 per minute")
+def get_llm_stats(current_user_id, current_user_name):
+    return jsonify(rag_system.llm.stats()), 200
+
+@app.route('/api/stats/singleflight', methods=['GET'])
+@token_required
+@limiter.limit("20 per minute")
+def get_singleflight_stats(current_user_id, current_user_name):
+    return jsonify(singleflight.stats()), 200
+
+@app.route('/api/stats/admission', methods=['GET'])
+@token_required
+@limiter.limit("20 per minute")
+def get_admission_stats(current_user_id, current_user_name):
+    return jsonify(admission.stats()), 200
+
+@app.route('/api/stats/retrieval', methods=['GET'])
+@token_required
+@limiter.limit("20 per minute")
+def get_retrieval_stats(current_user_id, current_user_name):
+    return jsonify(vector_store.cache_stats()), 200
+
 @app.route('/api/documents/<id>', methods=['DELETE'])
 @token_required
 @limiter.limit("10 per minute")
@@ -512,7 +557,7 @@ def delete_document(current_user_id, current_user_name, id):
         file_path = os.path.join(UPLOAD_FOLDER, f"{id}.{extension}")
 
         try:
-            vector_store.delete_documents([id])
+            vector_store.delete_documents([id], chat_id=chat_id)
         except Exception as e:
             logger.error(f"Error deleting document {id} from vector store: {str(e)}")
             return jsonify({'error': 'Failed to delete document from vector store'}), 500
@@ -529,6 +574,7 @@ def delete_document(current_user_id, current_user_name, id):
 
         redis_client.delete_cache(f"documents:chat:{chat_id}")
         redis_client.delete_cache(f"document:{id}")
+        semantic_cache.invalidate(chat_id)
         logger.info(f"Document {id} deleted by {current_user_id}")
         return jsonify({'message': 'Document deleted successfully'}), 200
     except psycopg2.Error as e:
@@ -574,26 +620,31 @@ def get_chats(current_user_id, current_user_name):
 @csrf.exempt
 def delete_chat(current_user_id, current_user_name, id):
     id = bleach.clean(id)
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute('SELECT id FROM documents WHERE chat_id = %s', (id,))
+        doc_ids = [doc[0] for doc in c.fetchall()]
+    except psycopg2.Error as e:
+        logger.error(f"Error retrieving documents for chat {id}: {str(e)}")
+        return jsonify({'error': 'Database error'}), 500
+    finally:
+        if conn:
+            connection_pool.putconn(conn)
+
     success, message = delete_chat_db(id, current_user_id)
     
     if success:
-        conn = get_db_connection()
         try:
-            c = conn.cursor()
-            c.execute('SELECT id FROM documents WHERE chat_id = %s', (id,))
-            doc_ids = [doc[0] for doc in c.fetchall()]
-            if doc_ids:
-                vector_store.delete_documents(doc_ids)
+            vector_store.delete_chat(id)
         except Exception as e:
-            logger.error(f"Error deleting documents for chat {id}: {str(e)}")
+            logger.error(f"Error deleting index shard for chat {id}: {str(e)}")
             return jsonify({'error': 'Failed to delete documents from vector store'}), 500
-        finally:
-            if conn:
-                connection_pool.putconn(conn)
 
         redis_client.delete_cache(f"chats:user:{current_user_id}")
         redis_client.delete_cache(f"documents:chat:{id}")
         redis_client.delete_cache(f"messages:chat:{id}")
+        chat_history.invalidate(id)
         for doc_id in doc_ids:
             redis_client.delete_cache(f"document:{doc_id}")
         logger.info(f"Chat {id} deleted by {current_user_id}")
@@ -611,27 +662,45 @@ def send_message(current_user_id, current_user_name, chat_id):
     if not message_content:
         logger.warning(f"Message send attempt by {current_user_id} with no content")
         return jsonify({'error': 'Message content is required'}), 400
+    priority = request_priority(request.headers)
+    if priority is None:
+        return jsonify({'error': f"X-Priority must be one of {', '.join(PRIORITIES)}"}), 400
     try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute('SELECT id FROM chats WHERE id = %s AND user_id = %s', (chat_id, current_user_id))
-        if not c.fetchone():
-            conn.close()
+        # Wait for a slot before taking a database connection or storing anything.
+        ticket = admission.acquire(current_user_id, priority)
+    except AdmissionRejected as e:
+        logger.warning(f"Message from {current_user_id} not admitted ({e.status}): {e}")
+        return rejected_response(e)
+    try:
+        return answer_request(current_user_id, chat_id, message_content)
+    finally:
+        ticket.release()
+
+def answer_request(current_user_id, chat_id, message_content):
+    try:
+        # No pooled connection is held while the LLM answers, so admitted
+        # requests never wait on, or exhaust, the database pool.
+        if not chat_belongs_to_user(chat_id, current_user_id):
             logger.warning(f"Chat {chat_id} not found or access denied for {current_user_id}")
             return jsonify({'error': 'Chat not found or access denied'}), 404
         message_id = str(uuid.uuid4())
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        c.execute('''
-        INSERT INTO messages (id, chat_id, content, sender, timestamp)
-        VALUES (%s, %s, %s, %s, %s)
-        ''', (message_id, chat_id, message_content, 'user', timestamp))
-        rag_system.find_content(message_content, chat_id = chat_id)  # Pass chat_id to filter documents
-        bot_response = rag_system.run()
+        bot_response, sources = coalesced_answer(chat_id, message_content, message_id)
         bot_message_id = str(uuid.uuid4())
-        c.execute('''
-        INSERT INTO messages (id, chat_id, content, sender, timestamp)
-        VALUES (%s, %s, %s, %s, %s)
-        ''', (bot_message_id, chat_id, bot_response, 'bot', timestamp))
+        conn = get_db_connection()
+        try:
+            c = conn.cursor()
+            c.execute('''
+            INSERT INTO messages (id, chat_id, content, sender, timestamp)
+            VALUES (%s, %s, %s, %s, %s)
+            ''', (message_id, chat_id, message_content, 'user', timestamp))
+            c.execute('''
+            INSERT INTO messages (id, chat_id, content, sender, timestamp)
+            VALUES (%s, %s, %s, %s, %s)
+            ''', (bot_message_id, chat_id, bot_response, 'bot', timestamp))
+            conn.commit()
+        finally:
+            connection_pool.putconn(conn)
         Output = {
             'user_message': {
                 'id': message_id,
@@ -643,13 +712,20 @@ def send_message(current_user_id, current_user_name, chat_id):
                 'id': bot_message_id,
                 'content': bot_response,
                 'sender': 'bot',
-                'timestamp': timestamp
+                'timestamp': timestamp,
+                'sources': sources
             }
         }
-        conn.commit()
-        conn.close()
         redis_client.delete_cache(f"messages:chat:{chat_id}")
+        record_message(chat_id, message_id, 'user', message_content)
+        record_message(chat_id, bot_message_id, 'bot', bot_response)
         return jsonify(Output), 200
+    except LLMUnavailableError as e:
+        # The breaker is open: fail fast and tell the client when to come back.
+        logger.error(f"LLM unavailable for chat {chat_id}: {e}")
+        response = jsonify({'error': 'The assistant is temporarily unavailable, please retry shortly'})
+        response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+        return response, 503
     except Exception as e:
         logger.error(f"Error generating bot response: {e}")
         bot_response = "Sorry, I couldn't process your request at this time."
@@ -673,6 +749,192 @@ def send_message(current_user_id, current_user_name, chat_id):
         return jsonify(Output), 500
         
 
+def format_sources(documents):
+    sources = []
+    seen = set()
+    for doc in documents:
+        key = (doc.metadata.get('doc_id'), doc.metadata.get('page'))
+        if key in seen:
+            continue
+        seen.add(key)
+        sources.append({
+            'doc_id': doc.metadata.get('doc_id'),
+            'filename': doc.metadata.get('filename'),
+            'page': doc.metadata.get('page')
+        })
+    return sources
+
+def lookup_answer(chat_id, query):
+    generation = vector_store.generation(chat_id)
+    return generation, semantic_cache.lookup(chat_id, generation, query)
+
+def store_answer(chat_id, generation, query, answer, sources):
+    # Answers without retrieved context (empty chat, retrieval error) are not worth keeping.
+    if sources:
+        semantic_cache.store(chat_id, generation, query, answer, sources)
+
+def load_history(chat_id, message_id):
+    # The question being answered is already stored; it is not part of its own history.
+    history = chat_history.load(chat_id)
+    history['messages'] = [message for message in history['messages'] if message['id'] != str(message_id)]
+    return history
+
+def begin_turn(chat_id, message_id, query):
+    history = load_history(chat_id, message_id)
+    chat_history.append(chat_id, message_id, 'user', query)
+    return history
+
+def record_message(chat_id, message_id, sender, content):
+    chat_history.append(chat_id, message_id, sender, content)
+    if sender == 'bot':
+        try:
+            summarize_chat_task.delay(chat_id)
+        except Exception as e:
+            logger.error(f"Error queueing history summary for chat {chat_id}: {e}")
+
+def answer_message(chat_id, query, message_id):
+    # Follow-ups are answered from the standalone question, which is also the
+    # semantic cache key: "and the second one?" means something else in every chat turn.
+    history = load_history(chat_id, message_id)
+    retrieval_query = rag_system.standalone_query(query, history)
+    generation, cached = lookup_answer(chat_id, retrieval_query)
+    if cached:
+        return cached['answer'], cached['sources']
+    result = rag_system.answer(query, chat_id = chat_id, history = history, retrieval_query = retrieval_query)
+    sources = format_sources(result['sources'])
+    store_answer(chat_id, generation, retrieval_query, result['answer'], sources)
+    return result['answer'], sources
+
+def answer_key(chat_id, query):
+    return flight_key(chat_id, vector_store.generation(chat_id), query)
+
+def coalesced_answer(chat_id, query, message_id):
+    # Double submits and regenerations of a question share one retrieval and LLM call.
+    answer, sources = singleflight.do(answer_key(chat_id, query), lambda: list(answer_message(chat_id, query, message_id)))
+    return answer, sources
+
+def request_priority(headers):
+    # Chat UIs are interactive; batch clients mark themselves with X-Priority: bulk.
+    priority = headers.get('X-Priority', 'interactive').strip().lower()
+    return priority if priority in PRIORITIES else None
+
+def rejected_response(e):
+    response = jsonify({'error': str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, e.status
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/chats/<chat_id>/messages/stream', methods=['POST'])
+@token_required
+@limiter.limit("20 per minute")
+@csrf.exempt
+def stream_message(current_user_id, current_user_name, chat_id):
+    message_content = request.json.get('content')
+    if not message_content:
+        logger.warning(f"Message stream attempt by {current_user_id} with no content")
+        return jsonify({'error': 'Message content is required'}), 400
+    priority = request_priority(request.headers)
+    if priority is None:
+        return jsonify({'error': f"X-Priority must be one of {', '.join(PRIORITIES)}"}), 400
+    try:
+        if not chat_belongs_to_user(chat_id, current_user_id):
+            logger.warning(f"Chat {chat_id} not found or access denied for {current_user_id}")
+            return jsonify({'error': 'Chat not found or access denied'}), 404
+    except Exception as e:
+        logger.error(f"Error checking chat {chat_id}: {e}")
+        return jsonify({'error': 'Database error'}), 500
+    try:
+        ticket = admission.acquire(current_user_id, priority)
+    except AdmissionRejected as e:
+        logger.warning(f"Stream from {current_user_id} not admitted ({e.status}): {e}")
+        return rejected_response(e)
+    try:
+        message_id, timestamp = create_message(chat_id, message_content, 'user')
+    except Exception as e:
+        ticket.release()
+        logger.error(f"Error storing message for chat {chat_id}: {e}")
+        return jsonify({'error': 'Failed to store message'}), 500
+    redis_client.delete_cache(f"messages:chat:{chat_id}")
+    try:
+        history = begin_turn(chat_id, message_id, message_content)
+    except Exception:
+        ticket.release()
+        raise
+    bot_message_id = str(uuid.uuid4())
+
+    def generate():
+        # The database connection is not held while tokens are generated; the
+        # assembled bot message is written once the stream ends, even if the
+        # client disconnects half-way.
+        parts = []
+        failed = False
+        started = time.monotonic()
+        first_token_at = None
+        try:
+            yield sse_event('start', {
+                'user_message': {
+                    'id': message_id,
+                    'content': message_content,
+                    'sender': 'user',
+                    'timestamp': timestamp
+                },
+                'bot_message_id': bot_message_id
+            })
+            retrieval_query = rag_system.standalone_query(message_content, history)
+            generation, cached = lookup_answer(chat_id, retrieval_query)
+            if cached:
+                yield sse_event('sources', {'sources': cached['sources']})
+                parts.append(cached['answer'])
+                yield sse_event('token', {'text': cached['answer']})
+            else:
+                sources, tokens = rag_system.stream_answer(message_content, chat_id = chat_id, history = history, retrieval_query = retrieval_query)
+                sources = format_sources(sources)
+                yield sse_event('sources', {'sources': sources})
+                for token in tokens:
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                        logger.info(f"Time to first token for chat {chat_id}: {first_token_at - started:.3f}s")
+                    parts.append(token)
+                    yield sse_event('token', {'text': token})
+                store_answer(chat_id, generation, retrieval_query, ''.join(parts), sources)
+        except Exception as e:
+            logger.error(f"Error streaming bot response: {e}")
+            failed = True
+            error = "The response was interrupted." if parts else "Sorry, I couldn't process your request at this time."
+            if not parts:
+                parts.append(error)
+            yield sse_event('error', {'error': error})
+        finally:
+            bot_response = ''.join(parts)
+            bot_timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            if bot_response:
+                try:
+                    _, bot_timestamp = create_message(chat_id, bot_response, 'bot', bot_message_id, bot_timestamp)
+                    redis_client.delete_cache(f"messages:chat:{chat_id}")
+                    record_message(chat_id, bot_message_id, 'bot', bot_response)
+                except Exception as e:
+                    logger.error(f"Error storing bot response for chat {chat_id}: {e}")
+            logger.info(f"Streamed {len(parts)} fragments for chat {chat_id} in {time.monotonic() - started:.3f}s")
+        if not failed:
+            yield sse_event('done', {
+                'bot_response': {
+                    'id': bot_message_id,
+                    'content': bot_response,
+                    'sender': 'bot',
+                    'timestamp': bot_timestamp
+                }
+            })
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # The slot is held until the stream is closed, finished or not.
+    response.call_on_close(ticket.release)
+    return response
+
 @app.route('/api/chats/<chat_id>/messages', methods=['GET'])
 @token_required
 @limiter.limit("20 per minute")
@@ -852,7 +1114,6 @@ def delete_all_chats(current_user_id, current_user_name):
         for chat_id in chat_ids:
             c.execute('SELECT id, extension FROM documents WHERE chat_id = %s', (chat_id,))
             documents = c.fetchall()
-            doc_ids = [doc[0] for doc in documents]
             for doc in documents:
                 file_path = os.path.join(UPLOAD_FOLDER, f"{doc[0]}.{doc[1]}")
                 try:
@@ -860,12 +1121,11 @@ def delete_all_chats(current_user_id, current_user_name):
                         os.remove(file_path)
                 except Exception as e:
                     logger.error(f"Error deleting file {file_path}: {str(e)}")
-            if doc_ids:
-                try:
-                    vector_store.delete_documents(doc_ids)
-                except Exception as e:
-                    logger.error(f"Error deleting documents for chat {chat_id}: {str(e)}")
-                    return jsonify({'error': 'Failed to delete documents from vector store'}), 500
+            try:
+                vector_store.delete_chat(chat_id)
+            except Exception as e:
+                logger.error(f"Error deleting index shard for chat {chat_id}: {str(e)}")
+                return jsonify({'error': 'Failed to delete documents from vector store'}), 500
 
         c.execute('DELETE FROM chats WHERE user_id = %s', (current_user_id,))
         conn.commit()
@@ -874,6 +1134,7 @@ def delete_all_chats(current_user_id, current_user_name):
         for chat_id in chat_ids:
             redis_client.delete_cache(f"documents:chat:{chat_id}")
             redis_client.delete_cache(f"messages:chat:{chat_id}")
+            chat_history.invalidate(chat_id)
         logger.info(f"All chats deleted for {current_user_id}")
         return jsonify({'message': 'All chats deleted successfully'}), 200
     except psycopg2.Error as e:
@@ -899,15 +1160,11 @@ def delete_account(current_user_id, current_user_name):
         chats = c.fetchall()
         chat_ids = [chat[0] for chat in chats]
         for chat_id in chat_ids:
-            c.execute('SELECT id FROM documents WHERE chat_id = %s', (chat_id,))
-            documents = c.fetchall()
-            doc_ids = [doc[0] for doc in documents]
-            if doc_ids:
-                try:
-                    vector_store.delete_documents(doc_ids)
-                except Exception as e:
-                    logger.error(f"Error deleting documents for user {current_user_id}: {str(e)}")
-                    return jsonify({'error': 'Failed to delete documents from vector store'}), 500
+            try:
+                vector_store.delete_chat(chat_id)
+            except Exception as e:
+                logger.error(f"Error deleting documents for user {current_user_id}: {str(e)}")
+                return jsonify({'error': 'Failed to delete documents from vector store'}), 500
 
         c.execute('DELETE FROM users WHERE id = %s', (current_user_id,))
         conn.commit()
@@ -919,6 +1176,7 @@ def delete_account(current_user_id, current_user_name):
         for chat_id in chat_ids:
             redis_client.delete_cache(f"documents:chat:{chat_id}")
             redis_client.delete_cache(f"messages:chat:{chat_id}")
+            chat_history.invalidate(chat_id)
 
         response = make_response(jsonify({'message': 'Account deleted successfully'}), 200)
         response.set_cookie(
@@ -0,0 +1,399 @@
+"""
+Asyncio serving path for the hot chat endpoints.
+
+Sending and listing messages, listing chats and listing documents are served
+natively by Starlette with asyncpg, redis.asyncio and the async LLM client, so
+a request waiting on the LLM or the database does not hold a thread. Query
+embedding and FAISS search are CPU-bound and run in a bounded thread pool.
+Each route keeps the per-minute limit of its Flask counterpart, counted per
+user in Redis. Every other route falls through to the Flask app, mounted as WSGI.
+
+Run with: uvicorn asgi:app --workers 4
+"""
+import asyncio
+import logging
+import math
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import bleach
+import jwt
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from Configuration import config
+from src.resilience import LLMUnavailableError
+from app import app as flask_app, rag_system, format_file_size, format_sources, sse_event, lookup_answer, store_answer, begin_turn, record_message, answer_key, admission, request_priority
+from modules import async_database
+from modules.redis_client import AsyncRedisClient
+from modules.singleflight import AsyncSingleFlight
+from modules.admission import AdmissionRejected, PRIORITIES
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=config.ASGI_EXECUTOR_WORKERS, thread_name_prefix='retrieval')
+redis_client = AsyncRedisClient()
+singleflight = AsyncSingleFlight(redis_client)
+# Keeps tasks that store streamed responses alive after their client disconnects.
+background_tasks = set()
+
+def authenticate(request):
+    """Return (user_id, user_name) from the JWT cookie or bearer token, or an error response."""
+    token = request.cookies.get(flask_app.config['JWT_COOKIE_NAME'])
+    if not token:
+        auth_header = request.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer'):
+            token = auth_header.split(' ')[1]
+    if not token:
+        logger.warning("Token missing in request")
+        return None, JSONResponse({'error': 'Token is missing'}, status_code=401)
+    try:
+        data = jwt.decode(token, flask_app.config['SECRET_KEY'], algorithms=['HS256'])
+        return (data['user_id'], data['user_name']), None
+    except jwt.ExpiredSignatureError:
+        logger.warning("Token expired")
+        return None, JSONResponse({'error': 'Token has expired'}, status_code=401)
+    except jwt.InvalidTokenError:
+        logger.warning("Invalid token")
+        return None, JSONResponse({'error': 'Invalid token'}, status_code=401)
+
+async def read_message(request):
+    """Return the message content of a JSON request body, or None."""
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    return body.get('content') if isinstance(body, dict) else None
+
+def read_priority(request):
+    """Return the request's priority class, or an error response for an unknown one."""
+    priority = request_priority(request.headers)
+    if priority is None:
+        return None, JSONResponse({'error': f"X-Priority must be one of {', '.join(PRIORITIES)}"}, status_code=400)
+    return priority, None
+
+async def admit(current_user_id, priority):
+    """Await an admission slot, returning (ticket, None) or (None, a 429/503 response)."""
+    try:
+        return await admission.aacquire(current_user_id, priority), None
+    except AdmissionRejected as e:
+        logger.warning(f"Request from {current_user_id} not admitted ({e.status}): {e}")
+        return None, JSONResponse({'error': str(e)}, status_code=e.status, headers={'Retry-After': str(e.retry_after)})
+
+async def rate_limit(current_user_id, route, per_minute):
+    """Apply the per-minute limit of the Flask route, per user; returns a 429 response or None."""
+    allowed, retry_after = await redis_client.hit_rate_limit(f"{route}:{current_user_id}", per_minute)
+    if allowed:
+        return None
+    logger.warning(f"Rate limit of {route} exceeded by {current_user_id}")
+    return JSONResponse({'error': f"Rate limit exceeded: {per_minute} per minute"}, status_code=429, headers={'Retry-After': str(retry_after)})
+
+async def get_chats(request):
+    user, error = authenticate(request)
+    if error:
+        return error
+    current_user_id, _ = user
+    error = await rate_limit(current_user_id, 'get_chats', 20)
+    if error:
+        return error
+    cache_key = f"chats:user:{current_user_id}"
+    cached_chats = await redis_client.get_cache(cache_key)
+    if cached_chats:
+        return JSONResponse(cached_chats)
+
+    chats = await async_database.get_chats(current_user_id)
+    await redis_client.set_cache(cache_key, chats)
+    logger.info(f"Retrieved chats for {current_user_id}")
+    return JSONResponse(chats)
+
+async def get_documents(request):
+    user, error = authenticate(request)
+    if error:
+        return error
+    current_user_id, _ = user
+    error = await rate_limit(current_user_id, 'get_documents', 20)
+    if error:
+        return error
+    chat_id = bleach.clean(request.query_params.get('chat_id', ''))
+    if not chat_id:
+        logger.warning(f"Get documents retrieval attempt by {current_user_id}")
+        return JSONResponse({'error': 'No chat ID provided'}, status_code=400)
+    if not await async_database.chat_belongs_to_user(chat_id, current_user_id):
+        logger.warning(f"Documents request for chat {chat_id} not found or access denied for {current_user_id}")
+        return JSONResponse({'error': 'Chat not found or access denied'}, status_code=404)
+
+    cache_key = f"documents:chat:{chat_id}"
+    cached_documents = await redis_client.get_cache(cache_key)
+    if cached_documents:
+        return JSONResponse(cached_documents)
+
+    try:
+        documents = await async_database.get_documents(chat_id)
+    except Exception as e:
+        logger.error(f"Error retrieving documents for chat {chat_id}: {str(e)}")
+        return JSONResponse({'error': 'Database error'}, status_code=500)
+    formatted_documents = [{
+        'id': str(doc['id']),
+        'filename': doc['filename'],
+        'size': format_file_size(doc['size']),
+        'upload_date': async_database.format_timestamp(doc['upload_date'], '%B %d, %Y'),
+        'extension': doc['extension'],
+        'status': doc['status'],
+        'progress': {'done': doc['progress_done'], 'total': doc['progress_total']}
+    } for doc in documents]
+    await redis_client.set_cache(cache_key, formatted_documents)
+    logger.info(f"Retrieved documents for chat {chat_id} by {current_user_id}")
+    return JSONResponse(formatted_documents)
+
+async def messages(request):
+    if request.method == 'POST':
+        return await send_message(request)
+    user, error = authenticate(request)
+    if error:
+        return error
+    current_user_id, _ = user
+    error = await rate_limit(current_user_id, 'get_messages', 20)
+    if error:
+        return error
+    chat_id = bleach.clean(request.path_params['chat_id'])
+    if not await async_database.chat_belongs_to_user(chat_id, current_user_id):
+        logger.warning(f"Messages request for chat {chat_id} not found or access denied for {current_user_id}")
+        return JSONResponse({'error': 'Chat not found or access denied'}, status_code=404)
+
+    cache_key = f"messages:chat:{chat_id}"
+    cached_messages = await redis_client.get_cache(cache_key)
+    if cached_messages:
+        return JSONResponse(cached_messages)
+    try:
+        formatted_messages = await async_database.get_messages(chat_id)
+    except Exception as e:
+        logger.error(f"Error retrieving messages for chat {chat_id}: {str(e)}")
+        return JSONResponse({'error': 'Database error'}, status_code=500)
+    await redis_client.set_cache(cache_key, formatted_messages)
+    logger.info(f"Retrieved messages for chat {chat_id} by {current_user_id}")
+    return JSONResponse(formatted_messages)
+
+async def send_message(request):
+    user, error = authenticate(request)
+    if error:
+        return error
+    current_user_id, _ = user
+    error = await rate_limit(current_user_id, 'send_message', 20)
+    if error:
+        return error
+    chat_id = request.path_params['chat_id']
+    message_content = await read_message(request)
+    if not message_content:
+        logger.warning(f"Message send attempt by {current_user_id} with no content")
+        return JSONResponse({'error': 'Message content is required'}, status_code=400)
+    priority, error = read_priority(request)
+    if error:
+        return error
+    if not await async_database.chat_belongs_to_user(chat_id, current_user_id):
+        logger.warning(f"Chat {chat_id} not found or access denied for {current_user_id}")
+        return JSONResponse({'error': 'Chat not found or access denied'}, status_code=404)
+    ticket, error = await admit(current_user_id, priority)
+    if error:
+        return error
+    try:
+        return await answer_request(chat_id, message_content)
+    finally:
+        ticket.release()
+
+async def answer_request(chat_id, message_content):
+    try:
+        message_id, timestamp = await async_database.create_message(chat_id, message_content, 'user')
+    except Exception as e:
+        logger.error(f"Error storing message for chat {chat_id}: {e}")
+        return JSONResponse({'error': 'Failed to store message'}, status_code=500)
+    loop = asyncio.get_running_loop()
+
+    async def answer():
+        retrieval_query = await rag_system.astandalone_query(message_content, history)
+        generation, cached = await loop.run_in_executor(executor, lookup_answer, chat_id, retrieval_query)
+        if cached:
+            return [cached['answer'], cached['sources']]
+        result = await rag_system.aanswer(message_content, chat_id=chat_id, executor=executor, history=history, retrieval_query=retrieval_query)
+        sources = format_sources(result['sources'])
+        await loop.run_in_executor(executor, store_answer, chat_id, generation, retrieval_query, result['answer'], sources)
+        return [result['answer'], sources]
+
+    try:
+        # Every request records its own question; only the answer is shared.
+        history = await loop.run_in_executor(executor, begin_turn, chat_id, message_id, message_content)
+        # Double submits and regenerations of a question share one retrieval and LLM call.
+        key = await loop.run_in_executor(executor, answer_key, chat_id, message_content)
+        bot_response, sources = await singleflight.do(key, answer)
+        status = 200
+    except LLMUnavailableError as e:
+        logger.error(f"LLM unavailable for chat {chat_id}: {e}")
+        return JSONResponse(
+            {'error': 'The assistant is temporarily unavailable, please retry shortly'},
+            status_code=503,
+            headers={'Retry-After': str(max(1, math.ceil(e.retry_after)))}
+        )
+    except Exception as e:
+        logger.error(f"Error generating bot response: {e}")
+        bot_response = "Sorry, I couldn't process your request at this time."
+        sources = []
+        status = 500
+    bot_message_id, bot_timestamp = str(uuid.uuid4()), timestamp
+    if status == 200:
+        bot_timestamp = await store_bot_response(chat_id, bot_response, bot_message_id) or timestamp
+    await redis_client.delete_cache(f"messages:chat:{chat_id}")
+    return JSONResponse({
+        'user_message': {
+            'id': message_id,
+            'content': message_content,
+            'sender': 'user',
+            'timestamp': timestamp
+        },
+        'bot_response': {
+            'id': bot_message_id,
+            'content': bot_response,
+            'sender': 'bot',
+            'timestamp': bot_timestamp,
+            'sources': sources
+        }
+    }, status_code=status)
+
+async def store_bot_response(chat_id, bot_response, bot_message_id):
+    """Store a streamed bot response and drop the chat's message cache."""
+    try:
+        _, bot_timestamp = await async_database.create_message(chat_id, bot_response, 'bot', bot_message_id)
+        await redis_client.delete_cache(f"messages:chat:{chat_id}")
+        await asyncio.get_running_loop().run_in_executor(executor, record_message, chat_id, bot_message_id, 'bot', bot_response)
+        return bot_timestamp
+    except Exception as e:
+        logger.error(f"Error storing bot response for chat {chat_id}: {e}")
+        return None
+
+async def stream_message(request):
+    user, error = authenticate(request)
+    if error:
+        return error
+    current_user_id, _ = user
+    error = await rate_limit(current_user_id, 'stream_message', 20)
+    if error:
+        return error
+    chat_id = request.path_params['chat_id']
+    message_content = await read_message(request)
+    if not message_content:
+        logger.warning(f"Message stream attempt by {current_user_id} with no content")
+        return JSONResponse({'error': 'Message content is required'}, status_code=400)
+    priority, error = read_priority(request)
+    if error:
+        return error
+    try:
+        if not await async_database.chat_belongs_to_user(chat_id, current_user_id):
+            logger.warning(f"Chat {chat_id} not found or access denied for {current_user_id}")
+            return JSONResponse({'error': 'Chat not found or access denied'}, status_code=404)
+    except Exception as e:
+        logger.error(f"Error checking chat {chat_id}: {e}")
+        return JSONResponse({'error': 'Database error'}, status_code=500)
+    ticket, error = await admit(current_user_id, priority)
+    if error:
+        return error
+    try:
+        message_id, timestamp = await async_database.create_message(chat_id, message_content, 'user')
+    except Exception as e:
+        ticket.release()
+        logger.error(f"Error storing message for chat {chat_id}: {e}")
+        return JSONResponse({'error': 'Failed to store message'}, status_code=500)
+    await redis_client.delete_cache(f"messages:chat:{chat_id}")
+    bot_message_id = str(uuid.uuid4())
+
+    async def generate():
+        parts = []
+        failed = False
+        started = time.monotonic()
+        first_token_at = None
+        try:
+            yield sse_event('start', {
+                'user_message': {
+                    'id': message_id,
+                    'content': message_content,
+                    'sender': 'user',
+                    'timestamp': timestamp
+                },
+                'bot_message_id': bot_message_id
+            })
+            loop = asyncio.get_running_loop()
+            history = await loop.run_in_executor(executor, begin_turn, chat_id, message_id, message_content)
+            retrieval_query = await rag_system.astandalone_query(message_content, history)
+            generation, cached = await loop.run_in_executor(executor, lookup_answer, chat_id, retrieval_query)
+            if cached:
+                yield sse_event('sources', {'sources': cached['sources']})
+                parts.append(cached['answer'])
+                yield sse_event('token', {'text': cached['answer']})
+            else:
+                sources, tokens = await rag_system.astream_answer(message_content, chat_id=chat_id, executor=executor, history=history, retrieval_query=retrieval_query)
+                sources = format_sources(sources)
+                yield sse_event('sources', {'sources': sources})
+                async for token in tokens:
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                        logger.info(f"Time to first token for chat {chat_id}: {first_token_at - started:.3f}s")
+                    parts.append(token)
+                    yield sse_event('token', {'text': token})
+                await loop.run_in_executor(executor, store_answer, chat_id, generation, retrieval_query, ''.join(parts), sources)
+        except Exception as e:
+            logger.error(f"Error streaming bot response: {e}")
+            failed = True
+            error = "The response was interrupted." if parts else "Sorry, I couldn't process your request at this time."
+            if not parts:
+                parts.append(error)
+            yield sse_event('error', {'error': error})
+        finally:
+            ticket.release()
+            bot_response = ''.join(parts)
+            # Stored in its own task: if the client disconnected, this generator
+            # is being cancelled and could not await the insert itself.
+            store = asyncio.get_running_loop().create_task(store_bot_response(chat_id, bot_response, bot_message_id)) if bot_response else None
+            if store:
+                background_tasks.add(store)
+                store.add_done_callback(background_tasks.discard)
+            logger.info(f"Streamed {len(parts)} fragments for chat {chat_id} in {time.monotonic() - started:.3f}s")
+        if not failed:
+            bot_timestamp = await store if store else None
+            yield sse_event('done', {
+                'bot_response': {
+                    'id': bot_message_id,
+                    'content': bot_response,
+                    'sender': 'bot',
+                    'timestamp': bot_timestamp
+                }
+            })
+
+    # The slot is released when generation ends, or after the response if the stream never started.
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    }, background=BackgroundTask(ticket.release))
+
+@asynccontextmanager
+async def lifespan(_):
+    await async_database.init_pool()
+    try:
+        yield
+    finally:
+        await async_database.close_pool()
+        await redis_client.close()
+        executor.shutdown(wait=False)
+
+app = Starlette(
+    routes=[
+        Route('/api/chats', get_chats, methods=['GET']),
+        Route('/api/documents', get_documents, methods=['GET']),
+        Route('/api/chats/{chat_id}/messages', messages, methods=['GET', 'POST']),
+        Route('/api/chats/{chat_id}/messages/stream', stream_message, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from Configuration import config
+
+logger = logging.getLogger(__name__)
+
+# Waiting interactive requests are always admitted before waiting bulk ones.
+PRIORITIES = ('interactive', 'bulk')
+
+class AdmissionRejected(Exception):
+    def __init__(self, message, status, retry_after):
+        """A request turned away: 429 when its tenant is over its share, 503 when the server is saturated."""
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class Ticket:
+    def __init__(self, controller, tenant, priority):
+        """A slot held by an admitted request; release it exactly once, extra calls are ignored."""
+        self.controller = controller
+        self.tenant = tenant
+        self.priority = priority
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        """Give the slot back to the next waiting request."""
+        self.controller._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class _Waiter:
+    def __init__(self, tenant, priority, loop=None):
+        """A queued request, woken through an Event for threads or a future for asyncio."""
+        self.tenant = tenant
+        self.priority = priority
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.enqueued = time.monotonic()
+        self.outcome = None
+
+    def wake(self):
+        """Tell the waiter its outcome, a Ticket or AdmissionRejected, has been decided."""
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+class AdmissionController:
+    def __init__(self, max_concurrent=None, max_queue=None, tenant_share=None, max_wait=None):
+        """
+        Bound how many LLM-bound requests run at once and how many wait.
+
+        At most `max_concurrent` requests hold a slot; up to `max_queue` more
+        wait for one, for at most `max_wait` seconds. Freed slots go to waiting
+        interactive requests before bulk ones, and within a class tenants take
+        turns, preferring tenants holding fewer than their share of slots. A
+        tenant may occupy at most `tenant_share` of the queue (429), a full
+        queue sheds its newest bulk request for an interactive one or rejects
+        the newcomer (503), and every rejection carries a Retry-After estimated
+        from the queue length and recent service times. The limits are per
+        process; one controller serves both the WSGI and the asyncio paths.
+        """
+        self.max_concurrent = max_concurrent or config.ADMISSION_MAX_CONCURRENT
+        self.max_queue = config.ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        tenant_share = tenant_share or config.ADMISSION_TENANT_SHARE
+        self.max_wait = max_wait or config.ADMISSION_MAX_WAIT
+        self.tenant_slots = max(1, math.ceil(self.max_concurrent * tenant_share))
+        self.tenant_queue = max(1, math.ceil(self.max_queue * tenant_share))
+        self._lock = threading.Lock()
+        self._running = {}
+        # Per class, tenants in turn order, each with its waiters oldest first.
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._queued = 0
+        self._tenant_queued = {}
+        self._service_time = 1.0
+        self._counts = {'admitted': 0, 'enqueued': 0, 'shed': 0, 'rejected_tenant': 0, 'rejected_full': 0, 'timed_out': 0}
+        self._waited = 0
+        self._wait_total = 0.0
+
+    def _retry_after(self, waiting, slots):
+        """Seconds until `waiting` requests ahead would have drained through `slots` slots."""
+        return max(1, math.ceil((waiting + 1) * self._service_time / slots))
+
+    def _grant(self, tenant, priority):
+        """Take a slot for a tenant; the caller holds the lock."""
+        self._running[tenant] = self._running.get(tenant, 0) + 1
+        self._counts['admitted'] += 1
+        return Ticket(self, tenant, priority)
+
+    def _remove(self, waiter):
+        """Drop a waiter from its queue; the caller holds the lock."""
+        tenants = self._queues[waiter.priority]
+        waiters = tenants.get(waiter.tenant)
+        if waiters is None or waiter not in waiters:
+            return False
+        waiters.remove(waiter)
+        if not waiters:
+            del tenants[waiter.tenant]
+        self._queued -= 1
+        self._tenant_queued[waiter.tenant] -= 1
+        if not self._tenant_queued[waiter.tenant]:
+            del self._tenant_queued[waiter.tenant]
+        return True
+
+    def _next(self):
+        """Pop the waiter that gets the next free slot; the caller holds the lock."""
+        for priority in PRIORITIES:
+            tenants = self._queues[priority]
+            if not tenants:
+                continue
+            tenant = next((t for t in tenants if self._running.get(t, 0) < self.tenant_slots), None)
+            if tenant is None:
+                tenant = next(iter(tenants))
+            waiter = tenants[tenant][0]
+            self._remove(waiter)
+            if tenant in tenants:
+                tenants.move_to_end(tenant)
+            return waiter
+        return None
+
+    def _enqueue(self, tenant, priority, loop=None):
+        """Admit a request, queue it, or raise AdmissionRejected; returns a Ticket or a _Waiter."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {', '.join(PRIORITIES)}")
+        shed = None
+        with self._lock:
+            if sum(self._running.values()) < self.max_concurrent and not self._queued:
+                return self._grant(tenant, priority)
+            tenant_queued = self._tenant_queued.get(tenant, 0)
+            if tenant_queued >= self.tenant_queue:
+                self._counts['rejected_tenant'] += 1
+                raise AdmissionRejected('Too many requests in progress, please retry shortly', 429,
+                                        self._retry_after(tenant_queued, self.tenant_slots))
+            if self._queued >= self.max_queue:
+                bulk = self._queues['bulk']
+                if priority == 'bulk' or not bulk:
+                    self._counts['rejected_full'] += 1
+                    raise AdmissionRejected('The assistant is busy, please retry shortly', 503,
+                                            self._retry_after(self._queued, self.max_concurrent))
+                # Interactive traffic displaces the most recently queued bulk request.
+                shed = max((waiters[-1] for waiters in bulk.values()), key=lambda w: w.enqueued)
+                self._remove(shed)
+                self._counts['shed'] += 1
+                shed.outcome = AdmissionRejected('The assistant is busy, please retry shortly', 503,
+                                                 self._retry_after(self._queued, self.max_concurrent))
+            waiter = _Waiter(tenant, priority, loop)
+            self._queues[priority].setdefault(tenant, deque()).append(waiter)
+            self._queued += 1
+            self._tenant_queued[tenant] = tenant_queued + 1
+            self._counts['enqueued'] += 1
+        if shed is not None:
+            logger.warning(f"Shed a queued bulk request of tenant {shed.tenant} for an interactive one")
+            shed.wake()
+        return waiter
+
+    def _settle(self, waiter):
+        """Return the waiter's Ticket, or raise why it was not admitted."""
+        with self._lock:
+            if waiter.outcome is None:
+                self._remove(waiter)
+                self._counts['timed_out'] += 1
+                waiter.outcome = AdmissionRejected('The assistant is busy, please retry shortly', 503,
+                                                   self._retry_after(self._queued, self.max_concurrent))
+            elif isinstance(waiter.outcome, Ticket):
+                self._waited += 1
+                self._wait_total += waiter.outcome.started - waiter.enqueued
+        if isinstance(waiter.outcome, AdmissionRejected):
+            raise waiter.outcome
+        return waiter.outcome
+
+    def _abandon(self, waiter):
+        """Withdraw a waiter whose caller went away, giving back a slot it was handed meanwhile."""
+        with self._lock:
+            if waiter.outcome is None:
+                self._remove(waiter)
+                return
+        if isinstance(waiter.outcome, Ticket):
+            waiter.outcome.release()
+
+    def _release(self, ticket):
+        """Return a slot and pass it to the next waiter."""
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._running[ticket.tenant] -= 1
+            if not self._running[ticket.tenant]:
+                del self._running[ticket.tenant]
+            # Exponentially weighted, so Retry-After follows the current LLM latency.
+            self._service_time = 0.9 * self._service_time + 0.1 * (time.monotonic() - ticket.started)
+            waiter = self._next()
+            if waiter is not None:
+                waiter.outcome = self._grant(waiter.tenant, waiter.priority)
+        if waiter is not None:
+            waiter.wake()
+
+    def acquire(self, tenant, priority='interactive'):
+        """Block until the request holds a slot and return its Ticket, or raise AdmissionRejected."""
+        waiter = self._enqueue(tenant, priority)
+        if isinstance(waiter, Ticket):
+            return waiter
+        waiter.event.wait(self.max_wait)
+        return self._settle(waiter)
+
+    async def aacquire(self, tenant, priority='interactive'):
+        """Await a slot and return its Ticket, or raise AdmissionRejected."""
+        waiter = self._enqueue(tenant, priority, asyncio.get_running_loop())
+        if isinstance(waiter, Ticket):
+            return waiter
+        try:
+            await asyncio.wait_for(waiter.future, self.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        return self._settle(waiter)
+
+    def stats(self):
+        """Slots in use, queue depth per class and admission counters."""
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'running': sum(self._running.values()),
+                'queued': {priority: sum(map(len, self._queues[priority].values())) for priority in PRIORITIES},
+                'service_time': round(self._service_time, 3),
+                'mean_wait': round(self._wait_total / self._waited, 3) if self._waited else 0.0,
+                **self._counts
+            }
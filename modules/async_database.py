@@ -0,0 +1,97 @@
+import logging
+import uuid
+from datetime import datetime
+import asyncpg
+from Configuration import config
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+pool = None
+
+async def init_pool():
+    """Create the asyncpg connection pool used by the ASGI endpoints."""
+    global pool
+    if pool is None:
+        pool = await asyncpg.create_pool(
+            user=config.DB_USER,
+            password=config.DB_PASSWORD,
+            database=config.DB_NAME,
+            host=config.DB_HOST,
+            port=int(config.DB_PORT),
+            min_size=1,
+            max_size=config.ASYNC_DB_POOL_SIZE
+        )
+        logger.info("Async PostgreSQL connection pool initialized successfully")
+    return pool
+
+async def close_pool():
+    """Close the asyncpg connection pool."""
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+def format_timestamp(value, fmt='%Y-%m-%d %H:%M:%S'):
+    """Format a TIMESTAMPTZ value in local time, like the psycopg2 endpoints."""
+    return value.astimezone().strftime(fmt)
+
+async def get_chats(user_id):
+    """Retrieve all chats for a user."""
+    try:
+        rows = await pool.fetch('''
+            SELECT id, title, created_at
+            FROM chats
+            WHERE user_id = $1
+            ORDER BY created_at DESC
+        ''', user_id)
+        return [{'id': str(row['id']), 'title': row['title'], 'created_at': format_timestamp(row['created_at'])} for row in rows]
+    except (asyncpg.PostgresError, asyncpg.DataError) as e:
+        logger.error(f"Error retrieving chats for user {user_id}: {str(e)}")
+        return []
+
+async def chat_belongs_to_user(chat_id, user_id):
+    """Check that a chat exists and is owned by a user."""
+    try:
+        row = await pool.fetchrow('SELECT id FROM chats WHERE id = $1 AND user_id = $2', chat_id, user_id)
+        return row is not None
+    except asyncpg.DataError:
+        return False
+
+async def create_message(chat_id, content, sender, message_id=None, timestamp=None):
+    """Store a chat message and return its id and timestamp."""
+    message_id = message_id or str(uuid.uuid4())
+    timestamp = timestamp or datetime.now().astimezone().replace(microsecond=0)
+    try:
+        await pool.execute('''
+            INSERT INTO messages (id, chat_id, content, sender, timestamp)
+            VALUES ($1, $2, $3, $4, $5)
+        ''', message_id, chat_id, content, sender, timestamp)
+        return message_id, format_timestamp(timestamp)
+    except asyncpg.PostgresError as e:
+        logger.error(f"Error storing {sender} message for chat {chat_id}: {str(e)}")
+        raise
+
+async def get_messages(chat_id):
+    """Retrieve the messages of a chat in order."""
+    rows = await pool.fetch('''
+        SELECT id, content, sender, timestamp
+        FROM messages
+        WHERE chat_id = $1
+        ORDER BY timestamp
+    ''', chat_id)
+    return [{
+        'id': str(row['id']),
+        'content': row['content'],
+        'sender': row['sender'],
+        'timestamp': format_timestamp(row['timestamp'])
+    } for row in rows]
+
+async def get_documents(chat_id):
+    """Retrieve the documents of a chat with their indexing status."""
+    return await pool.fetch('''
+        SELECT id, filename, size, upload_date, extension, status, progress_done, progress_total
+        FROM documents
+        WHERE chat_id = $1
+        ORDER BY upload_date DESC
+    ''', chat_id)
@@ -22,9 +22,9 @@ DB_CONFIG = {
     'port': config.DB_PORT
 }
 
-# Initialize connection pool
+# Initialize connection pool; request threads share it, so it must be the thread-safe kind
 try:
-    connection_pool = psycopg2.pool.SimpleConnectionPool(1, 20, **DB_CONFIG)
+    connection_pool = psycopg2.pool.ThreadedConnectionPool(1, config.DB_POOL_SIZE, **DB_CONFIG)
     logger.info("PostgreSQL connection pool initialized successfully")
 except psycopg2.Error as e:
     logger.error(f"Failed to initialize PostgreSQL connection pool: {str(e)}")
@@ -82,10 +82,24 @@ def init_db():
                 upload_date TIMESTAMPTZ NOT NULL,
                 extension TEXT NOT NULL,
                 chat_id UUID NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                progress_done INTEGER NOT NULL DEFAULT 0,
+                progress_total INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
                 FOREIGN KEY (chat_id) REFERENCES chats (id) ON DELETE CASCADE ON UPDATE CASCADE
             )
         ''')
 
+        # Add indexing state columns to documents tables created before they existed
+        c.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'indexed'")
+        c.execute('ALTER TABLE documents ADD COLUMN IF NOT EXISTS progress_done INTEGER NOT NULL DEFAULT 0')
+        c.execute('ALTER TABLE documents ADD COLUMN IF NOT EXISTS progress_total INTEGER NOT NULL DEFAULT 0')
+        c.execute('ALTER TABLE documents ADD COLUMN IF NOT EXISTS error TEXT')
+
+        # Running summary of the messages that left a chat's history window
+        c.execute("ALTER TABLE chats ADD COLUMN IF NOT EXISTS summary TEXT NOT NULL DEFAULT ''")
+        c.execute('ALTER TABLE chats ADD COLUMN IF NOT EXISTS summarized_count INTEGER NOT NULL DEFAULT 0')
+
         # Create otps table
         c.execute('''
             CREATE TABLE IF NOT EXISTS otps (
@@ -102,6 +116,7 @@ def init_db():
         c.execute('CREATE INDEX IF NOT EXISTS idx_chats_user_id ON chats (user_id)')
         c.execute('CREATE INDEX IF NOT EXISTS idx_documents_chat_id ON documents (chat_id)')
         c.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages (chat_id)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_id_timestamp ON messages (chat_id, timestamp)')
 
         logger.info("Database initialized successfully")
         return True
@@ -187,6 +202,112 @@ def create_chat_db(user_id, title):
         if conn:
             connection_pool.putconn(conn)
 
+def chat_belongs_to_user(chat_id, user_id):
+    """Check that a chat exists and is owned by a user."""
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute('SELECT id FROM chats WHERE id = %s AND user_id = %s', (chat_id, user_id))
+        return c.fetchone() is not None
+    finally:
+        if conn:
+            connection_pool.putconn(conn)
+
+def create_message(chat_id, content, sender, message_id=None, timestamp=None):
+    """Store a chat message and return its id and timestamp."""
+    message_id = message_id or str(uuid.uuid4())
+    timestamp = timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute('''
+            INSERT INTO messages (id, chat_id, content, sender, timestamp)
+            VALUES (%s, %s, %s, %s, %s)
+        ''', (message_id, chat_id, content, sender, timestamp))
+        conn.commit()
+        return message_id, timestamp
+    except psycopg2.Error as e:
+        logger.error(f"Error storing {sender} message for chat {chat_id}: {str(e)}")
+        raise
+    finally:
+        if conn:
+            connection_pool.putconn(conn)
+
+# Conversation order; a question and its answer may share a timestamp, the question comes first.
+MESSAGE_ORDER = "timestamp, sender <> 'user', id"
+
+def get_chat_history(chat_id, limit):
+    """Retrieve a chat's running summary and its last messages not yet summarized, oldest first."""
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute('SELECT summary, summarized_count FROM chats WHERE id = %s', (chat_id,))
+        chat = c.fetchone()
+        if not chat:
+            return {'summary': '', 'messages': []}
+        c.execute(f'''
+            SELECT id, sender, content FROM (
+                SELECT id, sender, content, ROW_NUMBER() OVER (ORDER BY {MESSAGE_ORDER}) AS position
+                FROM messages
+                WHERE chat_id = %s
+            ) numbered
+            WHERE position > %s
+            ORDER BY position DESC
+            LIMIT %s
+        ''', (chat_id, chat[1], limit))
+        messages = [{'id': str(row[0]), 'sender': row[1], 'content': row[2]} for row in reversed(c.fetchall())]
+        return {'summary': chat[0], 'messages': messages}
+    except psycopg2.Error as e:
+        logger.error(f"Error retrieving history of chat {chat_id}: {str(e)}")
+        return {'summary': '', 'messages': []}
+    finally:
+        if conn:
+            connection_pool.putconn(conn)
+
+def get_unsummarized_messages(chat_id):
+    """Retrieve a chat's summary, the number of messages it covers and the messages after them."""
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute('SELECT summary, summarized_count FROM chats WHERE id = %s', (chat_id,))
+        chat = c.fetchone()
+        if not chat:
+            return '', 0, []
+        c.execute(f'''
+            SELECT id, sender, content
+            FROM messages
+            WHERE chat_id = %s
+            ORDER BY {MESSAGE_ORDER}
+            OFFSET %s
+        ''', (chat_id, chat[1]))
+        messages = [{'id': str(row[0]), 'sender': row[1], 'content': row[2]} for row in c.fetchall()]
+        return chat[0], chat[1], messages
+    except psycopg2.Error as e:
+        logger.error(f"Error retrieving unsummarized messages of chat {chat_id}: {str(e)}")
+        return '', 0, []
+    finally:
+        if conn:
+            connection_pool.putconn(conn)
+
+def update_chat_summary(chat_id, summary, summarized_count, previous_count):
+    """Store a chat's new running summary unless another worker updated it first."""
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute('''
+            UPDATE chats
+            SET summary = %s, summarized_count = %s
+            WHERE id = %s AND summarized_count = %s
+        ''', (summary, summarized_count, chat_id, previous_count))
+        conn.commit()
+        return c.rowcount == 1
+    except psycopg2.Error as e:
+        logger.error(f"Error updating summary of chat {chat_id}: {str(e)}")
+        return False
+    finally:
+        if conn:
+            connection_pool.putconn(conn)
+
 def get_chats_db(user_id):
     """Retrieve all chats for a user."""
     conn = get_db_connection()
@@ -238,6 +359,58 @@ def delete_chat_db(chat_id, user_id):
         if conn:
             connection_pool.putconn(conn)
 
+def update_document_status(doc_id, status, done=None, total=None, error=None):
+    """Record the indexing stage and progress of a document."""
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute('''
+            UPDATE documents
+            SET status = %s,
+                progress_done = COALESCE(%s, progress_done),
+                progress_total = COALESCE(%s, progress_total),
+                error = %s
+            WHERE id = %s
+            RETURNING chat_id
+        ''', (status, done, total, error, doc_id))
+        result = c.fetchone()
+        conn.commit()
+        logger.info(f"Document {doc_id} status: {status} ({done}/{total})")
+        return result[0] if result else None
+    except psycopg2.Error as e:
+        logger.error(f"Error updating status of document {doc_id}: {str(e)}")
+        return None
+    finally:
+        if conn:
+            connection_pool.putconn(conn)
+
+def get_document_status(doc_id, user_id):
+    """Retrieve the indexing stage and progress of a user's document."""
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute('''
+            SELECT d.id, d.status, d.progress_done, d.progress_total, d.error
+            FROM documents d
+            JOIN chats ch ON ch.id = d.chat_id
+            WHERE d.id = %s AND ch.user_id = %s
+        ''', (doc_id, user_id))
+        document = c.fetchone()
+        if document:
+            return {
+                'id': document[0],
+                'status': document[1],
+                'progress': {'done': document[2], 'total': document[3]},
+                'error': document[4]
+            }
+        return None
+    except psycopg2.Error as e:
+        logger.error(f"Error retrieving status of document {doc_id}: {str(e)}")
+        return None
+    finally:
+        if conn:
+            connection_pool.putconn(conn)
+
 def send_otp(email, phone, otp):
     """Store OTP in database."""
     conn = get_db_connection()
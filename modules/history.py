@@ -0,0 +1,83 @@
+import json
+import logging
+import redis
+from Configuration import config
+from modules.database import get_chat_history
+
+logger = logging.getLogger(__name__)
+
+class ChatHistory:
+    def __init__(self, redis_client, window=None, ttl=None):
+        """
+        Keep the last messages and the running summary of each chat in Redis.
+
+        A chat's window is a Redis list of its last `window` messages not yet
+        folded into the summary, next to a string holding the summary. The
+        summary key doubles as the marker that the window is complete:
+        messages are only appended to a warm window, and a cold one is loaded
+        from the messages table on the next read, so the cache never shows a
+        partial history. Both keys expire after `ttl` seconds without use.
+        """
+        self.client = redis_client.client
+        # Messages wait for the summarizer in batches, so the window holds a batch more than the prompt shows.
+        self.window = window or config.HISTORY_WINDOW + config.HISTORY_SUMMARY_BATCH
+        self.ttl = ttl or config.HISTORY_CACHE_TTL
+
+    def _keys(self, chat_id):
+        """Redis keys of a chat's message window and summary."""
+        return f"history:chat:{chat_id}:messages", f"history:chat:{chat_id}:summary"
+
+    def load(self, chat_id):
+        """Return {'summary', 'messages'} of a chat, messages oldest first."""
+        messages_key, summary_key = self._keys(chat_id)
+        try:
+            pipe = self.client.pipeline()
+            pipe.get(summary_key)
+            pipe.lrange(messages_key, 0, -1)
+            summary, messages = pipe.execute()
+            if summary is not None:
+                seen = set()
+                history = []
+                for message in map(json.loads, messages):
+                    if message['id'] not in seen:
+                        seen.add(message['id'])
+                        history.append(message)
+                return {'summary': summary, 'messages': history[-self.window:]}
+        except redis.RedisError as e:
+            logger.error(f"Error reading history cache for chat {chat_id}: {str(e)}")
+            return get_chat_history(chat_id, self.window)
+
+        history = get_chat_history(chat_id, self.window)
+        try:
+            pipe = self.client.pipeline()
+            pipe.delete(messages_key)
+            if history['messages']:
+                pipe.rpush(messages_key, *[json.dumps(message) for message in history['messages']])
+                pipe.expire(messages_key, self.ttl)
+            pipe.set(summary_key, history['summary'], ex=self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error writing history cache for chat {chat_id}: {str(e)}")
+        return history
+
+    def append(self, chat_id, message_id, sender, content):
+        """Add a stored message to a chat's cached window, if the window is cached."""
+        messages_key, summary_key = self._keys(chat_id)
+        try:
+            if not self.client.expire(summary_key, self.ttl):
+                return
+            pipe = self.client.pipeline()
+            pipe.rpush(messages_key, json.dumps({'id': str(message_id), 'sender': sender, 'content': content}))
+            pipe.ltrim(messages_key, -self.window, -1)
+            pipe.expire(messages_key, self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error appending to history cache for chat {chat_id}: {str(e)}")
+            self.invalidate(chat_id)
+
+    def invalidate(self, chat_id):
+        """Drop the cached history of a chat."""
+        try:
+            self.client.delete(*self._keys(chat_id))
+        except redis.RedisError as e:
+            logger.error(f"Error invalidating history cache for chat {chat_id}: {str(e)}")
@@ -1,6 +1,8 @@
 import redis
+import redis.asyncio
 import json
 import os
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -39,4 +41,59 @@ class RedisClient:
             self.client.delete(key)
             logger.debug(f"Cache deleted for key: {key}")
         except redis.RedisError as e:
-            logger.error(f"Error deleting cache for key {key}: {str(e)}")
\ No newline at end of file
+            logger.error(f"Error deleting cache for key {key}: {str(e)}")
+
+class AsyncRedisClient:
+    def __init__(self):
+        """Initialize an asyncio Redis client with connection pooling."""
+        redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+        self.client = redis.asyncio.Redis.from_url(redis_url, decode_responses=True)
+
+    async def set_cache(self, key, value, expire=3600):
+        """Set cache with TTL (default 1 hour)."""
+        try:
+            await self.client.setex(key, expire, json.dumps(value))
+            logger.debug(f"Cache set for key: {key}")
+        except redis.RedisError as e:
+            logger.error(f"Error setting cache for key {key}: {str(e)}")
+
+    async def get_cache(self, key):
+        """Retrieve cache value."""
+        try:
+            value = await self.client.get(key)
+            if value:
+                logger.debug(f"Cache hit for key: {key}")
+                return json.loads(value)
+            logger.debug(f"Cache miss for key: {key}")
+            return None
+        except redis.RedisError as e:
+            logger.error(f"Error getting cache for key {key}: {str(e)}")
+            return None
+
+    async def delete_cache(self, key):
+        """Delete cache value."""
+        try:
+            await self.client.delete(key)
+            logger.debug(f"Cache deleted for key: {key}")
+        except redis.RedisError as e:
+            logger.error(f"Error deleting cache for key {key}: {str(e)}")
+
+    async def hit_rate_limit(self, key, limit, period=60):
+        """Count a hit in the current `period`-second window; return (allowed, seconds until the window resets)."""
+        now = time.time()
+        window_key = f"ratelimit:{key}:{int(now // period)}"
+        retry_after = max(1, int(period - now % period))
+        try:
+            pipe = self.client.pipeline()
+            pipe.incr(window_key)
+            pipe.expire(window_key, period)
+            hits, _ = await pipe.execute()
+            return hits <= limit, retry_after
+        except redis.RedisError as e:
+            # Like the Flask limiter's storage errors, an unreachable Redis does not take the API down.
+            logger.error(f"Error checking rate limit {key}: {str(e)}")
+            return True, retry_after
+
+    async def close(self):
+        """Close the connection pool."""
+        await self.client.aclose()
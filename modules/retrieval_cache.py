@@ -0,0 +1,45 @@
+import hashlib
+import json
+import logging
+import redis
+from Configuration import config
+
+logger = logging.getLogger(__name__)
+
+class RetrievalCache:
+    def __init__(self, redis_client, ttl=None):
+        """
+        Share FAISS search results between workers through Redis.
+
+        Results are stored as (chunk ID, score) pairs under a key made of the
+        chat ID, the generation of its index, k and a hash of the query. Every
+        write to a chat's shard changes its generation, and a shard deleted and
+        rebuilt gets a new incarnation, so a change to one chat invalidates
+        exactly that chat's results; old keys expire after `ttl` seconds.
+        """
+        self.client = redis_client.client
+        self.ttl = ttl or config.RETRIEVAL_CACHE_TTL
+
+    def _key(self, chat_id, generation, query, k):
+        """Redis key of a search."""
+        digest = hashlib.sha256(query.encode("utf-8")).hexdigest()
+        return f"retrieval:cosine:{chat_id}:{generation}:{k}:{digest}"
+
+    def get(self, chat_id, generation, query, k):
+        """Return the cached [(chunk_id, score)] of a search, or None."""
+        try:
+            value = self.client.get(self._key(chat_id, generation, query, k))
+        except redis.RedisError as e:
+            logger.error(f"Error reading retrieval cache for chat {chat_id}: {str(e)}")
+            return None
+        if value is None:
+            return None
+        return [(int(chunk_id), float(score)) for chunk_id, score in json.loads(value)]
+
+    def set(self, chat_id, generation, query, k, results):
+        """Cache the [(chunk_id, score)] of a search."""
+        try:
+            payload = json.dumps([[int(chunk_id), float(score)] for chunk_id, score in results])
+            self.client.setex(self._key(chat_id, generation, query, k), self.ttl, payload)
+        except redis.RedisError as e:
+            logger.error(f"Error writing retrieval cache for chat {chat_id}: {str(e)}")
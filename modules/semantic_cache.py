@@ -0,0 +1,132 @@
+import base64
+import json
+import logging
+import time
+import uuid
+import numpy as np
+import redis
+from Configuration import config
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    def __init__(self, redis_client, embeddings, threshold=None, ttl=None, max_entries=None):
+        """
+        Cache answers per (chat, document-set version) and serve them for near-identical questions.
+
+        Entries of a chat live in a Redis hash keyed by chat ID, invalidation
+        epoch and shard generation, with a sorted set of last-use times for LRU
+        eviction. A lookup embeds the question and returns the stored answer of
+        the most similar cached question if its cosine similarity reaches
+        `threshold`. Any write to the chat's index bumps the generation, and
+        `invalidate` bumps the epoch, so stale answers are never served; old
+        keys simply expire after `ttl` seconds.
+        """
+        self.client = redis_client.client
+        self.embeddings = embeddings
+        self.threshold = threshold if threshold is not None else config.SEMANTIC_CACHE_THRESHOLD
+        self.ttl = ttl or config.SEMANTIC_CACHE_TTL
+        self.max_entries = max_entries or config.SEMANTIC_CACHE_MAX_ENTRIES
+
+    def _key(self, chat_id, generation):
+        """Hash key holding the entries of a chat at a document-set version."""
+        epoch = self.client.get(f"semcache:{chat_id}:epoch") or 0
+        return f"semcache:{chat_id}:{epoch}:{generation}"
+
+    def _embed(self, query):
+        """Unit-length query vector."""
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _count(self, field):
+        """Increment a hit/miss counter."""
+        try:
+            self.client.hincrby("semcache:stats", field, 1)
+        except redis.RedisError as e:
+            logger.error(f"Error updating semantic cache stats: {str(e)}")
+
+    def lookup(self, chat_id, generation, query):
+        """Return the cached {'answer', 'sources', 'query', 'similarity'} of a similar question, or None."""
+        try:
+            key = self._key(chat_id, generation)
+            entries = self.client.hgetall(key)
+            if not entries:
+                self._count("misses")
+                return None
+            vector = self._embed(query)
+            ids = list(entries)
+            records = [json.loads(entries[entry_id]) for entry_id in ids]
+            matrix = np.stack([np.frombuffer(base64.b64decode(record["vector"]), dtype=np.float32) for record in records])
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self._count("misses")
+                return None
+            self.client.zadd(f"{key}:lru", {ids[best]: time.time()})
+            self._count("hits")
+            logger.info(f"Semantic cache hit for chat {chat_id} (similarity {similarities[best]:.3f})")
+            record = records[best]
+            return {
+                'answer': record["answer"],
+                'sources': record["sources"],
+                'query': record["query"],
+                'similarity': float(similarities[best])
+            }
+        except redis.RedisError as e:
+            logger.error(f"Error reading semantic cache for chat {chat_id}: {str(e)}")
+            return None
+
+    def store(self, chat_id, generation, query, answer, sources):
+        """Cache an answer and its formatted sources, evicting the least recently used entries."""
+        try:
+            key = self._key(chat_id, generation)
+            entry_id = uuid.uuid4().hex
+            record = {
+                "query": query,
+                "vector": base64.b64encode(self._embed(query).tobytes()).decode("ascii"),
+                "answer": answer,
+                "sources": sources
+            }
+            pipe = self.client.pipeline()
+            pipe.hset(key, entry_id, json.dumps(record))
+            pipe.zadd(f"{key}:lru", {entry_id: time.time()})
+            pipe.expire(key, self.ttl)
+            pipe.expire(f"{key}:lru", self.ttl)
+            pipe.execute()
+
+            excess = self.client.zcard(f"{key}:lru") - self.max_entries
+            if excess > 0:
+                evicted = [entry for entry, _ in self.client.zpopmin(f"{key}:lru", excess)]
+                if evicted:
+                    self.client.hdel(key, *evicted)
+        except redis.RedisError as e:
+            logger.error(f"Error writing semantic cache for chat {chat_id}: {str(e)}")
+
+    def invalidate(self, chat_id):
+        """Drop every cached answer of a chat."""
+        try:
+            # A fresh, never reused epoch; once it expires every entry written under it has expired too.
+            self.client.set(f"semcache:{chat_id}:epoch", time.time_ns(), ex=self.ttl)
+            logger.debug(f"Semantic cache invalidated for chat {chat_id}")
+        except redis.RedisError as e:
+            logger.error(f"Error invalidating semantic cache for chat {chat_id}: {str(e)}")
+
+    def stats(self):
+        """Hit/miss counters shared by all processes."""
+        try:
+            counters = self.client.hgetall("semcache:stats")
+        except redis.RedisError as e:
+            logger.error(f"Error reading semantic cache stats: {str(e)}")
+            counters = {}
+        hits = int(counters.get("hits", 0))
+        misses = int(counters.get("misses", 0))
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+            'threshold': self.threshold,
+            'ttl': self.ttl,
+            'max_entries_per_chat': self.max_entries
+        }
@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+import redis
+from Configuration import config
+
+logger = logging.getLogger(__name__)
+
+# Deletes the lock only if it still holds our token, so a leader whose lock
+# expired cannot release the lock of the worker that took over.
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+MISSING = object()
+
+def flight_key(*parts):
+    """Key of a unit of work from its identifying parts, e.g. chat ID, index generation and question."""
+    normalized = [" ".join(str(part).lower().split()) for part in parts]
+    return hashlib.sha256("\x1f".join(normalized).encode("utf-8")).hexdigest()
+
+def summarize_counts(counts):
+    """Counters of a single-flight group with the share of calls that did not run the work."""
+    counts = dict(counts)
+    shared = counts["local_followers"] + counts["remote_followers"]
+    total = shared + counts["leader"] + counts["fallbacks"]
+    counts["coalesced_ratio"] = shared / total if total else 0.0
+    return counts
+
+class _Flight:
+    def __init__(self):
+        """In-process state of one unit of work shared by its callers."""
+        self.event = threading.Event()
+        self.result = None
+        self.ok = False
+
+class SingleFlight:
+    def __init__(self, redis_client, lock_ttl=None, result_ttl=None, wait_timeout=None, poll_interval=None):
+        """
+        Run identical concurrent work once and hand the result to every caller.
+
+        Within a process, the first caller of a key runs the work and later
+        callers wait on it. Across processes, that caller takes a Redis lock
+        (SET NX with `lock_ttl`): the worker holding it runs the work and
+        stores the JSON result for the others, which poll for it while the lock
+        is held. The result only lives `result_ttl` seconds, enough for those
+        pollers: a call made after the work finished runs it again, so asking
+        again (e.g. regenerating an answer) is never served a stale copy. A
+        caller whose leader fails, or that waits longer than
+        `wait_timeout`, runs the work itself, so coalescing never turns an
+        error or a crashed worker into a hung request.
+        """
+        self.client = redis_client.client
+        self.lock_ttl = lock_ttl or config.SINGLEFLIGHT_LOCK_TTL
+        self.result_ttl = result_ttl or config.SINGLEFLIGHT_RESULT_TTL
+        self.wait_timeout = wait_timeout or config.SINGLEFLIGHT_WAIT_TIMEOUT
+        self.poll_interval = poll_interval or config.SINGLEFLIGHT_POLL_INTERVAL
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._counts = {"leader": 0, "local_followers": 0, "remote_followers": 0, "fallbacks": 0}
+        self._release = self.client.register_script(RELEASE_SCRIPT)
+
+    def _count(self, field):
+        """Increment a counter."""
+        with self._lock:
+            self._counts[field] += 1
+
+    def _poll(self, key):
+        """Wait for another worker's result; MISSING if its lock is gone without one or on timeout."""
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            pipe = self.client.pipeline()
+            pipe.get(f"singleflight:{key}:result")
+            pipe.exists(f"singleflight:{key}:lock")
+            value, locked = pipe.execute()
+            if value is not None:
+                return json.loads(value)
+            if not locked:
+                return MISSING
+            time.sleep(self.poll_interval)
+        return MISSING
+
+    def _run_shared(self, key, fn):
+        """Run the work unless another worker is already running it."""
+        token = uuid.uuid4().hex
+        try:
+            locked = self.client.set(f"singleflight:{key}:lock", token, nx=True, ex=self.lock_ttl)
+            if not locked:
+                result = self._poll(key)
+                if result is not MISSING:
+                    self._count("remote_followers")
+                    return result
+                self._count("fallbacks")
+        except redis.RedisError as e:
+            logger.error(f"Error coordinating work {key[:12]} through Redis: {str(e)}")
+            locked = False
+        if not locked:
+            return fn()
+
+        self._count("leader")
+        try:
+            result = fn()
+            self.client.set(f"singleflight:{key}:result", json.dumps(result), ex=self.result_ttl)
+            return result
+        finally:
+            try:
+                self._release(keys=[f"singleflight:{key}:lock"], args=[token])
+            except redis.RedisError as e:
+                logger.error(f"Error releasing lock of work {key[:12]}: {str(e)}")
+
+    def do(self, key, fn):
+        """Return fn() for a key, sharing one call between concurrent callers; the result must be JSON-serializable."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            self._count("local_followers")
+            if flight.event.wait(self.wait_timeout) and flight.ok:
+                return flight.result
+            self._count("fallbacks")
+            return fn()
+        try:
+            flight.result = self._run_shared(key, fn)
+            flight.ok = True
+            return flight.result
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def stats(self):
+        """How often work was run, or shared with callers in this and other processes."""
+        with self._lock:
+            return summarize_counts(self._counts)
+
+class AsyncSingleFlight:
+    def __init__(self, redis_client, lock_ttl=None, result_ttl=None, wait_timeout=None, poll_interval=None):
+        """SingleFlight for asyncio callers, coordinated through redis.asyncio; see SingleFlight."""
+        self.client = redis_client.client
+        self.lock_ttl = lock_ttl or config.SINGLEFLIGHT_LOCK_TTL
+        self.result_ttl = result_ttl or config.SINGLEFLIGHT_RESULT_TTL
+        self.wait_timeout = wait_timeout or config.SINGLEFLIGHT_WAIT_TIMEOUT
+        self.poll_interval = poll_interval or config.SINGLEFLIGHT_POLL_INTERVAL
+        self._flights = {}
+        self._counts = {"leader": 0, "local_followers": 0, "remote_followers": 0, "fallbacks": 0}
+        self._release = self.client.register_script(RELEASE_SCRIPT)
+
+    async def _poll(self, key):
+        """Wait for another worker's result; MISSING if its lock is gone without one or on timeout."""
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            pipe = self.client.pipeline()
+            pipe.get(f"singleflight:{key}:result")
+            pipe.exists(f"singleflight:{key}:lock")
+            value, locked = await pipe.execute()
+            if value is not None:
+                return json.loads(value)
+            if not locked:
+                return MISSING
+            await asyncio.sleep(self.poll_interval)
+        return MISSING
+
+    async def _run_shared(self, key, fn):
+        """Await the work unless another worker is already running it."""
+        token = uuid.uuid4().hex
+        try:
+            locked = await self.client.set(f"singleflight:{key}:lock", token, nx=True, ex=self.lock_ttl)
+            if not locked:
+                result = await self._poll(key)
+                if result is not MISSING:
+                    self._counts["remote_followers"] += 1
+                    return result
+                self._counts["fallbacks"] += 1
+        except redis.RedisError as e:
+            logger.error(f"Error coordinating work {key[:12]} through Redis: {str(e)}")
+            locked = False
+        if not locked:
+            return await fn()
+
+        self._counts["leader"] += 1
+        try:
+            result = await fn()
+            await self.client.set(f"singleflight:{key}:result", json.dumps(result), ex=self.result_ttl)
+            return result
+        finally:
+            try:
+                await self._release(keys=[f"singleflight:{key}:lock"], args=[token])
+            except redis.RedisError as e:
+                logger.error(f"Error releasing lock of work {key[:12]}: {str(e)}")
+
+    async def do(self, key, fn):
+        """Return await fn() for a key, sharing one call between concurrent callers."""
+        flight = self._flights.get(key)
+        if flight is not None:
+            self._counts["local_followers"] += 1
+            try:
+                # Shielded: a follower that disconnects must not cancel the leader's work.
+                return await asyncio.wait_for(asyncio.shield(flight), self.wait_timeout)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+            except Exception:
+                pass
+            self._counts["fallbacks"] += 1
+            return await fn()
+        flight = self._flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._run_shared(key, fn)
+            flight.set_result(result)
+            return result
+        except Exception as e:
+            flight.set_exception(e)
+            # Followers fall back to running the work; nobody needs to retrieve this exception.
+            flight.exception()
+            raise
+        except BaseException:
+            flight.cancel()
+            raise
+        finally:
+            self._flights.pop(key, None)
+
+    def stats(self):
+        """How often work was run, or shared with callers in this and other processes."""
+        return summarize_counts(self._counts)
@@ -1,19 +1,29 @@
 from celery import Celery
 from Configuration import config
-from modules.database import generate_otp, send_otp
+from modules.database import generate_otp, send_otp, update_document_status, get_unsummarized_messages, update_chat_summary
+from modules.redis_client import RedisClient
+from modules.history import ChatHistory
 from src.indexers import FAISSVectorStore
-from langchain_huggingface import HuggingFaceEmbeddings
+from src.extraction import iter_pages
+from src.embeddings import load_embeddings, embedding_stats
+from src.conversation import ConversationContext
 import os
+import logging
+
+logger = logging.getLogger(__name__)
 
 app = Celery('tasks', broker=os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0'), backend=os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0'))
 
-embeddings = HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL)
+embeddings = load_embeddings()
 vector_store = FAISSVectorStore(
     index_path=config.INDEX_PATH,
     use_semantic_chunking=config.USER_SEMANTIC_CHUNKING,
     chunker=None,  # Will be initialized in task
     embeddings=embeddings
 )
+redis_client = RedisClient()
+chat_history = ChatHistory(redis_client)
+conversation = ConversationContext()
 
 @app.task
 def send_otp_task(email, phone):
@@ -22,9 +32,15 @@ def send_otp_task(email, phone):
     print(otp)
     send_otp(email, phone, otp)
 
+def set_document_status(file_id, chat_id, status, done=None, total=None, error=None):
+    """Record a document's indexing stage and drop the cached document list of its chat."""
+    updated = update_document_status(file_id, status, done=done, total=total, error=error)
+    redis_client.delete_cache(f"documents:chat:{chat_id}")
+    return updated is not None
+
 @app.task
-def index_document_task(file_id, text, chat_id, filename, source):
-    """Index document in vector store asynchronously."""
+def index_document_task(file_id, file_path, extension, chat_id, filename, source):
+    """Extract, chunk, embed and index an uploaded document asynchronously."""
     from src.chunking import RAGChunker
     chunker = RAGChunker(
         chunk_size=config.CHUNK_SIZE,
@@ -34,17 +50,65 @@ def index_document_task(file_id, text, chat_id, filename, source):
     )
     vector_store.chunker = chunker
     try:
-        vector_store.add_documents(
-            texts=[text],
-            metadatas=[{
-                'doc_id': file_id,
-                'chat_id': chat_id,
-                'filename': filename,
-                'source': source
-            }]
+        if not set_document_status(file_id, chat_id, 'extracting'):
+            logger.warning(f"Document {file_id} was deleted before indexing started")
+            return
+
+        pages = {'done': 0, 'total': 0}
+        def track_pages(documents):
+            for page in documents:
+                if not pages['done']:
+                    set_document_status(file_id, chat_id, 'chunking')
+                pages['done'] += 1
+                pages['total'] = page.metadata.get('page_count', 0)
+                yield page
+
+        metadata = {
+            'doc_id': file_id,
+            'chat_id': chat_id,
+            'filename': filename,
+            'source': source
+        }
+        # Progress is counted in pages at every stage; the chunk count is only known at the end.
+        chunk_count = vector_store.add_chunks(
+            chunker.iter_chunks_with_vectors(track_pages(iter_pages(file_path, extension, metadata))),
+            progress=lambda stage, done, total: set_document_status(file_id, chat_id, stage, pages['done'], pages['total'])
         )
+        if not chunk_count:
+            logger.error(f"Failed to extract text from {filename} ({file_id})")
+            set_document_status(file_id, chat_id, 'failed', error='Unable to extract text from file')
+            return
+
+        if not set_document_status(file_id, chat_id, 'indexed', pages['done'], pages['done']):
+            logger.warning(f"Document {file_id} was deleted while indexing, removing its chunks")
+            vector_store.delete_documents([file_id], chat_id=chat_id)
+        logger.info(f"Embedding stats after indexing {file_id}: {embedding_stats(embeddings)}")
     except Exception as e:
-        import logging
-        logger = logging.getLogger(__name__)
         logger.error(f"Error indexing document {file_id}: {str(e)}")
-        raise
\ No newline at end of file
+        # Batches indexed before the failure would otherwise be retrieved for a document shown as failed.
+        try:
+            vector_store.delete_documents([file_id], chat_id=chat_id)
+        except Exception as cleanup_error:
+            logger.error(f"Error removing partial chunks of document {file_id}: {str(cleanup_error)}")
+        set_document_status(file_id, chat_id, 'failed', error=str(e))
+        raise
+
+@app.task
+def summarize_chat_task(chat_id):
+    """Fold the messages that left a chat's history window into its running summary."""
+    summary, summarized_count, messages = get_unsummarized_messages(chat_id)
+    # Summarize in batches rather than on every turn; the newest window stays verbatim.
+    if len(messages) < config.HISTORY_WINDOW + config.HISTORY_SUMMARY_BATCH:
+        return
+    folded = messages[:-config.HISTORY_WINDOW]
+    try:
+        summary = conversation.summarize(summary, folded)
+    except Exception as e:
+        logger.error(f"Error summarizing history of chat {chat_id}: {str(e)}")
+        return
+    if not update_chat_summary(chat_id, summary, summarized_count + len(folded), summarized_count):
+        logger.info(f"History of chat {chat_id} was summarized concurrently, dropping this summary")
+        return
+    # The cached window still holds the folded messages; the next read reloads it.
+    chat_history.invalidate(chat_id)
+    logger.info(f"Folded {len(folded)} messages into the summary of chat {chat_id}")
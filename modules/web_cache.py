@@ -0,0 +1,39 @@
+import hashlib
+import json
+import logging
+import redis
+from Configuration import config
+
+logger = logging.getLogger(__name__)
+
+class WebSearchCache:
+    def __init__(self, redis_client, ttl=None):
+        """
+        Share web search results between workers through Redis.
+
+        Keys are a hash of the normalized query and result count, so every
+        process answers a repeated question without calling the search API
+        again until the entry expires after `ttl` seconds.
+        """
+        self.client = redis_client.client
+        self.ttl = ttl or config.WEB_SEARCH_CACHE_TTL
+
+    def _key(self, key):
+        """Redis key of a search."""
+        return f"websearch:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+    def get(self, key):
+        """Return the cached results of a search, or None."""
+        try:
+            value = self.client.get(self._key(key))
+        except redis.RedisError as e:
+            logger.error(f"Error reading web search cache: {str(e)}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, results):
+        """Cache the results of a search."""
+        try:
+            self.client.setex(self._key(key), self.ttl, json.dumps(results))
+        except redis.RedisError as e:
+            logger.error(f"Error writing web search cache: {str(e)}")
@@ -0,0 +1,288 @@
+from typing import Optional, List, Dict
+from Configuration import config
+import numpy as np
+import argparse
+import logging
+import faiss
+import math
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# Vectors are unit-length and compared by inner product, i.e. cosine similarity.
+METRIC = "ip"
+TEMPLATE_FILE = "trained.faiss"
+# FAISS wants at least this many training points per IVF centroid or PQ code.
+POINTS_PER_CENTROID = 39
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Scale vectors to unit length so inner product equals cosine similarity.
+
+    Args:
+        vectors (np.ndarray): One vector per row, or a single vector.
+
+    Returns:
+        np.ndarray: float32 unit vectors of the same shape; zero vectors stay zero.
+    """
+    vectors = np.asarray(vectors, dtype = np.float32)
+    norms = np.linalg.norm(vectors, axis = -1, keepdims = True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def to_cosine(score: float, metric: str) -> float:
+    """
+    Cosine similarity of unit vectors from a FAISS score.
+
+    Args:
+        score (float): Inner product, or squared L2 distance for segments
+            written before the switch to inner product.
+        metric (str): "ip" or "l2".
+
+    Returns:
+        float: Cosine similarity, higher is more similar.
+    """
+    return 1.0 - score / 2.0 if metric == "l2" else score
+
+
+def resolve_index_type(index_type: str, count: int) -> str:
+    """
+    Index type to build for a shard of a given size.
+
+    Shards below ANN_MIN_CHUNKS stay flat: brute force is exact and already
+    fast there, and the clustering would have too few points to train on.
+
+    Args:
+        index_type (str): Configured index type.
+        count (int): Number of chunks in the shard.
+
+    Returns:
+        str: One of INDEX_TYPES.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {', '.join(INDEX_TYPES)}")
+    return index_type if count >= config.ANN_MIN_CHUNKS else "flat"
+
+
+def factory_string(index_type: str, dimension: int, count: int) -> str:
+    """
+    FAISS index factory description of an index type.
+
+    Args:
+        index_type (str): One of INDEX_TYPES.
+        dimension (int): Dimension of the vectors.
+        count (int): Number of vectors the index is trained on.
+
+    Returns:
+        str: Factory string, e.g. "IVF1024,PQ48".
+    """
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{config.HNSW_M}"
+    nlist = config.IVF_NLIST or int(4 * math.sqrt(count))
+    nlist = max(1, min(nlist, count // POINTS_PER_CENTROID))
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    m = config.PQ_M or max(d for d in range(1, dimension // 8 + 1) if dimension % d == 0)
+    return f"IVF{nlist},PQ{m}x{config.PQ_NBITS}"
+
+
+def build_index(index_type: str, dimension: int, ids: np.ndarray, vectors: np.ndarray, template: Optional[faiss.Index] = None) -> faiss.Index:
+    """
+    Build an ID-mapped inner-product index over a shard's unit vectors.
+
+    Args:
+        index_type (str): One of INDEX_TYPES.
+        dimension (int): Dimension of the vectors.
+        ids (np.ndarray): Chunk IDs.
+        vectors (np.ndarray): Vectors, one row per chunk ID.
+        template (Optional[faiss.Index]): Trained, empty index of the same type
+            from a previous snapshot; reusing it skips training.
+
+    Returns:
+        faiss.Index: Index holding every vector.
+    """
+    if template is not None:
+        index = template
+    else:
+        index = faiss.IndexIDMap2(faiss.index_factory(dimension, factory_string(index_type, dimension, len(ids)), faiss.METRIC_INNER_PRODUCT))
+        if index_type == "hnsw":
+            faiss.downcast_index(index.index).hnsw.efConstruction = config.HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        started = time.perf_counter()
+        sample = vectors
+        if len(vectors) > config.ANN_TRAIN_SAMPLE:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), config.ANN_TRAIN_SAMPLE, replace = False)]
+        index.train(np.ascontiguousarray(sample, dtype = np.float32))
+        logger.info(f"Trained {index_type} index on {len(sample)} vectors in {time.perf_counter() - started:.1f}s")
+    if len(ids):
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype = np.float32), np.asarray(ids, dtype = np.int64))
+    configure_index(index, index_type)
+    return index
+
+
+def configure_index(index: faiss.Index, index_type: str, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """
+    Set the query-time accuracy/latency knobs of an index.
+
+    Args:
+        index (faiss.Index): Index, possibly wrapped in an ID map.
+        index_type (str): One of INDEX_TYPES.
+        nprobe (Optional[int]): IVF lists visited per query, defaults to IVF_NPROBE.
+        ef_search (Optional[int]): HNSW candidate list size, defaults to HNSW_EF_SEARCH.
+    """
+    if index_type in ("ivf_flat", "ivf_pq"):
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", nprobe or config.IVF_NPROBE)
+    elif index_type == "hnsw":
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", ef_search or config.HNSW_EF_SEARCH)
+
+
+def save_template(path: str, index: faiss.Index, index_type: str) -> None:
+    """
+    Store the trained, empty copy of an IVF index next to a segment.
+
+    Later compactions rebuild the segment from it without retraining.
+
+    Args:
+        path (str): Segment directory.
+        index (faiss.Index): Trained index.
+        index_type (str): One of INDEX_TYPES.
+    """
+    if index_type not in ("ivf_flat", "ivf_pq"):
+        return
+    template = faiss.clone_index(index)
+    template.reset()
+    faiss.write_index(template, os.path.join(path, TEMPLATE_FILE))
+
+
+def load_template(path: str) -> Optional[faiss.Index]:
+    """
+    Read the trained template of a segment.
+
+    Args:
+        path (str): Segment directory.
+
+    Returns:
+        Optional[faiss.Index]: Trained, empty index, or None if the segment has none.
+    """
+    template_path = os.path.join(path, TEMPLATE_FILE)
+    if not os.path.exists(template_path):
+        return None
+    return faiss.read_index(template_path)
+
+
+def _percentile_ms(latencies: List[float], percentile: float) -> float:
+    """Percentile of latencies in seconds, in milliseconds."""
+    return float(np.percentile(latencies, percentile) * 1000)
+
+
+def benchmark(
+    vectors: np.ndarray,
+    index_types: Optional[List[str]] = None,
+    nprobes: Optional[List[int]] = None,
+    ef_searches: Optional[List[int]] = None,
+    k: int = 10,
+    queries: int = 200,
+) -> List[Dict]:
+    """
+    Measure recall against exact search and latency of each index type and setting.
+
+    Queries are held-out vectors of the corpus with a little noise, searched
+    one at a time like the chat endpoints do.
+
+    Args:
+        vectors (np.ndarray): Corpus vectors.
+        index_types (Optional[List[str]]): Types to compare, defaults to all.
+        nprobes (Optional[List[int]]): nprobe values tried for IVF types.
+        ef_searches (Optional[List[int]]): efSearch values tried for HNSW.
+        k (int): Number of neighbors per query.
+        queries (int): Number of queries.
+
+    Returns:
+        List[Dict]: One row per (index type, setting) with build time, recall@k and latency percentiles.
+    """
+    vectors = np.ascontiguousarray(normalize(vectors))
+    rng = np.random.default_rng(0)
+    held_out = rng.choice(len(vectors), min(queries, len(vectors) // 10 or 1), replace = False)
+    corpus = np.delete(vectors, held_out, axis = 0)
+    query_vectors = normalize(vectors[held_out] + rng.normal(0, 0.01, vectors[held_out].shape).astype(np.float32))
+    ids = np.arange(len(corpus), dtype = np.int64)
+    dimension = vectors.shape[1]
+
+    exact = build_index("flat", dimension, ids, corpus)
+    truth = exact.search(query_vectors, k)[1]
+
+    rows = []
+    for index_type in index_types or INDEX_TYPES:
+        started = time.perf_counter()
+        index = build_index(index_type, dimension, ids, corpus)
+        build_seconds = time.perf_counter() - started
+        if index_type in ("ivf_flat", "ivf_pq"):
+            settings = [{"nprobe": nprobe} for nprobe in nprobes or [1, 4, 16, 64]]
+        elif index_type == "hnsw":
+            settings = [{"ef_search": ef} for ef in ef_searches or [16, 64, 256]]
+        else:
+            settings = [{}]
+        for setting in settings:
+            configure_index(index, index_type, **setting)
+            latencies, found = [], []
+            for query in query_vectors:
+                started = time.perf_counter()
+                found.append(index.search(query.reshape(1, -1), k)[1][0])
+                latencies.append(time.perf_counter() - started)
+            recall = np.mean([len(set(hit.tolist()) & set(expected.tolist())) / k for hit, expected in zip(found, truth)])
+            rows.append(dict(
+                {"index_type": index_type, "factory": factory_string(index_type, dimension, len(corpus))},
+                **setting,
+                build_seconds = round(build_seconds, 3),
+                recall_at_k = round(float(recall), 4),
+                p50_ms = round(_percentile_ms(latencies, 50), 3),
+                p95_ms = round(_percentile_ms(latencies, 95), 3),
+            ))
+    return rows
+
+
+def _parse_ints(value: Optional[str]) -> Optional[List[int]]:
+    """Parse a comma-separated list of integers."""
+    return [int(part) for part in value.split(",")] if value else None
+
+
+if __name__ == "__main__":
+    from src.persistence import SnapshotManager, Segment
+
+    logging.basicConfig(level = logging.INFO)
+    parser = argparse.ArgumentParser(description = "Recall vs latency of the FAISS index types.")
+    parser.add_argument("--chat-id", help = "Benchmark on the last snapshot of this chat's shard")
+    parser.add_argument("--synthetic", type = int, default = 100000, help = "Number of random vectors when no chat is given")
+    parser.add_argument("--dimension", type = int, default = 384, help = "Dimension of the random vectors")
+    parser.add_argument("--types", help = "Comma-separated index types, defaults to all")
+    parser.add_argument("--nprobe", help = "Comma-separated nprobe values for IVF types")
+    parser.add_argument("--ef-search", help = "Comma-separated efSearch values for HNSW")
+    parser.add_argument("--k", type = int, default = 10)
+    parser.add_argument("--queries", type = int, default = 200)
+    args = parser.parse_args()
+
+    if args.chat_id:
+        snapshots = SnapshotManager(os.path.join(config.INDEX_PATH, args.chat_id))
+        manifest = snapshots.current()
+        if not manifest or not manifest["snapshot"]:
+            raise SystemExit(f"Chat {args.chat_id} has no snapshot yet, compact it first")
+        data = np.asarray(Segment(snapshots.snapshot_path(manifest["snapshot"])).vectors)
+    else:
+        data = np.random.default_rng(1).standard_normal((args.synthetic, args.dimension)).astype(np.float32)
+
+    results = benchmark(
+        data,
+        index_types = args.types.split(",") if args.types else None,
+        nprobes = _parse_ints(args.nprobe),
+        ef_searches = _parse_ints(args.ef_search),
+        k = args.k,
+        queries = args.queries,
+    )
+    for row in results:
+        print(json.dumps(row))
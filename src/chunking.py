@@ -1,16 +1,21 @@
-from typing import List, Optional
+from typing import List, Optional, Iterable, Iterator, Tuple
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+from src.embeddings import load_embeddings
 from langchain_experimental.text_splitter import SemanticChunker
 from langchain.docstore.document import Document
 from Configuration import config
+import numpy as np
 import logging
+import re
 import warnings
 warnings.filterwarnings("ignore")
 
 logger = logging.getLogger(__name__)
 
 class RAGChunker:
+    SENTENCE_SPLIT = re.compile(r"(?<=[.?!])\s+")
+    BREAKPOINT_PERCENTILE = 95
 
 
     def __init__(
@@ -18,19 +23,37 @@ class RAGChunker:
         chunk_size: int = 500,
         chunk_overlap: int = 50,
         use_semantic_chunking: bool = True,
-        embeddings: Optional[HuggingFaceEmbeddings] = None,
+        embeddings: Optional[Embeddings] = None,
+        chunk_vector_mode: Optional[str] = None,
     ):
+        """
+        Initialize the chunker.
 
+        Args:
+            chunk_size (int): Maximum chunk size for recursive splitting.
+            chunk_overlap (int): Chunk overlap for recursive splitting.
+            use_semantic_chunking (bool): Whether to split at semantic breakpoints.
+            embeddings (Optional[Embeddings]): Embeddings used to find semantic breakpoints.
+            chunk_vector_mode (Optional[str]): "model" to let the vector store embed
+                every chunk, or "mean" to reuse the sentence embeddings computed
+                for semantic chunking and mean-pool them into chunk vectors.
+                Defaults to CHUNK_VECTOR_MODE.
+        """
         self.chunk_size = chunk_size
         self.chunk_overlap  = chunk_overlap
         self.use_semantic_chunking = use_semantic_chunking
+        self.chunk_vector_mode = chunk_vector_mode or config.CHUNK_VECTOR_MODE
+        if self.chunk_vector_mode not in ("model", "mean"):
+            raise ValueError(f"Unknown chunk vector mode: {self.chunk_vector_mode}")
 
         if self.use_semantic_chunking:
             try:
+                self.embeddings = embeddings if embeddings else load_embeddings()
                 self.text_splitter = SemanticChunker(
                     breakpoint_threshold_type = "percentile",
-                    breakpoint_threshold_amount = 95,
-                    embeddings = embeddings if embeddings else HuggingFaceEmbeddings(model_name = config.EMBEDDING_MODEL),
+                    breakpoint_threshold_amount = self.BREAKPOINT_PERCENTILE,
+                    embeddings = self.embeddings,
+                    add_start_index = True,
                 )
             except:
                 logger.error("Please install sentence_transformers package to use semantic chunking")
@@ -40,6 +63,7 @@ class RAGChunker:
                 chunk_size = self.chunk_size,
                 chunk_overlap  = self.chunk_overlap,
                 length_function = len,
+                add_start_index = True,
             )
 
                 
@@ -47,6 +71,8 @@ class RAGChunker:
         """
         Chunk input text into smaller segments.
 
+        Every chunk records its character offset in the text as "start_index".
+
         Args:
             text (str): The input text to be chunked.
             metadata (dict): Metadata associated with the text.
@@ -59,13 +85,7 @@ class RAGChunker:
                 return []
             
             doc = Document(page_content=text, metadata=metadata or {})
-            
-            if self.use_semantic_chunking:
-                chunks = self.text_splitter.split_documents([doc])
-            else:
-                chunks = self.text_splitter.split_text([doc])
-
-            return chunks
+            return self.text_splitter.split_documents([doc])
         except Exception as e:
             logger.error("Error in chunking text: ", e)
 
@@ -89,4 +109,133 @@ class RAGChunker:
             return all_chunks
 
         except Exception as e:
-            logger.error("Error in chunking documents: ", e)
\ No newline at end of file
+            logger.error("Error in chunking documents: ", e)
+
+
+    def iter_chunks(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        Chunk a stream of documents (e.g. pages) lazily, one document at a time.
+
+        Every chunk keeps the metadata of the page it came from, such as its page number.
+
+        Args:
+            documents (Iterable[Document]): Documents to be chunked.
+
+        Yields:
+            Document: Chunks in document order.
+        """
+        total = 0
+        for doc in documents:
+            chunks = self.chunk_text(doc.page_content, doc.metadata) or []
+            total += len(chunks)
+            yield from chunks
+        logger.info("Total chunks: %s", total)
+
+
+    @property
+    def precomputes_vectors(self) -> bool:
+        """
+        Whether chunks come with vectors pooled from their sentence embeddings.
+        """
+        return self.use_semantic_chunking and self.chunk_vector_mode == "mean"
+
+
+    def chunk_text_with_vectors(self, text: str, metadata: Optional[dict] = None) -> List[Tuple[Document, Optional[np.ndarray]]]:
+        """
+        Chunk input text and return each chunk with a precomputed vector when available.
+
+        In "mean" mode the text is split into sentences and each sentence is embedded
+        once. Breakpoints are placed like `SemanticChunker` places them: where the
+        cosine distance between neighbouring sentence windows (a sentence and its
+        neighbours) exceeds the BREAKPOINT_PERCENTILE percentile. Each chunk's
+        vector is the mean of its sentence vectors, rescaled to their average
+        norm, so the vector store does not have to embed the chunk again. A
+        chunk's text is the exact span of the input its sentences cover, so
+        "start_index" plus its length is its end offset.
+        Otherwise chunks are returned without vectors.
+
+        Args:
+            text (str): The input text to be chunked.
+            metadata (dict): Metadata associated with the text.
+
+        Returns:
+            List[Tuple[Document, Optional[np.ndarray]]]: Chunks and their vectors (or None).
+        """
+        if not self.precomputes_vectors:
+            return [(chunk, None) for chunk in self.chunk_text(text, metadata) or []]
+        if not text or not text.strip():
+            return []
+
+        sentences = [sentence for sentence in self.SENTENCE_SPLIT.split(text) if sentence.strip()]
+        vectors = np.asarray(self.embeddings.embed_documents(sentences), dtype=np.float32)
+        groups = self._semantic_groups(vectors)
+
+        offsets, position = [], 0
+        for sentence in sentences:
+            position = text.find(sentence, position)
+            offsets.append(position)
+            position += len(sentence)
+
+        chunks = []
+        for start, stop in groups:
+            group = vectors[start:stop]
+            pooled = group.mean(axis=0)
+            pooled_norm = np.linalg.norm(pooled)
+            if pooled_norm > 0:
+                pooled *= np.linalg.norm(group, axis=1).mean() / pooled_norm
+            end = offsets[stop - 1] + len(sentences[stop - 1])
+            document = Document(page_content=text[offsets[start]:end], metadata=dict(metadata or {}, start_index=offsets[start]))
+            chunks.append((document, pooled))
+        return chunks
+
+
+    def _semantic_groups(self, vectors: np.ndarray) -> List[Tuple[int, int]]:
+        """
+        Find semantic breakpoints between consecutive sentences.
+
+        Args:
+            vectors (np.ndarray): Sentence embeddings, one row per sentence.
+
+        Returns:
+            List[Tuple[int, int]]: (start, stop) sentence ranges of the chunks.
+        """
+        count = len(vectors)
+        if count < 3:
+            return [(0, count)]
+
+        # Same buffer of one sentence on each side as SemanticChunker, pooled instead of re-embedded.
+        zeros = np.zeros_like(vectors[:1])
+        padded = np.concatenate([zeros, vectors, zeros])
+        windows = padded[:-2] + padded[1:-1] + padded[2:]
+        windows /= np.maximum(np.linalg.norm(windows, axis=1, keepdims=True), 1e-12)
+        distances = 1.0 - np.sum(windows[:-1] * windows[1:], axis=1)
+        threshold = np.percentile(distances, self.BREAKPOINT_PERCENTILE)
+
+        groups, start = [], 0
+        for index in np.flatnonzero(distances > threshold):
+            groups.append((start, int(index) + 1))
+            start = int(index) + 1
+        groups.append((start, count))
+        return groups
+
+
+    def iter_chunks_with_vectors(self, documents: Iterable[Document]) -> Iterator[Tuple[Document, Optional[np.ndarray]]]:
+        """
+        Chunk a stream of documents lazily, yielding precomputed chunk vectors when available.
+
+        Args:
+            documents (Iterable[Document]): Documents to be chunked.
+
+        Yields:
+            Tuple[Document, Optional[np.ndarray]]: Chunks and their vectors (or None).
+        """
+        total = 0
+        for doc in documents:
+            try:
+                chunks = self.chunk_text_with_vectors(doc.page_content, doc.metadata)
+            except Exception as e:
+                logger.error(f"Error in chunking text: {str(e)}")
+                chunks = []
+            total += len(chunks)
+            yield from chunks
+        logger.info("Total chunks: %s", total)
@@ -0,0 +1,332 @@
+from typing import Optional, List, Dict, Tuple, Any
+from langchain.docstore.document import Document
+from Configuration import config
+import threading
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r"\w+")
+# Metadata keys locating a chunk's page or block within its document, set by src.extraction.
+POSITION_KEYS = ("page", "paragraph", "line")
+
+
+class TokenCounter:
+
+
+    def __init__(self, tokenizer_name: Optional[str] = None):
+        """
+        Count tokens with the Hugging Face tokenizer of the LLM.
+
+        The tokenizer is loaded on first use. If it cannot be loaded (e.g. no
+        network access), tokens are estimated at four characters each.
+
+        Args:
+            tokenizer_name (Optional[str]): Hugging Face tokenizer name, defaults to CONTEXT_TOKENIZER.
+        """
+        self.tokenizer_name = tokenizer_name or config.CONTEXT_TOKENIZER
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+
+    @property
+    def tokenizer(self):
+        """
+        The loaded tokenizer, or None when falling back to the estimate.
+        """
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        from tokenizers import Tokenizer
+                        self._tokenizer = Tokenizer.from_pretrained(self.tokenizer_name)
+                    except Exception as e:
+                        logger.warning(f"Could not load tokenizer {self.tokenizer_name}, estimating tokens from characters: {str(e)}")
+                    self._loaded = True
+        return self._tokenizer
+
+
+    def count(self, text: str) -> int:
+        """
+        Number of tokens of a text.
+
+        Args:
+            text (str): Text.
+
+        Returns:
+            int: Token count.
+        """
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return len(text) // 4 + 1
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Cut a text to at most a number of tokens.
+
+        Args:
+            text (str): Text.
+            max_tokens (int): Maximum number of tokens.
+
+        Returns:
+            str: Leading part of the text.
+        """
+        if self.tokenizer is None:
+            return text[:max_tokens * 4]
+        encoding = self.tokenizer.encode(text, add_special_tokens=False)
+        if len(encoding.ids) <= max_tokens:
+            return text
+        return text[:encoding.offsets[max_tokens - 1][1]] if max_tokens > 0 else ""
+
+
+class ContextBuilder:
+
+
+    def __init__(
+        self,
+        token_budget: Optional[int] = None,
+        duplicate_threshold: Optional[float] = None,
+        min_overlap: int = 20,
+        token_counter: Optional[TokenCounter] = None,
+    ):
+        """
+        Assemble the LLM context from retrieved chunks within a token budget.
+
+        With CHUNK_OVERLAP=200 and CHUNK_SIZE=500, neighbouring chunks repeat
+        up to 40% of their text. The builder
+            1. drops chunks that are near-duplicates of a better-ranked chunk
+               (word-shingle Jaccard similarity or containment),
+            2. merges chunks of the same page that overlap or touch into one block,
+            3. keeps the best-ranked blocks that fit the token budget, and
+            4. writes them in source order: documents by their best chunk, blocks
+               by page and offset.
+        It is stateless per request and safe to share between threads.
+
+        Args:
+            token_budget (Optional[int]): Maximum context tokens, defaults to CONTEXT_TOKEN_BUDGET.
+            duplicate_threshold (Optional[float]): Shingle similarity above which a chunk
+                is a near-duplicate, defaults to CONTEXT_DUPLICATE_THRESHOLD.
+            min_overlap (int): Shortest shared text, in characters, that counts as
+                an overlap when chunks carry no offsets.
+            token_counter (Optional[TokenCounter]): Tokenizer used for the budget.
+        """
+        self.token_budget = token_budget or config.CONTEXT_TOKEN_BUDGET
+        self.duplicate_threshold = duplicate_threshold if duplicate_threshold is not None else config.CONTEXT_DUPLICATE_THRESHOLD
+        self.min_overlap = min_overlap
+        self.token_counter = token_counter or TokenCounter()
+        self._lock = threading.Lock()
+        self._totals = {"requests": 0, "raw_tokens": 0, "context_tokens": 0, "saved_tokens": 0}
+
+
+    @staticmethod
+    def _shingles(text: str) -> set:
+        """
+        Word 3-grams of a text.
+
+        Args:
+            text (str): Text.
+
+        Returns:
+            set: Shingles, or the single words of very short texts.
+        """
+        words = WORD.findall(text.lower())
+        if len(words) < 3:
+            return set(words)
+        return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+    def _deduplicate(self, documents: List[Document]) -> Tuple[List[Document], int]:
+        """
+        Drop chunks that repeat a better-ranked chunk.
+
+        Args:
+            documents (List[Document]): Chunks, best first.
+
+        Returns:
+            Tuple[List[Document], int]: Kept chunks and the number dropped.
+        """
+        kept, kept_shingles = [], []
+        for doc in documents:
+            shingles = self._shingles(doc.page_content)
+            duplicate = False
+            for other in kept_shingles:
+                if not shingles or not other:
+                    duplicate = shingles == other
+                else:
+                    common = len(shingles & other)
+                    duplicate = (
+                        common / len(shingles | other) >= self.duplicate_threshold
+                        or common / len(shingles) >= self.duplicate_threshold
+                    )
+                if duplicate:
+                    break
+            if not duplicate:
+                kept.append(doc)
+                kept_shingles.append(shingles)
+        return kept, len(documents) - len(kept)
+
+
+    @staticmethod
+    def _source(doc: Document) -> Tuple:
+        """
+        Document and page (or block) a chunk comes from.
+
+        Args:
+            doc (Document): Chunk.
+
+        Returns:
+            Tuple: (doc_id, position) key; chunks merge only within the same key.
+        """
+        return (doc.metadata.get("doc_id"), tuple(doc.metadata.get(key) for key in POSITION_KEYS))
+
+
+    def _overlap(self, previous: str, start: Optional[int], end: Optional[int], doc: Document) -> Optional[int]:
+        """
+        Number of leading characters of a chunk already contained in the previous block.
+
+        Args:
+            previous (str): Text of the previous block.
+            start (Optional[int]): Offset of the previous block in its page, if known.
+            end (Optional[int]): End offset of the previous block, if known.
+            doc (Document): Next chunk of the same page.
+
+        Returns:
+            Optional[int]: Characters to skip when appending the chunk (0 if it
+                directly follows), or None if the two are not contiguous.
+        """
+        text = doc.page_content
+        next_start = doc.metadata.get("start_index")
+        if end is not None and next_start is not None:
+            overlap = end - next_start
+            if overlap >= len(text):
+                return len(text)
+            if 0 <= overlap and previous.endswith(text[:overlap]):
+                return overlap
+            if -2 <= overlap < 0:
+                # Only the whitespace stripped by the splitter lies between the chunks.
+                return 0
+            return None
+        probe = text[:self.min_overlap]
+        if len(probe) < self.min_overlap:
+            return None
+        position = previous.find(probe, max(0, len(previous) - len(text)))
+        while position != -1:
+            if text.startswith(previous[position:]):
+                return len(previous) - position
+            position = previous.find(probe, position + 1)
+        return None
+
+
+    def _merge(self, documents: List[Document]) -> List[Dict[str, Any]]:
+        """
+        Merge overlapping or adjacent chunks of the same page into blocks.
+
+        Args:
+            documents (List[Document]): Chunks, best first.
+
+        Returns:
+            List[Dict[str, Any]]: Blocks with "text", "source", "start", "rank"
+                (best rank among their chunks) and "documents".
+        """
+        ranked = list(enumerate(documents))
+        ranked.sort(key=lambda item: (
+            str(self._source(item[1])),
+            item[1].metadata.get("start_index", -1),
+            item[0],
+        ))
+        blocks: List[Dict[str, Any]] = []
+        for rank, doc in ranked:
+            source = self._source(doc)
+            start = doc.metadata.get("start_index")
+            block = blocks[-1] if blocks and blocks[-1]["source"] == source else None
+            overlap = self._overlap(block["text"], block["start"], block["end"], doc) if block else None
+            if overlap is None:
+                blocks.append({
+                    "text": doc.page_content,
+                    "source": source,
+                    "start": start,
+                    "end": start + len(doc.page_content) if start is not None else None,
+                    "rank": rank,
+                    "documents": [doc],
+                })
+                continue
+            separator = " " if overlap == 0 else ""
+            block["text"] += separator + doc.page_content[overlap:]
+            # A chunk contained in the block must not pull its end back.
+            block["end"] = max(block["end"], start + len(doc.page_content)) if start is not None and block["end"] is not None else None
+            block["rank"] = min(block["rank"], rank)
+            block["documents"].append(doc)
+        return blocks
+
+
+    def build(self, documents: List[Document]) -> Tuple[str, List[Document], Dict[str, Any]]:
+        """
+        Build the context of one request.
+
+        Args:
+            documents (List[Document]): Retrieved chunks, best first.
+
+        Returns:
+            Tuple[str, List[Document], Dict[str, Any]]: Context text, the chunks it
+                contains (the sources to cite), and token statistics: "raw_tokens"
+                (naive newline join of every chunk), "context_tokens", "saved_tokens",
+                "chunks", "duplicates", "blocks" and "dropped_blocks".
+        """
+        counter = self.token_counter
+        raw_tokens = counter.count("\n".join(doc.page_content for doc in documents))
+        unique, duplicates = self._deduplicate(documents)
+        blocks = self._merge(unique)
+
+        first_rank = {}
+        for block in blocks:
+            first_rank[block["source"][0]] = min(first_rank.get(block["source"][0], block["rank"]), block["rank"])
+
+        selected, used = [], 0
+        for block in sorted(blocks, key=lambda block: block["rank"]):
+            tokens = counter.count(block["text"]) + (2 if selected else 0)
+            if used + tokens > self.token_budget:
+                if selected:
+                    continue
+                block["text"] = counter.truncate(block["text"], self.token_budget)
+                tokens = counter.count(block["text"])
+            selected.append(block)
+            used += tokens
+        selected.sort(key=lambda block: (first_rank[block["source"][0]], str(block["source"]), block["start"] if block["start"] is not None else -1))
+
+        context = "\n\n".join(block["text"] for block in selected)
+        context_tokens = counter.count(context)
+        stats = {
+            "raw_tokens": raw_tokens,
+            "context_tokens": context_tokens,
+            "saved_tokens": max(raw_tokens - context_tokens, 0),
+            "chunks": len(documents),
+            "duplicates": duplicates,
+            "blocks": len(selected),
+            "dropped_blocks": len(blocks) - len(selected),
+        }
+        with self._lock:
+            self._totals["requests"] += 1
+            self._totals["raw_tokens"] += raw_tokens
+            self._totals["context_tokens"] += context_tokens
+            self._totals["saved_tokens"] += stats["saved_tokens"]
+        return context, [doc for block in selected for doc in block["documents"]], stats
+
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Token savings of this process since it started.
+
+        Returns:
+            Dict[str, Any]: Request count, raw, context and saved tokens, and the saved fraction.
+        """
+        with self._lock:
+            totals = dict(self._totals)
+        totals["saved_ratio"] = totals["saved_tokens"] / totals["raw_tokens"] if totals["raw_tokens"] else 0.0
+        totals["token_budget"] = self.token_budget
+        totals["tokenizer"] = self.token_counter.tokenizer_name if self.token_counter.tokenizer is not None else "estimate"
+        return totals
@@ -0,0 +1,253 @@
+from typing import Optional, List, Dict, Any
+from langchain_core.prompts import PromptTemplate
+from Configuration import config
+from src.context import TokenCounter
+from src.resilience import ResilientLLM, build_llm
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+SPEAKERS = {"user": "User", "bot": "Assistant"}
+# Messages cut shorter than this are left out of the prompt rather than shown as a fragment.
+MIN_MESSAGE_TOKENS = 16
+
+CONDENSE_TEMPLATE = PromptTemplate(
+    input_variables = ["history", "input"],
+    template = """Given the conversation below and a follow-up question, rewrite the follow-up question as a standalone question that can be understood without the conversation.
+Resolve pronouns and references such as "it", "that one" or "the second option" to what they refer to, and keep names, identifiers and numbers verbatim.
+If the follow-up question is already standalone, return it unchanged. Return only the question.
+
+Conversation:
+{history}
+
+Follow-up question: {input}
+Standalone question:""",
+)
+
+SUMMARY_TEMPLATE = PromptTemplate(
+    input_variables = ["summary", "messages", "words"],
+    template = """Update the running summary of a conversation between a user and an assistant about the user's documents.
+Fold the new messages into the current summary. Keep the topics, facts, names, numbers and open questions that later questions may refer to; drop greetings and repetition.
+Write at most {words} words and return only the summary.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:""",
+)
+
+
+class ConversationContext:
+
+
+    def __init__(
+        self,
+        llm_model: Optional[str] = None,
+        token_budget: Optional[int] = None,
+        token_counter: Optional[TokenCounter] = None,
+    ):
+        """
+        Make retrieval and prompts aware of the earlier turns of a chat.
+
+        A history is a dict with the chat's running "summary" (str) and its last
+        "messages" (dicts with "sender" and "content"), oldest first. A small,
+        fast LLM rewrites follow-up questions into standalone retrieval queries
+        and folds old messages into the summary. `format_history` renders the
+        summary and the newest messages within a fixed token budget, so the
+        prompt does not grow with the length of the chat.
+
+        Args:
+            llm_model (Optional[str]): Groq model for rewriting and summarizing, defaults to HISTORY_MODEL.
+            token_budget (Optional[int]): Maximum history tokens in a prompt, defaults to HISTORY_TOKEN_BUDGET.
+            token_counter (Optional[TokenCounter]): Tokenizer used for the budget.
+        """
+        self.llm_model = llm_model or config.HISTORY_MODEL
+        self.token_budget = token_budget or config.HISTORY_TOKEN_BUDGET
+        self.token_counter = token_counter or TokenCounter()
+        self._llm = None
+        self._lock = threading.Lock()
+
+
+    @property
+    def llm(self) -> ResilientLLM:
+        """
+        The rewriting and summarizing LLM, created on first use.
+        """
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    self._llm = build_llm(self.llm_model, temperature = 0.0, timeout = config.HISTORY_TIMEOUT)
+        return self._llm
+
+
+    @staticmethod
+    def has_history(history: Optional[Dict[str, Any]]) -> bool:
+        """
+        Check whether a chat has earlier turns.
+
+        Args:
+            history (Optional[Dict[str, Any]]): Chat history.
+
+        Returns:
+            bool: True if there is a summary or at least one message.
+        """
+        return bool(history and (history.get("summary") or history.get("messages")))
+
+
+    def format_messages(self, messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> str:
+        """
+        Render messages as "Speaker: text" lines.
+
+        Args:
+            messages (List[Dict[str, Any]]): Messages, oldest first.
+            max_tokens (Optional[int]): Maximum tokens of each message, defaults to HISTORY_MESSAGE_TOKENS.
+
+        Returns:
+            str: One line per message.
+        """
+        max_tokens = max_tokens or config.HISTORY_MESSAGE_TOKENS
+        lines = []
+        for message in messages:
+            content = " ".join(message["content"].split())
+            truncated = self.token_counter.truncate(content, max_tokens)
+            lines.append(f"{SPEAKERS.get(message['sender'], message['sender'])}: {truncated}{' ...' if truncated != content else ''}")
+        return "\n".join(lines)
+
+
+    def format_history(self, history: Optional[Dict[str, Any]]) -> str:
+        """
+        Render a history for the prompt within the token budget.
+
+        The summary comes first, cut to HISTORY_SUMMARY_TOKENS (at most half
+        the budget); the newest messages then fill the rest of the budget, each
+        cut to HISTORY_MESSAGE_TOKENS, and older messages are left out.
+
+        Args:
+            history (Optional[Dict[str, Any]]): Chat history.
+
+        Returns:
+            str: History text, empty if the chat has no earlier turns.
+        """
+        if not self.has_history(history):
+            return ""
+        counter = self.token_counter
+        parts = []
+        used = 0
+        if history.get("summary"):
+            summary = "Summary of the earlier conversation: " + counter.truncate(history["summary"], min(config.HISTORY_SUMMARY_TOKENS, self.token_budget // 2))
+            parts.append(summary)
+            used = counter.count(summary) + 1
+        lines = []
+        for message in reversed(history.get("messages") or []):
+            # Room for the speaker, the ellipsis and the newline of the line.
+            remaining = self.token_budget - used - 8
+            if remaining < MIN_MESSAGE_TOKENS:
+                break
+            line = self.format_messages([message], max_tokens = min(config.HISTORY_MESSAGE_TOKENS, remaining))
+            tokens = counter.count(line) + 1
+            if used + tokens > self.token_budget:
+                break
+            lines.append(line)
+            used += tokens
+        return "\n".join(parts + lines[::-1])
+
+
+    def _condense_prompt(self, query: str, history: Dict[str, Any]) -> str:
+        """
+        Prompt asking the LLM for a standalone version of a question.
+
+        Args:
+            query (str): Follow-up question.
+            history (Dict[str, Any]): Chat history.
+
+        Returns:
+            str: Formatted prompt.
+        """
+        return CONDENSE_TEMPLATE.format(history = self.format_history(history), input = query)
+
+
+    def _clean_query(self, query: str, rewritten: str) -> str:
+        """
+        Validate the LLM's standalone question.
+
+        Args:
+            query (str): Original question.
+            rewritten (str): LLM output.
+
+        Returns:
+            str: The rewritten question, or the original if the output is empty or rambles.
+        """
+        rewritten = rewritten.strip().strip('"').strip()
+        if not rewritten or self.token_counter.count(rewritten) > max(4 * self.token_counter.count(query), 64):
+            return query
+        return rewritten
+
+
+    def standalone_query(self, query: str, history: Optional[Dict[str, Any]]) -> str:
+        """
+        Rewrite a follow-up question into a standalone retrieval query.
+
+        Args:
+            query (str): User question.
+            history (Optional[Dict[str, Any]]): Chat history.
+
+        Returns:
+            str: Standalone question; the question itself for the first turn of a
+                chat or if the LLM call fails.
+        """
+        if not self.has_history(history):
+            return query
+        try:
+            rewritten = self._clean_query(query, self.llm.invoke(self._condense_prompt(query, history)).content)
+            logger.info(f"Standalone query: {rewritten!r}")
+            return rewritten
+        except Exception as e:
+            logger.error(f"Error rewriting query, retrieving with the original question: {str(e)}")
+            return query
+
+
+    async def astandalone_query(self, query: str, history: Optional[Dict[str, Any]]) -> str:
+        """
+        Async `standalone_query` for the ASGI endpoints.
+
+        Args:
+            query (str): User question.
+            history (Optional[Dict[str, Any]]): Chat history.
+
+        Returns:
+            str: Standalone question.
+        """
+        if not self.has_history(history):
+            return query
+        try:
+            response = await self.llm.ainvoke(self._condense_prompt(query, history))
+            rewritten = self._clean_query(query, response.content)
+            logger.info(f"Standalone query: {rewritten!r}")
+            return rewritten
+        except Exception as e:
+            logger.error(f"Error rewriting query, retrieving with the original question: {str(e)}")
+            return query
+
+
+    def summarize(self, summary: str, messages: List[Dict[str, Any]]) -> str:
+        """
+        Fold messages into a running summary.
+
+        Args:
+            summary (str): Current summary, empty for none.
+            messages (List[Dict[str, Any]]): Messages to fold in, oldest first.
+
+        Returns:
+            str: New summary, at most HISTORY_SUMMARY_TOKENS tokens.
+        """
+        prompt = SUMMARY_TEMPLATE.format(
+            summary = summary or "(none)",
+            messages = self.format_messages(messages, max_tokens = config.HISTORY_SUMMARY_TOKENS),
+            words = max(config.HISTORY_SUMMARY_TOKENS * 3 // 4, 20),
+        )
+        updated = self.llm.invoke(prompt).content.strip()
+        return self.token_counter.truncate(updated, config.HISTORY_SUMMARY_TOKENS)
@@ -0,0 +1,585 @@
+from typing import List, Optional, Dict, Tuple, Callable
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+from Configuration import config
+import numpy as np
+import unicodedata
+import threading
+import queue
+import hashlib
+import logging
+import sqlite3
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text before hashing so trivially different copies share a cache entry.
+
+    Args:
+        text (str): Text to normalize.
+
+    Returns:
+        str: NFC-normalized text with runs of whitespace collapsed.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class CachedEmbeddings(Embeddings):
+    # Seconds between two `last_used` refreshes of the same entry.
+    TOUCH_INTERVAL = 3600.0
+
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        cache_path: str,
+        max_entries: int = 500000,
+    ):
+        """
+        Content-addressed, on-disk cache in front of an embeddings model.
+
+        Vectors are stored as float32 blobs in a SQLite database keyed by the
+        sha256 of the model name and the normalized text, so the same page
+        embedded by the chunker, the vector store or a re-upload is computed
+        once. A hit refreshes the entry's `last_used` stamp when it is older
+        than TOUCH_INTERVAL, so hot entries do not turn every lookup into a
+        write. Eviction of the least recently used entries above `max_entries`
+        runs after every `max_entries / 100` inserts rather than on every
+        miss, so the table may briefly exceed the limit by that much per process.
+
+        The database is shared by the Flask app and the Celery workers. Every
+        thread opens its own connection, so lookups run concurrently under
+        SQLite's WAL mode and only writers wait on each other. Hit/miss
+        counters are per process.
+
+        Args:
+            embeddings (Embeddings): Embeddings model computing cache misses.
+            model_name (str): Model name mixed into every key.
+            cache_path (str): SQLite database file.
+            max_entries (int): Maximum number of cached vectors.
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._evict_every = max(1, max_entries // 100)
+        self._inserted = 0
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok = True)
+
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Open the cache database for the current thread, reconnecting after a fork.
+
+        Returns:
+            sqlite3.Connection: Connection owned by the current thread.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.cache_path, timeout = 30, check_same_thread = False, isolation_level = None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+
+    def _key(self, text: str, kind: str) -> str:
+        """
+        Cache key of a text.
+
+        Args:
+            text (str): Text to embed.
+            kind (str): "document" or "query"; some models embed them differently.
+
+        Returns:
+            str: Hex sha256 of the model name, kind and normalized text.
+        """
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+    def _lookup(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Fetch cached vectors and refresh the `last_used` stamps older than TOUCH_INTERVAL.
+
+        Args:
+            keys (List[str]): Cache keys.
+
+        Returns:
+            Dict[str, np.ndarray]: Vectors of the keys found in the cache.
+        """
+        found = {}
+        stale = []
+        conn = self._connection()
+        now = time.time()
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            for key, vector, last_used in rows:
+                found[key] = np.frombuffer(vector, dtype = np.float32)
+                if now - last_used > self.TOUCH_INTERVAL:
+                    stale.append(key)
+        if stale:
+            conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in stale])
+        return found
+
+
+    def _store(self, entries: Dict[str, np.ndarray]) -> None:
+        """
+        Insert freshly computed vectors, evicting the least recently used entries every `max_entries / 100` inserts.
+
+        Args:
+            entries (Dict[str, np.ndarray]): Vectors by cache key.
+        """
+        conn = self._connection()
+        now = time.time()
+        with self._lock:
+            self._inserted += len(entries)
+            evict = self._inserted >= self._evict_every
+            if evict:
+                self._inserted = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype = np.float32).tobytes(), now) for key, vector in entries.items()]
+            )
+            if evict:
+                excess = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    conn.execute(
+                        "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+                    )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+    def _embed(self, texts: List[str], kind: str) -> List[List[float]]:
+        """
+        Embed texts through the cache.
+
+        Cache failures are logged and fall back to the wrapped model.
+
+        Args:
+            texts (List[str]): Texts to embed.
+            kind (str): "document" or "query".
+
+        Returns:
+            List[List[float]]: One vector per text.
+        """
+        if not texts:
+            return []
+        keys = [self._key(text, kind) for text in texts]
+        try:
+            cached = self._lookup(keys)
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache lookup failed: {str(e)}")
+            cached = {}
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            if kind == "query":
+                computed = [self.embeddings.embed_query(text) for text in missing.values()]
+            else:
+                computed = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing, (np.asarray(vector, dtype = np.float32) for vector in computed)))
+            try:
+                self._store(fresh)
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache write failed: {str(e)}")
+            cached.update(fresh)
+
+        return [cached[key].tolist() for key in keys]
+
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed documents, computing only the ones missing from the cache.
+
+        Args:
+            texts (List[str]): Texts to embed.
+
+        Returns:
+            List[List[float]]: One vector per text.
+        """
+        return self._embed(texts, "document")
+
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query through the cache.
+
+        Args:
+            text (str): Query text.
+
+        Returns:
+            List[float]: Query vector.
+        """
+        return self._embed([text], "query")[0]
+
+
+    def stats(self) -> dict:
+        """
+        Hit/miss counters of this process.
+
+        Returns:
+            dict: Hits, misses, hit rate and the number of cached vectors.
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        try:
+            entries = self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
+
+
+class BatchingEmbeddings(Embeddings):
+
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch: int = 64,
+        max_wait_ms: float = 5.0,
+        threads: Optional[int] = None,
+        queries_as_documents: bool = False,
+    ):
+        """
+        In-process embedding engine that merges concurrent requests into micro-batches.
+
+        Callers (request threads embedding queries, indexing embedding chunks)
+        enqueue their texts and block on a future. A single worker thread takes
+        the first waiting request, keeps collecting requests until `max_batch`
+        texts are queued or `max_wait_ms` has passed, and runs one forward pass
+        per kind ("document" or "query") for the whole batch. If `threads` is
+        given, the model's intra-op parallelism is set to it so one large
+        forward pass uses the process's share of the cores.
+
+        The worker is started lazily and restarted after a fork, so the same
+        object works in the Flask app and in Celery prefork children.
+
+        Args:
+            embeddings (Embeddings): Embeddings model running the batches.
+            max_batch (int): Maximum number of texts merged into one batch.
+            max_wait_ms (float): Longest time the first request of a batch waits for company.
+            threads (Optional[int]): Intra-op threads of the model, unchanged if None or 0.
+            queries_as_documents (bool): Whether the model embeds queries like
+                documents, so concurrent queries can share one `embed_documents` pass.
+        """
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.threads = threads
+        self.queries_as_documents = queries_as_documents
+        self._queue: "queue.Queue[Tuple[str, List[str], Future, float]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._started = time.monotonic()
+        self._texts = 0
+        self._batches = 0
+        self._busy = 0.0
+        self._wait = 0.0
+        self._requests = 0
+        self._histogram: Dict[int, int] = {}
+
+
+    def _ensure_worker(self) -> None:
+        """
+        Start the batching thread in the current process if it is not running.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            if self.threads:
+                try:
+                    import torch
+                    torch.set_num_threads(self.threads)
+                except ImportError:
+                    logger.warning("torch is not installed, intra-op threads left unchanged")
+            threading.Thread(target=self._run, name="embedding-batcher", daemon=True).start()
+            self._pid = os.getpid()
+
+
+    def _run(self) -> None:
+        """
+        Worker loop: collect a micro-batch, embed it, resolve the callers' futures.
+        """
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][1])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout = remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[1])
+            self._process(batch)
+
+
+    def _process(self, batch: List[Tuple[str, List[str], Future, float]]) -> None:
+        """
+        Embed a micro-batch with one forward pass per kind.
+
+        Args:
+            batch (List[Tuple[str, List[str], Future, float]]): (kind, texts, future, enqueue time) requests.
+        """
+        started = time.monotonic()
+        for kind in ("document", "query"):
+            requests = [item for item in batch if item[0] == kind]
+            if not requests:
+                continue
+            texts = [text for _, item_texts, _, _ in requests for text in item_texts]
+            try:
+                if kind == "query" and not self.queries_as_documents:
+                    vectors = [self.embeddings.embed_query(text) for text in texts]
+                else:
+                    vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                for _, _, future, _ in requests:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for _, item_texts, future, _ in requests:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+        elapsed = time.monotonic() - started
+        size = sum(len(item[1]) for item in batch)
+        bucket = 1 << max(size - 1, 0).bit_length()
+        with self._lock:
+            self._batches += 1
+            self._texts += size
+            self._busy += elapsed
+            self._requests += len(batch)
+            self._wait += sum(started - item[3] for item in batch)
+            self._histogram[bucket] = self._histogram.get(bucket, 0) + 1
+
+
+    def _submit(self, kind: str, texts: List[str]) -> List[List[float]]:
+        """
+        Queue texts for the next micro-batch and wait for their vectors.
+
+        Args:
+            kind (str): "document" or "query".
+            texts (List[str]): Texts to embed.
+
+        Returns:
+            List[List[float]]: One vector per text.
+        """
+        if not texts:
+            return []
+        self._ensure_worker()
+        futures = []
+        for start in range(0, len(texts), self.max_batch):
+            future = Future()
+            self._queue.put((kind, texts[start:start + self.max_batch], future, time.monotonic()))
+            futures.append(future)
+        return [vector for future in futures for vector in future.result()]
+
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed documents in the next micro-batches.
+
+        Args:
+            texts (List[str]): Texts to embed.
+
+        Returns:
+            List[List[float]]: One vector per text.
+        """
+        return self._submit("document", texts)
+
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query in the next micro-batch.
+
+        Args:
+            text (str): Query text.
+
+        Returns:
+            List[float]: Query vector.
+        """
+        return self._submit("query", [text])[0]
+
+
+    def stats(self) -> dict:
+        """
+        Throughput and batch-size histogram of this process.
+
+        Returns:
+            dict: Texts and batches processed, texts per second (over busy time
+                and since start), mean batch size and queue wait, and a histogram
+                of batch sizes bucketed by the next power of two.
+        """
+        with self._lock:
+            uptime = time.monotonic() - self._started
+            return {
+                "texts": self._texts,
+                "batches": self._batches,
+                "texts_per_second_busy": self._texts / self._busy if self._busy else 0.0,
+                "texts_per_second": self._texts / uptime if uptime else 0.0,
+                "utilization": self._busy / uptime if uptime else 0.0,
+                "mean_batch_size": self._texts / self._batches if self._batches else 0.0,
+                "mean_queue_wait_ms": 1000.0 * self._wait / self._requests if self._requests else 0.0,
+                "batch_size_histogram": {f"<={bucket}": count for bucket, count in sorted(self._histogram.items())},
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "threads": self.threads,
+            }
+
+
+def embedding_stats(embeddings: Embeddings) -> dict:
+    """
+    Collect the counters of every cache and batching layer wrapping an embeddings model.
+
+    Args:
+        embeddings (Embeddings): Outermost embeddings object.
+
+    Returns:
+        dict: "cache" and "engine" statistics, None for layers that are not in use.
+    """
+    stats = {"cache": None, "engine": None}
+    while embeddings is not None:
+        if isinstance(embeddings, CachedEmbeddings):
+            stats["cache"] = embeddings.stats()
+        elif isinstance(embeddings, BatchingEmbeddings):
+            stats["engine"] = embeddings.stats()
+        embeddings = getattr(embeddings, "embeddings", None)
+    return stats
+
+
+def _huggingface_backend(model_name: str) -> Embeddings:
+    """
+    fp32 sentence-transformers model run by PyTorch.
+
+    Args:
+        model_name (str): Hugging Face model name.
+
+    Returns:
+        Embeddings: Embeddings model.
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name = model_name, encode_kwargs = {"batch_size": config.EMBEDDING_MAX_BATCH})
+
+
+def _onnx_backend(model_name: str) -> Embeddings:
+    """
+    int8 ONNX Runtime export of a sentence-transformers model (see `src.onnx_embeddings`).
+
+    Args:
+        model_name (str): Hugging Face model name.
+
+    Returns:
+        Embeddings: Embeddings model.
+    """
+    from src.onnx_embeddings import load_onnx_embeddings
+    return load_onnx_embeddings(model_name, threads = config.EMBEDDING_THREADS, batch_size = config.EMBEDDING_MAX_BATCH)
+
+
+# Embedding backends by the prefix of EMBEDDING_MODEL ("onnx:<model>"); no prefix means "huggingface".
+# Every backend embeds queries like documents, which lets the batching engine merge them.
+EMBEDDING_BACKENDS: Dict[str, Callable[[str], Embeddings]] = {
+    "huggingface": _huggingface_backend,
+    "onnx": _onnx_backend,
+}
+
+
+def parse_model_spec(spec: str) -> Tuple[str, str]:
+    """
+    Split an EMBEDDING_MODEL value into its backend and model name.
+
+    Args:
+        spec (str): "<backend>:<model>" or a bare model name.
+
+    Returns:
+        Tuple[str, str]: Backend name and Hugging Face model name.
+    """
+    backend, _, model_name = spec.partition(":")
+    if model_name and backend in EMBEDDING_BACKENDS:
+        return backend, model_name
+    return "huggingface", spec
+
+
+def load_embeddings(model_name: Optional[str] = None) -> Embeddings:
+    """
+    Build the embeddings model shared by the chunker, the vector store and ChatDocs.
+
+    The backend is chosen by the prefix of the model name (see EMBEDDING_BACKENDS),
+    e.g. "onnx:sentence-transformers/all-MiniLM-L6-v2" for the int8 ONNX model.
+    The cache key includes the full name, so vectors of different backends never mix.
+
+    The model runs behind a `BatchingEmbeddings` engine unless EMBEDDING_MICRO_BATCHING
+    is off, and is wrapped in a `CachedEmbeddings` unless EMBEDDING_CACHE_MAX_ENTRIES is 0,
+    so only cache misses reach the batching queue.
+
+    Args:
+        model_name (Optional[str]): Model name, defaults to EMBEDDING_MODEL.
+
+    Returns:
+        Embeddings: Embeddings model.
+    """
+    model_name = model_name or config.EMBEDDING_MODEL
+    backend, backend_model = parse_model_spec(model_name)
+    embeddings = EMBEDDING_BACKENDS[backend](backend_model)
+    if config.EMBEDDING_MICRO_BATCHING:
+        embeddings = BatchingEmbeddings(
+            embeddings,
+            max_batch = config.EMBEDDING_MAX_BATCH,
+            max_wait_ms = config.EMBEDDING_MAX_WAIT_MS,
+            # ONNX Runtime sessions get their threads from their session options.
+            threads = config.EMBEDDING_THREADS if backend == "huggingface" else None,
+            queries_as_documents = True,
+        )
+    if config.EMBEDDING_CACHE_MAX_ENTRIES <= 0:
+        return embeddings
+    return CachedEmbeddings(
+        embeddings,
+        model_name = model_name,
+        cache_path = config.EMBEDDING_CACHE_PATH,
+        max_entries = config.EMBEDDING_CACHE_MAX_ENTRIES,
+    )
@@ -0,0 +1,169 @@
+from typing import Iterator, List, Optional
+from collections import deque
+from langchain.docstore.document import Document
+from Configuration import config
+import billiard
+import PyPDF2
+import docx
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def is_pdf(file_path: str) -> bool:
+    """
+    Cheap PDF validation that checks the file signature without parsing the document.
+
+    Args:
+        file_path (str): Path of the stored file.
+
+    Returns:
+        bool: Whether the file starts with a PDF header.
+    """
+    with open(file_path, 'rb') as file:
+        return file.read(5) == b'%PDF-'
+
+
+def _extract_pdf_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """
+    Extract the text of a range of PDF pages. Runs inside extraction worker processes.
+
+    Args:
+        file_path (str): Path of the PDF.
+        start (int): First page index.
+        stop (int): Page index after the last page.
+
+    Returns:
+        List[str]: Text of each page in the range.
+    """
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() or '' for i in range(start, stop)]
+
+
+def _iter_pdf_pages(file_path: str, metadata: dict) -> Iterator[Document]:
+    """
+    Yield the pages of a PDF, fanning page ranges out to a process pool for large files.
+
+    Small files are read page by page from a single reader. For large ones
+    the parsing moves to processes, since PyPDF2 is pure Python and holds the
+    GIL; each worker opens the file for its page range.
+    The pool comes from billiard (Celery's fork of multiprocessing), which
+    unlike the standard library lets daemonic Celery prefork children start
+    workers of their own. At most two ranges per worker are in flight, so
+    memory stays bounded however far ahead the workers get.
+
+    Args:
+        file_path (str): Path of the PDF.
+        metadata (dict): Metadata copied into every page.
+
+    Yields:
+        Document: One document per page with its 1-based "page" number.
+    """
+    pool = None
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        page_count = len(pdf_reader.pages)
+        if config.EXTRACTION_WORKERS > 0 and page_count >= config.PARALLEL_EXTRACTION_MIN_PAGES:
+            try:
+                pool = billiard.Pool(processes=config.EXTRACTION_WORKERS)
+            except Exception as e:
+                logger.warning(f"Falling back to sequential extraction for {file_path}: {str(e)}")
+        if pool is None:
+            # Sequentially, the file is parsed once and read page by page.
+            for index, page in enumerate(pdf_reader.pages):
+                yield Document(page_content=page.extract_text() or '', metadata=dict(metadata, page=index + 1, page_count=page_count))
+            return
+
+    batch = config.EXTRACTION_PAGE_BATCH
+    ranges = [(start, min(start + batch, page_count)) for start in range(0, page_count, batch)]
+    try:
+        pending = deque()
+        remaining = iter(ranges)
+        for start, stop in remaining:
+            pending.append((start, pool.apply_async(_extract_pdf_pages, (file_path, start, stop))))
+            if len(pending) >= config.EXTRACTION_WORKERS * 2:
+                break
+        while pending:
+            start, result = pending.popleft()
+            texts = result.get()
+            next_range = next(remaining, None)
+            if next_range:
+                pending.append((next_range[0], pool.apply_async(_extract_pdf_pages, (file_path, *next_range))))
+            for offset, text in enumerate(texts):
+                yield Document(page_content=text, metadata=dict(metadata, page=start + offset + 1, page_count=page_count))
+    finally:
+        # Also stops ranges still being parsed when the consumer gives up early.
+        pool.terminate()
+        pool.join()
+
+
+def iter_pages(file_path: str, extension: str, metadata: Optional[dict] = None) -> Iterator[Document]:
+    """
+    Stream an uploaded document as a sequence of page-sized documents.
+
+    PDFs yield one document per page ("page" metadata). DOCX files yield
+    blocks of paragraphs ("paragraph" metadata, index of the first paragraph)
+    and text files yield blocks of lines ("line" metadata).
+
+    Args:
+        file_path (str): Path of the stored file.
+        extension (str): File extension ("pdf", "docx" or "txt").
+        metadata (Optional[dict]): Metadata copied into every page.
+
+    Yields:
+        Document: Pages with non-empty text.
+    """
+    metadata = metadata or {}
+    if extension == 'pdf':
+        pages = _iter_pdf_pages(file_path, metadata)
+    elif extension == 'docx':
+        pages = _iter_blocks((para.text for para in docx.Document(file_path).paragraphs), 'paragraph', metadata)
+    elif extension == 'txt':
+        pages = _iter_txt(file_path, metadata)
+    else:
+        return
+    for page in pages:
+        if page.page_content.strip():
+            yield page
+
+
+def _iter_txt(file_path: str, metadata: dict) -> Iterator[Document]:
+    """
+    Yield blocks of lines from a text file without reading it whole.
+
+    Args:
+        file_path (str): Path of the text file.
+        metadata (dict): Metadata copied into every block.
+
+    Yields:
+        Document: Blocks of lines.
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        yield from _iter_blocks((line.rstrip('\n') for line in file), 'line', metadata)
+
+
+def _iter_blocks(lines: Iterator[str], key: str, metadata: dict) -> Iterator[Document]:
+    """
+    Group lines or paragraphs into page-sized blocks.
+
+    Args:
+        lines (Iterator[str]): Lines or paragraphs.
+        key (str): Metadata key recording the 1-based index of a block's first line.
+        metadata (dict): Metadata copied into every block.
+
+    Yields:
+        Document: Blocks of roughly EXTRACTION_BLOCK_CHARS characters.
+    """
+    block, size, first = [], 0, 1
+    for index, line in enumerate(lines, start=1):
+        if not block:
+            first = index
+        block.append(line)
+        size += len(line) + 1
+        if size >= config.EXTRACTION_BLOCK_CHARS:
+            yield Document(page_content='\n'.join(block), metadata=dict(metadata, **{key: first}))
+            block, size = [], 0
+    if block:
+        yield Document(page_content='\n'.join(block), metadata=dict(metadata, **{key: first}))
+
@@ -1,15 +1,23 @@
 from math import log
 from Configuration import config
-from langchain_groq import ChatGroq
-from typing import Optional, List
+from typing import Optional, List, Iterator, AsyncIterator, Tuple, Dict, Any, Callable
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from langchain_core.prompts import PromptTemplate
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+from src.embeddings import load_embeddings
 from src.indexers import FAISSVectorStore
 from src.chunking import RAGChunker
-from tavily import TavilyClient
+from src.lexical import reciprocal_rank_fusion
+from src.context import ContextBuilder
+from src.conversation import ConversationContext
+from src.web_search import WebSearch
+from src.resilience import build_llm
 from langchain.docstore.document import Document
 import warnings
+import functools
+import asyncio
 import logging
+import time
 import os
 warnings.filterwarnings("ignore")
 
@@ -21,28 +29,46 @@ class ChatDocs:
     def __init__(
         self,
         llm_model: str = "qwen-qwq-32b",
-        similarity_threshold: float = 0.5,
+        similarity_threshold: float = 0.35,
         use_semantic_chunking: bool = None,
         vector_store: Optional[FAISSVectorStore] = None,
-        embeddings: Optional[HuggingFaceEmbeddings] = None,
+        embeddings: Optional[Embeddings] = None,
+        web_search: Optional[WebSearch] = None,
+        llm_fallback_model: Optional[str] = None,
     ):
         """
         Initialize the GroqAgent.
+
+        Concurrency model: one instance is shared by every request thread of a
+        process and is never mutated after initialization. `answer` and
+        `stream_answer` keep the prompt and the retrieved sources in local
+        variables, so any number of threads may call them at once. The shared
+        collaborators are thread-safe on their own: the vector store locks a
+        chat's shard only while it is searched or written, the embeddings are
+        cached in SQLite and batched by a single worker thread, and the Groq
+        and web search clients are stateless HTTP clients. Throughput scales with
+        threads per process (the LLM call is I/O-bound) and with processes,
+        which share the index on disk.
         Args:
             llm_model (str): LLM model name.
-            similarity_threshold (float): Similarity threshold for vector store.
+            similarity_threshold (float): Minimum cosine similarity of retrieved chunks.
             use_semantic_chunking (bool): Whether to use semantic chunking.
             vector_store (Optional[FAISSVectorStore]): Vector store.
-            embeddings (Optional[HuggingFaceEmbeddings]): Embeddings.
+            embeddings (Optional[Embeddings]): Embeddings.
+            web_search (Optional[WebSearch]): Web search, e.g. with a stub client for offline runs.
+            llm_fallback_model (Optional[str]): Model used while the primary one fails,
+                defaults to LLM_FALLBACK_MODEL. LLM calls have a deadline, retries and
+                a circuit breaker per model, see src.resilience.ResilientLLM.
         """
-        self.__prompt = None
         os.environ["LANGCHAIN_API_KEY"] = os.environ.get("LANGSMITH_API_KEY")
         os.environ["LANGCHAIN_ENDPOINT"] = "https://api.smith.langchain.com"
         os.environ["LANGCHAIN_TRACING_V2"] = "true"
         os.environ["LANGCHAIN_PROJECT"] = "ChatDoc"
         try:
             self.similarity_threshold = similarity_threshold
-            self.embeddings = embeddings if embeddings else HuggingFaceEmbeddings(model_name = config.EMBEDDING_MODEL)
+            self.context_builder = ContextBuilder()
+            self.conversation = ConversationContext(token_counter = self.context_builder.token_counter)
+            self.embeddings = embeddings if embeddings else load_embeddings()
 
             self.chunker = RAGChunker(
                 chunk_size = config.CHUNK_SIZE,
@@ -51,75 +77,205 @@ class ChatDocs:
                 embeddings = self.embeddings
             ) if vector_store is None else vector_store.chunker
 
-            self.llm = ChatGroq(
-                model_name = llm_model,
+            self.llm = build_llm(
+                llm_model,
                 temperature = 0.3,
-                groq_api_key = config.GROQ_API_KEY,
+                fallback_model = llm_fallback_model if llm_fallback_model is not None else config.LLM_FALLBACK_MODEL,
             )
 
             self.vector_store = vector_store if vector_store else FAISSVectorStore(
                 index_path = config.INDEX_PATH,
-                use_semantic_chunking = use_semantic_chunking if use_semantic_chunking else config.USER_SEMENTIC_CHUNKING,
+                use_semantic_chunking = use_semantic_chunking if use_semantic_chunking else config.USER_SEMANTIC_CHUNKING,
                 embeddings = self.embeddings,
                 chunker = self.chunker
             )
-            os.environ["TAVILY_API_KEY"] = os.environ.get('TAVILY_API_KEY')
-            self.tool = TavilyClient()
+            self.web_search = web_search if web_search else WebSearch()
+            # The local and web searches of a request run side by side, in separate
+            # pools so that slow web searches never hold up local ones.
+            self.local_pool = ThreadPoolExecutor(max_workers = config.LOCAL_SEARCH_WORKERS, thread_name_prefix = "local-search")
+            self.web_pool = ThreadPoolExecutor(max_workers = config.WEB_SEARCH_WORKERS, thread_name_prefix = "web-search")
 
         except Exception as e:
             logger.error("Error initializing GroqAgent:", e)
 
 
-    def find_similarity_score(self, input: str, k: int = 10, chat_id: Optional[str] = None) -> List[Document]:
+    def find_similarity_score(self, input: str, k: int = 10, chat_id: Optional[str] = None) -> List[Tuple[Document, float]]:
         """
-        Find similarity score between input and vector store, filtered by chat_id.
+        Find the chunks of a chat whose cosine similarity to the input reaches the similarity threshold.
         Args:
             input (str): Input text.
             k (int): Number of results to return.
-            chat_id (Optional[str]): Chat ID to filter documents.
+            chat_id (Optional[str]): Chat ID whose shard is searched.
         Returns:
-            List[Document]: List of similar documents.
+            List[Tuple[Document, float]]: (Document, cosine similarity) pairs, most similar first.
         """
-        # Assume FAISSVectorStore supports metadata filtering
-        filter_dict = {"chat_id": chat_id} if chat_id else None
-        results = self.vector_store.vector_store.similarity_search_with_score(input, k = k, score_threshold = self.similarity_threshold, filter = filter_dict)
-        if not filter_dict:
-            return results
-        return [(doc, score) for doc, score in results if doc.metadata.get("chat_id") == chat_id]
+        return self.vector_store.similarity_search_with_score(input, k = k, score_threshold = self.similarity_threshold, chat_id = chat_id)
 
 
     def get_internet_results(self, query: str, k: int = 10) -> List[Document]:
         """
-        Get results from the internet.
+        Get results from the internet, cached per normalized query.
         Args:
             query (str): Query to search.
             k (int): Number of results to return.
         Returns:
-            List[Document]: List of similar documents.
+            List[Document]: Web pages, best first.
         """
-        return self.tool.search(
-            query,
-            search_depth = "advanced",
-            max_result = 10,
-            k = k
-        )
-    
+        return self.web_search.search(query, k = k)
+
 
     def get_faiss_results(self, query: str, k: int = 10, chat_id: Optional[str] = None) -> List[Document]:
         """
-        Get results from the FAISS vector store, filtered by chat_id.
+        Get results from the FAISS shard of a chat.
         Args:
             query (str): Query to search.
             k (int): Number of results to return.
-            chat_id (Optional[str]): Chat ID to filter documents.
+            chat_id (Optional[str]): Chat ID whose shard is searched.
         Returns:
             List[Document]: List of similar documents.
         """
-        filter_dict = {"chat_id": chat_id} if chat_id else None
-        results = self.vector_store.search(query, k = k, filter = filter_dict)
-        if not filter_dict:
-            return results
-        return [doc for doc in results if doc.metadata.get("chat_id") == chat_id]
+        return self.vector_store.search(query, k = k, chat_id = chat_id)
+
+
+    @staticmethod
+    def cut_on_score_drop(hits: List[Tuple[Document, float]], cutoff: Callable[[float], float]) -> List[Document]:
+        """
+        Keep the hits scoring at least a cutoff derived from the best score.
+        Args:
+            hits (List[Tuple[Document, float]]): (Document, score) pairs, best first.
+            cutoff (Callable[[float], float]): Minimum score as a function of the best score.
+        Returns:
+            List[Document]: Documents above the cutoff, best first.
+        """
+        if not hits:
+            return []
+        minimum = cutoff(hits[0][1])
+        return [doc for doc, score in hits if score >= minimum]
+
+
+    def get_adaptive_results(self, query: str, k: int = 5, chat_id: Optional[str] = None) -> List[Document]:
+        """
+        Get up to k chunks of a chat, stopping early once relevance drops.
+        Dense hits must reach the cosine similarity threshold and stay within ADAPTIVE_K_MAX_DROP of
+        the best hit; BM25 hits must score at least LEXICAL_MIN_RATIO of the best BM25 hit. The
+        survivors are fused by reciprocal rank, so easy questions get a short prompt; the context
+        builder then fits them into CONTEXT_TOKEN_BUDGET.
+        Args:
+            query (str): Query to search.
+            k (int): Maximum number of chunks.
+            chat_id (Optional[str]): Chat ID whose shard is searched.
+        Returns:
+            List[Document]: Selected chunks, best first.
+        """
+        candidates = max(k, config.HYBRID_CANDIDATES)
+        rankings = [self.cut_on_score_drop(
+            self.find_similarity_score(query, k = candidates, chat_id = chat_id),
+            lambda best: best - config.ADAPTIVE_K_MAX_DROP,
+        )]
+        weights = [config.DENSE_WEIGHT]
+        if config.HYBRID_RETRIEVAL:
+            rankings.append(self.cut_on_score_drop(
+                self.vector_store.lexical_search(query, k = candidates, chat_id = chat_id),
+                lambda best: best * config.LEXICAL_MIN_RATIO,
+            ))
+            weights.append(config.LEXICAL_WEIGHT)
+        fused = reciprocal_rank_fusion(
+            rankings,
+            candidates,
+            key = lambda doc: (doc.metadata.get("doc_id"), doc.page_content),
+            weights = weights,
+            rank_constant = config.RRF_K,
+        )
+        selected = fused[:k]
+        logger.info(f"Adaptive retrieval kept {len(selected)} of up to {k} chunks for chat {chat_id}")
+        return selected
+
+
+    @staticmethod
+    def _submit(pool: ThreadPoolExecutor, fn: Callable, *args) -> Tuple[Future, List[float]]:
+        """
+        Run a search in a pool, noting when it leaves the queue.
+        Args:
+            pool (ThreadPoolExecutor): Pool of the search.
+            fn (Callable): Search function.
+            *args: Arguments of the search.
+        Returns:
+            Tuple[Future, List[float]]: The search, and a list that receives its start time.
+        """
+        started: List[float] = []
+
+        def run():
+            started.append(time.monotonic())
+            return fn(*args)
+        return pool.submit(run), started
+
+
+    @staticmethod
+    def _collect(future: Future, started: List[float], timeout: float, source: str, chat_id: Optional[str]) -> List[Document]:
+        """
+        Wait for the results of one search until its deadline, counted from when it starts running.
+        A search still queued after `timeout` seconds is dropped as well.
+        Args:
+            future (Future): Search, as returned by `_submit`.
+            started (List[float]): Start time of the search, filled in once it runs.
+            timeout (float): Seconds the search may run.
+            source (str): Name of the search, for logging.
+            chat_id (Optional[str]): Chat ID, for logging.
+        Returns:
+            List[Document]: Results, or an empty list if the search failed or missed the deadline.
+        """
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                if started:
+                    deadline = started[0] + timeout
+                try:
+                    return future.result(timeout = max(deadline - time.monotonic(), 0.0))
+                except FutureTimeoutError:
+                    if started and started[0] + timeout > time.monotonic():
+                        # It started while we waited; its deadline moved.
+                        continue
+                    raise
+        except FutureTimeoutError:
+            # A search that has not started is dropped; a running one cannot be
+            # interrupted, but its result is discarded (web results still fill the cache).
+            future.cancel()
+            logger.warning(f"{source.capitalize()} search for chat {chat_id} missed its {timeout:.2f}s deadline")
+        except Exception as e:
+            logger.error(f"{source.capitalize()} search for chat {chat_id} failed: {str(e)}")
+        return []
+
+
+    def gather_results(self, query: str, k: int = 5, chat_id: Optional[str] = None) -> Tuple[List[Document], List[Document]]:
+        """
+        Search the chat's documents and the web in parallel, each within its own deadline.
+        Both searches start at once, so a web search costs no latency beyond the slower of the
+        two. With WEB_SEARCH_MODE "fallback" web results are only used when the documents
+        return nothing, and the web search is cancelled as soon as they do; with "always" they
+        are added after the document results; "off" searches the documents only. Deadlines
+        (LOCAL_SEARCH_TIMEOUT, WEB_SEARCH_TIMEOUT) count from when each search starts running,
+        so a search is not timed out for waiting behind other requests' searches.
+        Args:
+            query (str): Query to search.
+            k (int): Maximum number of chunks from the documents.
+            chat_id (Optional[str]): Chat ID whose shard is searched.
+        Returns:
+            Tuple[List[Document], List[Document]]: Document chunks and web results, best first.
+        """
+        started = time.monotonic()
+        local, local_started = self._submit(self.local_pool, self.get_adaptive_results, query, k, chat_id)
+        web = None
+        if config.WEB_SEARCH_MODE in ("fallback", "always"):
+            web, web_started = self._submit(self.web_pool, self.get_internet_results, query, config.WEB_SEARCH_RESULTS)
+        documents = self._collect(local, local_started, config.LOCAL_SEARCH_TIMEOUT, "local", chat_id)
+        if web is None:
+            return documents, []
+        if documents and config.WEB_SEARCH_MODE == "fallback":
+            web.cancel()
+            return documents, []
+        web_results = self._collect(web, web_started, config.WEB_SEARCH_TIMEOUT, "web", chat_id)
+        logger.info(f"Fan-out for chat {chat_id}: {len(documents)} chunks, {len(web_results)} web results in {time.monotonic() - started:.2f}s")
+        return documents, web_results
 
 
     def prompt_template(self) -> PromptTemplate:
@@ -129,63 +285,250 @@ class ChatDocs:
             PromptTemplate: Prompt template.
         """
         return PromptTemplate(
-            input_variables=["input", "context"],
+            input_variables=["input", "context", "history"],
             template="""
                 You are a helpful assistant.
                 Answer the question based on the context below.
+                Use the conversation only to understand what the question refers to.
                 If the context doesn't contain the answer, just say that you don't know.
                 If the answer is not contained within the context, say "I don't know."
+                Conversation: {history}
                 Context: {context}
                 Question: {input}
             """
         )
 
 
-    def find_content(self, query: str, k: int = 5, chat_id: Optional[str] = None) -> PromptTemplate:
+    def standalone_query(self, query: str, history: Optional[Dict[str, Any]] = None) -> str:
         """
-        Find content based on the query, filtered by chat_id.
+        Rewrite a follow-up question into a query that retrieves without the conversation.
         Args:
-            query (str): Query to search.
+            query (str): User question.
+            history (Optional[Dict[str, Any]]): Chat history, see ConversationContext.
+        Returns:
+            str: Standalone retrieval query.
+        """
+        return self.conversation.standalone_query(query, history)
+
+
+    async def astandalone_query(self, query: str, history: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Async `standalone_query` for the ASGI endpoints.
+        Args:
+            query (str): User question.
+            history (Optional[Dict[str, Any]]): Chat history, see ConversationContext.
+        Returns:
+            str: Standalone retrieval query.
+        """
+        return await self.conversation.astandalone_query(query, history)
+
+
+    def find_content(
+        self,
+        query: str,
+        k: int = 5,
+        chat_id: Optional[str] = None,
+        history: Optional[Dict[str, Any]] = None,
+        retrieval_query: Optional[str] = None,
+    ) -> Tuple[str, List[Document]]:
+        """
+        Find content for the query in the FAISS and BM25 indexes of a chat (and on the web, see gather_results) and build the prompt.
+        Args:
+            query (str): User question.
             k (int): Number of results to return.
-            chat_id (Optional[str]): Chat ID to filter documents.
+            chat_id (Optional[str]): Chat ID whose shard is searched.
+            history (Optional[Dict[str, Any]]): Chat history, see ConversationContext.
+            retrieval_query (Optional[str]): Standalone query to search with, rewritten from
+                the question and history if None.
         Returns:
-            PromptTemplate: Formatted prompt with context.
+            Tuple[str, List[Document]]: Formatted prompt with context, and the sources it contains.
         """
+        conversation = self.conversation.format_history(history) or "None."
         try:
-            result = self.get_faiss_results(query, k = k, chat_id = chat_id)
-            context = "\n".join([doc.page_content for doc in result])
-            # context = ""
-            # max_score = 0.0
-            # if result:
-            #     result_with_score = self.find_similarity_score(query, k = k, chat_id = chat_id)
-            #     context = "\n".join([doc.page_content for doc in result_with_score])
-            #     max_score = max([score for _, score in result_with_score], default = 0.0)
-            
-            # if not result or max_score < self.similarity_threshold:
-            #     print("No results found in vector store. Searching internet...")
-            #     internet_results = self.get_internet_results(query, k = k)
-            #     if internet_results:
-            #         context += "\n\nWeb Search Results:\n" + json.dumps(internet_results, indent=4)
-            #     else:
-            #         print("No results found in internet.")
-
-            self.__prompt = self.prompt_template().format(
+            retrieval_query = retrieval_query or self.standalone_query(query, history)
+            self.vector_store.refresh(chat_id)
+            documents, web_results = self.gather_results(retrieval_query, k = k, chat_id = chat_id)
+            context, result, stats = self.context_builder.build(documents + web_results)
+            logger.info(
+                f"Context for chat {chat_id}: {stats['context_tokens']} tokens from {stats['chunks']} chunks "
+                f"in {stats['blocks']} blocks, {stats['saved_tokens']} tokens saved"
+            )
+
+            prompt = self.prompt_template().format(
                 input = query,
-                context = context or "No results found."
+                context = context or "No results found.",
+                history = conversation
             )
+            return prompt, result
 
         except Exception as e:
             logger.error("Error finding content: %s", e)
-            self.__prompt = self.prompt_template().format(
+            prompt = self.prompt_template().format(
                 input = query,
-                context = "Error retrieving documents."
+                context = "Error retrieving documents.",
+                history = conversation
             )
+            return prompt, []
+
+
+    def answer(
+        self,
+        query: str,
+        chat_id: Optional[str] = None,
+        k: int = 5,
+        history: Optional[Dict[str, Any]] = None,
+        retrieval_query: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Answer a query from the documents of a chat.
+        Args:
+            query (str): User question.
+            chat_id (Optional[str]): Chat ID whose shard is searched.
+            k (int): Number of chunks to retrieve.
+            history (Optional[Dict[str, Any]]): Chat history, see ConversationContext.
+            retrieval_query (Optional[str]): Standalone query, rewritten here if None.
+        Returns:
+            Dict[str, Any]: "answer" (str) and "sources" (List[Document]).
+        """
+        prompt, sources = self.find_content(query, k = k, chat_id = chat_id, history = history, retrieval_query = retrieval_query)
+        return {
+            "answer": self.llm.invoke(prompt).content,
+            "sources": sources,
+        }
 
 
-    def run(self) -> str:
+    def stream_answer(
+        self,
+        query: str,
+        chat_id: Optional[str] = None,
+        k: int = 5,
+        history: Optional[Dict[str, Any]] = None,
+        retrieval_query: Optional[str] = None,
+    ) -> Tuple[List[Document], Iterator[str]]:
         """
-        Run the LLM.
+        Answer a query from the documents of a chat, streaming the LLM output.
+
+        Retrieval happens before this returns; the LLM is only called when the
+        returned iterator is consumed.
+        Args:
+            query (str): User question.
+            chat_id (Optional[str]): Chat ID whose shard is searched.
+            k (int): Number of chunks to retrieve.
+            history (Optional[Dict[str, Any]]): Chat history, see ConversationContext.
+            retrieval_query (Optional[str]): Standalone query, rewritten here if None.
+        Returns:
+            Tuple[List[Document], Iterator[str]]: Retrieved sources and the text fragments of the answer.
+        """
+        prompt, sources = self.find_content(query, k = k, chat_id = chat_id, history = history, retrieval_query = retrieval_query)
+        return sources, self._stream(prompt)
+
+
+    def _stream(self, prompt: str) -> Iterator[str]:
+        """
+        Run the LLM on a prompt and yield its output as it is generated.
+        Args:
+            prompt (str): Formatted prompt.
+        Returns:
+            Iterator[str]: Text fragments of the LLM output.
+        """
+        for chunk in self.llm.stream(prompt):
+            if chunk.content:
+                yield chunk.content
+
+
+    async def aanswer(
+        self,
+        query: str,
+        chat_id: Optional[str] = None,
+        k: int = 5,
+        executor: Optional[Executor] = None,
+        history: Optional[Dict[str, Any]] = None,
+        retrieval_query: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Async `answer` for the ASGI endpoints.
+
+        Embedding the query and searching FAISS are CPU-bound and run in
+        `executor`; the LLM call is awaited, so no thread waits on the network.
+        Args:
+            query (str): User question.
+            chat_id (Optional[str]): Chat ID whose shard is searched.
+            k (int): Number of chunks to retrieve.
+            executor (Optional[Executor]): Executor for retrieval, the loop's default if None.
+            history (Optional[Dict[str, Any]]): Chat history, see ConversationContext.
+            retrieval_query (Optional[str]): Standalone query, rewritten here if None.
+        Returns:
+            Dict[str, Any]: "answer" (str) and "sources" (List[Document]).
+        """
+        prompt, sources = await self._afind_content(query, k, chat_id, executor, history, retrieval_query)
+        response = await self.llm.ainvoke(prompt)
+        return {
+            "answer": response.content,
+            "sources": sources,
+        }
+
+
+    async def astream_answer(
+        self,
+        query: str,
+        chat_id: Optional[str] = None,
+        k: int = 5,
+        executor: Optional[Executor] = None,
+        history: Optional[Dict[str, Any]] = None,
+        retrieval_query: Optional[str] = None,
+    ) -> Tuple[List[Document], AsyncIterator[str]]:
+        """
+        Async `stream_answer` for the ASGI endpoints.
+        Args:
+            query (str): User question.
+            chat_id (Optional[str]): Chat ID whose shard is searched.
+            k (int): Number of chunks to retrieve.
+            executor (Optional[Executor]): Executor for retrieval, the loop's default if None.
+            history (Optional[Dict[str, Any]]): Chat history, see ConversationContext.
+            retrieval_query (Optional[str]): Standalone query, rewritten here if None.
+        Returns:
+            Tuple[List[Document], AsyncIterator[str]]: Retrieved sources and the text fragments of the answer.
+        """
+        prompt, sources = await self._afind_content(query, k, chat_id, executor, history, retrieval_query)
+        return sources, self._astream(prompt)
+
+
+    async def _afind_content(
+        self,
+        query: str,
+        k: int,
+        chat_id: Optional[str],
+        executor: Optional[Executor],
+        history: Optional[Dict[str, Any]],
+        retrieval_query: Optional[str],
+    ) -> Tuple[str, List[Document]]:
+        """
+        Async `find_content`: the query rewrite is awaited, retrieval runs in `executor`.
+        Args:
+            query (str): User question.
+            k (int): Number of chunks to retrieve.
+            chat_id (Optional[str]): Chat ID whose shard is searched.
+            executor (Optional[Executor]): Executor for retrieval, the loop's default if None.
+            history (Optional[Dict[str, Any]]): Chat history, see ConversationContext.
+            retrieval_query (Optional[str]): Standalone query, rewritten here if None.
+        Returns:
+            Tuple[str, List[Document]]: Formatted prompt with context, and the sources it contains.
+        """
+        retrieval_query = retrieval_query or await self.astandalone_query(query, history)
+        return await asyncio.get_running_loop().run_in_executor(
+            executor,
+            functools.partial(self.find_content, query, k = k, chat_id = chat_id, history = history, retrieval_query = retrieval_query),
+        )
+
+
+    async def _astream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Run the LLM on a prompt asynchronously and yield its output as it is generated.
+        Args:
+            prompt (str): Formatted prompt.
         Returns:
-            str: LLM output.
+            AsyncIterator[str]: Text fragments of the LLM output.
         """
-        return self.llm.invoke(self.__prompt).content
\ No newline at end of file
+        async for chunk in self.llm.astream(prompt):
+            if chunk.content:
+                yield chunk.content
@@ -1,14 +1,358 @@
-from typing import Optional, List, Dict
-from langchain_community.vectorstores import FAISS
+from typing import Optional, List, Dict, Tuple, Set, Iterator, Iterable, Callable, Union
 from langchain.docstore.document import Document
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+from src.embeddings import load_embeddings
 from src.chunking import RAGChunker
+from src.lexical import LexicalIndex, LexicalSegment
+from src.ann import METRIC, normalize, to_cosine, resolve_index_type, build_index, configure_index, save_template, load_template
+from src.persistence import WriteAheadLog, SnapshotManager, Segment, WAL_FILE, LOCK_FILE, file_lock, encode_vectors, decode_vectors, serialize_document
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from collections import OrderedDict
 from Configuration import config
+import numpy as np
 import logging
+import shutil
+import threading
+import copy
+import json
+import uuid
+import time
+import faiss
 import os
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_SHARD = "_default"
+
+class IndexShard:
+
+
+    def __init__(self, dimension: int, base: Optional[Segment] = None):
+        """
+        FAISS index of a single chat with stable integer IDs per chunk.
+
+        The shard is a read-only, memory-mapped base segment loaded from the
+        last snapshot plus an in-memory delta holding the chunks added since.
+        Vectors are normalized to unit length and compared by inner product,
+        so every score is a cosine similarity (higher is better); bases written
+        before the switch from L2 are converted until their next compaction.
+        Chunks are stored in an `IndexIDMap2` so delta chunks can be removed
+        natively with `remove_ids`; chunks of the base segment are tombstoned
+        until the next compaction. `doc_map` tracks which chunk IDs belong to
+        each document, and `lexical` is a BM25 index of the same chunks with
+        the same base/delta layout.
+
+        Args:
+            dimension (int): Dimension of the embedding vectors.
+            base (Optional[Segment]): Snapshot segment the shard starts from.
+        """
+        self.dimension = dimension
+        self.base = base
+        self.tombstones: Set[int] = set()
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        self.docstore: Dict[int, Document] = {}
+        self.vectors: Dict[int, np.ndarray] = {}
+        self.doc_map: Dict[str, List[int]] = {doc_id: list(ids) for doc_id, ids in base.doc_map.items()} if base else {}
+        self.next_id = base.meta["next_id"] if base else 0
+        self.seq = base.meta["seq"] if base else 0
+        self.snapshot: Optional[str] = None
+        self.incarnation: Optional[str] = None
+        self.wal_inode: Optional[int] = None
+        self.wal_offset = 0
+        if base is not None and LexicalSegment.exists(base.path):
+            self.lexical = LexicalIndex(base.ids, LexicalSegment(base.path))
+        else:
+            self.lexical = LexicalIndex()
+            # Snapshots written before the lexical index existed are indexed in memory.
+            for position, chunk_id in enumerate(base.ids.tolist() if base is not None else []):
+                self.lexical.add(chunk_id, json.loads(base.raw_document(position))["page_content"])
+
+
+    @property
+    def generation(self) -> str:
+        """
+        Version of the shard's contents, never repeated by a later shard of the same chat.
+        """
+        return f"{self.incarnation}:{self.seq}"
+
+
+    def add(self, vectors: np.ndarray, documents: List[Document], ids: Optional[List[int]] = None) -> List[int]:
+        """
+        Add chunk vectors and their documents to the shard.
+
+        Args:
+            vectors (np.ndarray): Chunk vectors, one row per document.
+            documents (List[Document]): Chunk documents.
+            ids (Optional[List[int]]): Chunk IDs to use, e.g. when replaying the log.
+
+        Returns:
+            List[int]: IDs assigned to the chunks.
+        """
+        if ids is None:
+            ids = range(self.next_id, self.next_id + len(documents))
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids):
+            self.next_id = max(self.next_id, int(ids.max()) + 1)
+        vectors = normalize(vectors)
+        self.index.add_with_ids(vectors, ids)
+        for chunk_id, vector, doc in zip(ids.tolist(), vectors, documents):
+            self.docstore[chunk_id] = doc
+            self.vectors[chunk_id] = vector
+            self.doc_map.setdefault(doc.metadata.get("doc_id"), []).append(chunk_id)
+            self.lexical.add(chunk_id, doc.page_content)
+        return ids.tolist()
+
+
+    def remove(self, doc_ids: List[str]) -> int:
+        """
+        Remove every chunk of the given documents from the shard.
+
+        Args:
+            doc_ids (List[str]): IDs of documents to remove.
+
+        Returns:
+            int: Number of chunks removed.
+        """
+        chunk_ids = []
+        for doc_id in doc_ids:
+            chunk_ids.extend(self.doc_map.pop(doc_id, []))
+        if not chunk_ids:
+            return 0
+        for chunk_id in chunk_ids:
+            self.lexical.remove(chunk_id)
+        delta_ids = [chunk_id for chunk_id in chunk_ids if chunk_id in self.docstore]
+        if delta_ids:
+            self.index.remove_ids(np.asarray(delta_ids, dtype=np.int64))
+            for chunk_id in delta_ids:
+                self.docstore.pop(chunk_id, None)
+                self.vectors.pop(chunk_id, None)
+        self.tombstones.update(set(chunk_ids) - set(delta_ids))
+        return len(chunk_ids)
+
+
+    def document(self, chunk_id: int) -> Optional[Document]:
+        """
+        Look up a chunk document in the delta or the base segment.
+
+        Args:
+            chunk_id (int): Chunk ID.
+
+        Returns:
+            Optional[Document]: Chunk document, or None if it was removed.
+        """
+        if chunk_id in self.docstore:
+            return self.docstore[chunk_id]
+        if self.base is None or chunk_id in self.tombstones:
+            return None
+        return self.base.document(chunk_id)
+
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[Document, float]]:
+        """
+        Search the shard for the nearest chunks of a query vector.
+
+        Args:
+            vector (np.ndarray): Query vector.
+            k (int): Number of chunks to retrieve.
+
+        Returns:
+            List[Tuple[Document, float]]: (Document, cosine similarity) pairs, most similar first.
+        """
+        return [(self.document(chunk_id), score) for chunk_id, score in self.search_ids(vector, k)]
+
+
+    def search_ids(self, vector: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """
+        Search the shard for the IDs of the nearest chunks of a query vector.
+
+        Args:
+            vector (np.ndarray): Query vector.
+            k (int): Number of chunks to retrieve.
+
+        Returns:
+            List[Tuple[int, float]]: (chunk ID, cosine similarity) pairs, most similar first.
+        """
+        query = normalize(vector).reshape(1, -1)
+        hits = []
+        if self.base is not None:
+            metric = self.base.meta.get("metric", "l2")
+            hits.extend(
+                (chunk_id, to_cosine(score, metric))
+                for chunk_id, score in self.base.search(query, k + len(self.tombstones))
+                if chunk_id not in self.tombstones
+            )
+        if self.index.ntotal:
+            scores, ids = self.index.search(query, min(k, self.index.ntotal))
+            hits.extend(
+                (chunk_id, float(score))
+                for chunk_id, score in zip(ids[0].tolist(), scores[0].tolist())
+                if chunk_id != -1
+            )
+        hits.sort(key=lambda hit: -hit[1])
+        return hits[:k]
+
+
+    def search_text(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """
+        Search the shard's BM25 index.
+
+        Args:
+            query (str): Query text.
+            k (int): Number of chunks to retrieve.
+
+        Returns:
+            List[Tuple[int, float]]: (chunk ID, BM25 score) pairs, best first.
+        """
+        return self.lexical.search(query, k, exclude=self.tombstones)
+
+
+    def apply(self, record: Dict) -> None:
+        """
+        Apply a write-ahead log record to the shard.
+
+        Args:
+            record (Dict): "add" or "delete" record written by FAISSVectorStore.
+        """
+        if record["op"] == "add":
+            documents = [
+                Document(page_content=doc["page_content"], metadata=doc["metadata"])
+                for doc in record["documents"]
+            ]
+            self.add(decode_vectors(record["vectors"], self.dimension), documents, ids=record["ids"])
+        elif record["op"] == "delete":
+            self.remove(record["doc_ids"])
+        self.seq = record["seq"]
+
+
+    def __len__(self) -> int:
+        base_count = len(self.base) - len(self.tombstones) if self.base is not None else 0
+        return base_count + self.index.ntotal
+
+
+    def save(self, path: str, index_type: str = "flat", template: Optional[faiss.Index] = None, pinned_index_type: Optional[str] = None) -> None:
+        """
+        Merge the base segment and the delta into a new segment directory.
+
+        Args:
+            path (str): Segment directory.
+            index_type (str): Type of the segment's FAISS index (see `src.ann`).
+            template (Optional[faiss.Index]): Trained, empty index of that type to fill instead of training one.
+            pinned_index_type (Optional[str]): Index type chosen for this shard with
+                `FAISSVectorStore.reindex`, kept by later compactions.
+        """
+        ids, vectors, records, texts = [], [], [], []
+        if self.base is not None:
+            for position, chunk_id in enumerate(self.base.ids.tolist()):
+                if chunk_id in self.tombstones:
+                    continue
+                ids.append(chunk_id)
+                vectors.append(self.base.vectors[position])
+                records.append(self.base.raw_document(position))
+                texts.append(json.loads(records[-1])["page_content"])
+        for chunk_id in sorted(self.docstore):
+            ids.append(chunk_id)
+            vectors.append(self.vectors[chunk_id])
+            records.append(serialize_document(self.docstore[chunk_id]))
+            texts.append(self.docstore[chunk_id].page_content)
+
+        vectors = normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimension))
+        index = build_index(index_type, self.dimension, np.asarray(ids, dtype=np.int64), vectors, template)
+        meta = {"next_id": self.next_id, "seq": self.seq, "index_type": index_type, "metric": METRIC}
+        if pinned_index_type:
+            meta["pinned_index_type"] = pinned_index_type
+        Segment.write(path, self.dimension, ids, vectors, records, self.doc_map, meta, index=index)
+        save_template(path, index, index_type)
+        LexicalSegment.write(path, texts)
+
+
+    @classmethod
+    def load(cls, path: str) -> "IndexShard":
+        """
+        Open a shard on top of a memory-mapped segment written with `save`.
+
+        Args:
+            path (str): Segment directory.
+
+        Returns:
+            IndexShard: Loaded shard.
+        """
+        base = Segment(path)
+        if base.index is not None:
+            configure_index(base.index, base.meta.get("index_type", "flat"))
+        return cls(base.dimension, base)
+
+
+    def freeze(self) -> "IndexShard":
+        """
+        Copy the shard's state so it can be saved while writes go on.
+
+        The base segment is immutable and shared; the delta containers are copied.
+
+        Returns:
+            IndexShard: Snapshot of the shard, only to be saved.
+        """
+        frozen = copy.copy(self)
+        frozen.tombstones = set(self.tombstones)
+        frozen.docstore = dict(self.docstore)
+        frozen.vectors = dict(self.vectors)
+        frozen.doc_map = {doc_id: list(ids) for doc_id, ids in self.doc_map.items()}
+        return frozen
+
+
+class CacheStats:
+
+
+    def __init__(self):
+        """
+        Thread-safe hit/miss counters of a cache, with the time its hits saved.
+
+        Time saved is estimated as the mean cost of a miss minus the actual cost
+        of each hit.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.hit_ms = 0.0
+        self.miss_ms = 0.0
+        self._lock = threading.Lock()
+
+
+    def record(self, hit: bool, elapsed_ms: float) -> None:
+        """
+        Count a lookup.
+
+        Args:
+            hit (bool): Whether the cache answered it.
+            elapsed_ms (float): Time the lookup took, including the work done on a miss.
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.hit_ms += elapsed_ms
+            else:
+                self.misses += 1
+                self.miss_ms += elapsed_ms
+
+
+    def as_dict(self) -> Dict[str, float]:
+        """
+        Current counters.
+
+        Returns:
+            Dict[str, float]: Hits, misses, hit ratio, mean miss cost and milliseconds saved.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            mean_miss_ms = self.miss_ms / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "mean_miss_ms": mean_miss_ms,
+                "saved_ms": max(self.hits * mean_miss_ms - self.hit_ms, 0.0),
+            }
+
+
 class FAISSVectorStore:
 
 
@@ -16,98 +360,567 @@ class FAISSVectorStore:
         self,
         index_path: str,
         use_semantic_chunking: bool = None,
-        embeddings: Optional[HuggingFaceEmbeddings] = None,
+        embeddings: Optional[Embeddings] = None,
         chunker: Optional[RAGChunker] = None,
+        result_cache = None,
+        index_type: Optional[str] = None,
     ):
         """
-        Initialize the FAISS vector store.
-        
+        Initialize the sharded FAISS vector store.
+
+        Every chat gets its own small FAISS index stored under `index_path/<chat_id>`.
+        Shards are loaded lazily on first use and cached in memory. Writes are
+        appended to the shard's write-ahead log and periodically compacted into
+        an immutable snapshot (see `src.persistence`).
+
+        Several processes (the Flask app and Celery workers) may share the same
+        `index_path`. Writers serialize on a per-shard file lock and bump the
+        generation in the shard manifest; readers call `refresh` to pick up
+        other processes' writes without taking any lock.
+
+        Within a process, every shard has its own lock, held only while that
+        shard is searched, refreshed or written. Requests for different chats
+        never wait on each other, and a slow write (fsync, compaction) only
+        delays queries on the same chat.
+
+        Snapshots of shards with at least ANN_MIN_CHUNKS chunks get an
+        approximate index of `index_type` (see `src.ann`). Compaction only
+        fills an index that is already trained; training and HNSW builds run in
+        a background re-index, which publishes the new snapshot atomically
+        through the manifest while writes continue.
+
         Args:
-            index_path (str): Path to store/load the FAISS index.
+            index_path (str): Root directory holding one FAISS index per chat.
             use_semantic_chunking (bool): Whether to use semantic chunking.
-            embeddings (Optional[HuggingFaceEmbeddings]): Embeddings model.
+            embeddings (Optional[Embeddings]): Embeddings model.
             chunker (Optional[RAGChunker]): Text chunker.
+            result_cache: Optional cache of search results shared between
+                processes, with `get(chat_id, generation, query, k)` and
+                `set(chat_id, generation, query, k, results)` methods
+                (see `modules.retrieval_cache.RetrievalCache`).
+            index_type (Optional[str]): "flat", "ivf_flat", "ivf_pq" or "hnsw",
+                defaults to INDEX_TYPE. `reindex` can pin another type per shard.
         """
         self.index_path = index_path
-        self.use_semantic_chunking = use_semantic_chunking if use_semantic_chunking is not None else config.USER_SEMENTIC_CHUNKING
+        self.index_type = index_type or config.INDEX_TYPE
+        resolve_index_type(self.index_type, 0)
+        self.use_semantic_chunking = use_semantic_chunking if use_semantic_chunking is not None else config.USER_SEMANTIC_CHUNKING
+        self.shards: Dict[str, IndexShard] = {}
+        self._lock = threading.Lock()
+        self._shard_locks: Dict[str, threading.RLock] = {}
+        self.result_cache = result_cache
+        self._query_vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_lock = threading.Lock()
+        self.query_vector_stats = CacheStats()
+        self.result_stats = CacheStats()
+        self._reindexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reindex")
+        self._reindexing: Set[str] = set()
 
         try:
-            self.embeddings = embeddings if embeddings else HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL)
+            self.embeddings = embeddings if embeddings else load_embeddings()
             self.chunker = chunker if chunker else RAGChunker(
                 chunk_size = config.CHUNK_SIZE,
                 chunk_overlap = config.CHUNK_OVERLAP,
                 use_semantic_chunking = self.use_semantic_chunking,
                 embeddings = self.embeddings
             )
-            self.vector_store = self.load_index()
+            os.makedirs(self.index_path, exist_ok = True)
 
         except Exception as e:
             logger.error(f"Error initializing FAISSVectorStore: {e}")
             raise
 
 
-    def load_index(self) -> FAISS:
+    def _shard_key(self, chat_id: Optional[str]) -> str:
+        """
+        Key of the shard holding the given chat's vectors.
+
+        Args:
+            chat_id (Optional[str]): Chat ID, or None for the default shard.
+
+        Returns:
+            str: Shard key.
+        """
+        return str(chat_id) if chat_id else DEFAULT_SHARD
+
+
+    def _shard_path(self, chat_id: Optional[str]) -> str:
         """
-        Load the FAISS index from the specified path.
+        Directory of the shard holding the given chat's vectors.
+
+        Args:
+            chat_id (Optional[str]): Chat ID, or None for the default shard.
 
         Returns:
-            FAISS: Loaded FAISS index.
+            str: Shard directory.
         """
-        try:
-            if os.path.exists(self.index_path):
-                return FAISS.load_local(self.index_path, self.embeddings, allow_dangerous_deserialization=True)
-            else:
-                return FAISS.from_texts([""], self.embeddings)
-        
-        except Exception as e:
-            logger.error(f"Error loading index: {e}")
-            raise
+        shard_key = self._shard_key(chat_id)
+        if os.sep in shard_key or shard_key in (".", ".."):
+            raise ValueError(f"Invalid chat ID for shard: {chat_id}")
+        return os.path.join(self.index_path, shard_key)
+
+
+    def _shard_lock(self, chat_id: Optional[str]) -> threading.RLock:
+        """
+        In-process lock of the shard of a chat.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
 
+        Returns:
+            threading.RLock: Shard lock, created on first use.
+        """
+        shard_key = self._shard_key(chat_id)
+        with self._lock:
+            return self._shard_locks.setdefault(shard_key, threading.RLock())
 
-    def add_documents(self, texts: List[str], metadatas: Optional[List[Dict]] = None) -> None:
+
+    def _wal(self, chat_id: Optional[str]) -> WriteAheadLog:
         """
-        Add documents to the FAISS index.
+        Write-ahead log of the shard of a chat.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
+
+        Returns:
+            WriteAheadLog: Shard log.
+        """
+        return WriteAheadLog(os.path.join(self._shard_path(chat_id), WAL_FILE))
+
+
+    def _open_shard(self, chat_id: Optional[str]) -> Optional[IndexShard]:
+        """
+        Open a shard from its manifest: map the current snapshot and replay the log on top.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
+
+        Returns:
+            Optional[IndexShard]: Opened shard, or None if the chat has no indexed documents.
+        """
+        snapshots = SnapshotManager(self._shard_path(chat_id))
+        for attempt in range(3):
+            manifest = snapshots.current() or {"snapshot": None}
+            try:
+                shard = IndexShard.load(snapshots.snapshot_path(manifest["snapshot"])) if manifest["snapshot"] else None
+            except FileNotFoundError:
+                # The snapshot was compacted away between reading the manifest and opening it.
+                continue
+            if shard is not None:
+                shard.snapshot = manifest["snapshot"]
+            shard = self._replay(chat_id, shard)
+            if shard is not None:
+                shard.incarnation = manifest.get("incarnation")
+            return shard
+        raise RuntimeError(f"Shard for chat {chat_id} keeps changing while opening")
+
+
+    def _replay(self, chat_id: Optional[str], shard: Optional[IndexShard]) -> Optional[IndexShard]:
+        """
+        Apply the log records written after the shard's current position.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
+            shard (Optional[IndexShard]): Shard to bring up to date, or None to start from an empty one.
+
+        Returns:
+            Optional[IndexShard]: Updated shard, or None if there is nothing to replay into.
+        """
+        wal = self._wal(chat_id)
+        inode = wal.inode()
+        offset = shard.wal_offset if shard is not None and shard.wal_inode == inode else 0
+        for record, offset in wal.records(offset):
+            if shard is None:
+                if "dim" not in record:
+                    continue
+                shard = IndexShard(record["dim"])
+            if record["seq"] > shard.seq:
+                shard.apply(record)
+        if shard is not None:
+            shard.wal_inode = inode
+            shard.wal_offset = offset
+        return shard
+
+
+    def refresh(self, chat_id: Optional[str] = None) -> None:
+        """
+        Pick up writes made to a chat's shard by other processes.
+
+        Reads the small manifest only. If the generation moved, the new log
+        tail is replayed, or the newer snapshot is mapped in when the shard was
+        compacted in the meantime. The query path never takes a lock on disk.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
+        """
+        shard_key = self._shard_key(chat_id)
+        with self._shard_lock(chat_id):
+            shard = self.shards.get(shard_key)
+            if shard is None:
+                return
+            try:
+                manifest = SnapshotManager(self._shard_path(chat_id)).current()
+                if manifest is None:
+                    self.shards.pop(shard_key, None)
+                    return
+                # A shard deleted and rebuilt by another process can be back at the same sequence number.
+                same_shard = manifest.get("incarnation") == shard.incarnation
+                if same_shard and manifest["generation"] == shard.seq:
+                    return
+                if same_shard and manifest["snapshot"] == shard.snapshot and shard.wal_inode == self._wal(chat_id).inode():
+                    self._replay(chat_id, shard)
+                    if shard.seq >= manifest["generation"]:
+                        return
+                self.shards[shard_key] = self._open_shard(chat_id)
+                logger.info(f"Reloaded index for chat {chat_id} at generation {manifest['generation']}")
+
+            except Exception as e:
+                logger.error(f"Error refreshing index for chat {chat_id}: {e}")
+                self.shards.pop(shard_key, None)
+
+
+    def generation(self, chat_id: Optional[str] = None) -> str:
+        """
+        Current generation of a chat's shard, changed by every write.
+
+        It combines the shard's incarnation with its sequence number, so it
+        never comes back after the shard is deleted and rebuilt, and can key
+        caches of the shard's search results and answers.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
+
+        Returns:
+            str: Generation, or "0" if the chat has no index.
+        """
+        manifest = SnapshotManager(self._shard_path(chat_id)).current()
+        return f"{manifest.get('incarnation')}:{manifest['generation']}" if manifest else "0"
+
+
+    def load_index(self, chat_id: Optional[str] = None) -> Optional[IndexShard]:
+        """
+        Load the FAISS shard of a chat, using the in-memory copy when available.
+
+        The current snapshot is mapped first and the log records written after
+        it are replayed on top.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
+
+        Returns:
+            Optional[IndexShard]: Loaded shard, or None if the chat has no indexed documents.
+        """
+        shard_key = self._shard_key(chat_id)
+        with self._shard_lock(chat_id):
+            if shard_key in self.shards:
+                return self.shards[shard_key]
+            try:
+                if not os.path.exists(self._shard_path(chat_id)):
+                    return None
+                shard = self._open_shard(chat_id)
+                if shard is not None:
+                    self.shards[shard_key] = shard
+                return shard
+
+            except Exception as e:
+                logger.error(f"Error loading index for chat {chat_id}: {e}")
+                raise
+
+
+    @contextmanager
+    def _writing(self, chat_id: Optional[str]) -> Iterator[Optional[IndexShard]]:
+        """
+        Hold the shard's in-process and on-disk writer locks, yielding the up-to-date shard.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
+
+        Yields:
+            Optional[IndexShard]: Shard, or None if the chat has no index yet.
+        """
+        with self._shard_lock(chat_id), file_lock(os.path.join(self._shard_path(chat_id), LOCK_FILE)):
+            self.refresh(chat_id)
+            yield self.load_index(chat_id)
+
+
+    def add_documents(
+        self,
+        texts: List[str],
+        metadatas: Optional[List[Dict]] = None,
+        progress: Optional[Callable[[str, int, int], None]] = None,
+    ) -> None:
+        """
+        Add documents to the FAISS shards of their chats (`chat_id` metadata key).
 
         Args:
             texts (List[str]): List of document texts.
             metadatas (Optional[List[Dict]]): List of metadata dictionaries.
+            progress (Optional[Callable[[str, int, int], None]]): Called with
+                (stage, done, total) as the documents go through the
+                "chunking" and "embedding" stages.
         """
         try:
             metadatas = metadatas or [{} for _ in texts]
             if len(texts) != len(metadatas):
                 raise ValueError("Number of texts and metadatas must match")
 
+            documents = [
+                Document(page_content=text, metadata=metadata)
+                for text, metadata in zip(texts, metadatas)
+            ]
+            if progress:
+                progress("chunking", 0, len(documents))
             if self.use_semantic_chunking:
-                documents = [
-                    Document(page_content=text, metadata=metadata)
-                    for text, metadata in zip(texts, metadatas)
-                ]
-                chunks = self.chunker.chunk_documents(documents)
-                self.vector_store.add_documents(chunks)
+                chunks = list(self.chunker.iter_chunks_with_vectors(documents))
             else:
-                self.vector_store.add_texts(texts, metadatas)
-            self._save_index()
-            logger.info("Documents added successfully.")
+                chunks = documents
+            self.add_chunks(chunks, progress = progress, total = len(chunks))
 
         except Exception as e:
             logger.error(f"Error adding documents: {e}")
             raise
 
 
-    def _save_index(self) -> None:
+    def add_chunks(
+        self,
+        chunks: Iterable[Union[Document, Tuple[Document, Optional[np.ndarray]]]],
+        progress: Optional[Callable[[str, int, int], None]] = None,
+        total: int = 0,
+    ) -> int:
+        """
+        Embed and index a stream of chunks in batches of EMBEDDING_BATCH_SIZE.
+
+        Chunks are consumed lazily, so a generator pipeline (pages -> chunks ->
+        vectors) never holds more than one batch in memory. Each batch is
+        logged as one write per shard.
+
+        Chunks may come with a precomputed vector (see
+        `RAGChunker.iter_chunks_with_vectors`); only chunks without one are
+        sent to the embeddings model.
+
+        Args:
+            chunks (Iterable[Union[Document, Tuple[Document, Optional[np.ndarray]]]]):
+                Chunks with `chat_id` metadata, optionally paired with their vectors.
+            progress (Optional[Callable[[str, int, int], None]]): Called with
+                ("embedding", done, total) after every batch.
+            total (int): Expected number of chunks, or 0 if unknown.
+
+        Returns:
+            int: Number of chunks indexed.
         """
-        Save the FAISS index to the specified path.
+        done = 0
+        batch: List[Tuple[Document, Optional[np.ndarray]]] = []
+        for chunk in chunks:
+            batch.append(chunk if isinstance(chunk, tuple) else (chunk, None))
+            if len(batch) >= config.EMBEDDING_BATCH_SIZE:
+                self._add_batch(batch)
+                done += len(batch)
+                batch = []
+                if progress:
+                    progress("embedding", done, total)
+        if batch:
+            self._add_batch(batch)
+            done += len(batch)
+            if progress:
+                progress("embedding", done, total)
+        logger.info(f"Indexed {done} chunks.")
+        return done
+
+
+    def _add_batch(self, chunks: List[Tuple[Document, Optional[np.ndarray]]]) -> None:
+        """
+        Embed a batch of chunks and write them to the shards of their chats.
+
+        Args:
+            chunks (List[Tuple[Document, Optional[np.ndarray]]]): Chunks with
+                `chat_id` metadata and their precomputed vectors (or None).
+        """
+        by_chat: Dict[Optional[str], List[Tuple[Document, Optional[np.ndarray]]]] = {}
+        for chunk, vector in chunks:
+            by_chat.setdefault(chunk.metadata.get("chat_id"), []).append((chunk, vector))
+
+        for chat_id, pairs in by_chat.items():
+            chat_chunks = [chunk for chunk, _ in pairs]
+            vectors = self._chunk_vectors(pairs)
+            with self._writing(chat_id) as shard:
+                if shard is None:
+                    shard = IndexShard(vectors.shape[1])
+                    self.shards[self._shard_key(chat_id)] = shard
+                self._write(chat_id, shard, {
+                    "op": "add",
+                    "dim": int(vectors.shape[1]),
+                    "ids": list(range(shard.next_id, shard.next_id + len(chat_chunks))),
+                    "vectors": encode_vectors(vectors),
+                    "documents": [
+                        {"page_content": chunk.page_content, "metadata": chunk.metadata}
+                        for chunk in chat_chunks
+                    ],
+                })
+
+
+    def _chunk_vectors(self, pairs: List[Tuple[Document, Optional[np.ndarray]]]) -> np.ndarray:
+        """
+        Vectors of a batch of chunks, embedding only the chunks without a precomputed vector.
+
+        Args:
+            pairs (List[Tuple[Document, Optional[np.ndarray]]]): Chunks and their vectors (or None).
+
+        Returns:
+            np.ndarray: One float32 row per chunk.
+        """
+        missing = [i for i, (_, vector) in enumerate(pairs) if vector is None]
+        embedded = self.embeddings.embed_documents([pairs[i][0].page_content for i in missing]) if missing else []
+        vectors = [vector for _, vector in pairs]
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+        return np.asarray(vectors, dtype=np.float32)
+
+
+    def _write(self, chat_id: Optional[str], shard: IndexShard, record: Dict) -> None:
+        """
+        Append a record to the shard's log, apply it, and publish the new generation.
+
+        The log is compacted once it grows too large. Must be called inside `_writing`.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
+            shard (IndexShard): Up-to-date shard.
+            record (Dict): "add" or "delete" record without its sequence number.
+
+        Raises:
+            RuntimeError: If the appended record is not replayed, so the write is never reported as stored when it is not.
+        """
+        record["seq"] = shard.seq + 1
+        wal = self._wal(chat_id)
+        wal.recover(shard.wal_offset if shard.wal_inode == wal.inode() else 0)
+        wal.append(record)
+        self._replay(chat_id, shard)
+        if shard.seq != record["seq"]:
+            raise RuntimeError(f"Log record {record['seq']} of chat {chat_id} was written but could not be read back")
+        shard.incarnation = SnapshotManager(self._shard_path(chat_id)).publish(
+            shard.seq, shard.snapshot, shard.base.meta["seq"] if shard.base else 0, shard.incarnation
+        )
+        if wal.size() >= config.WAL_COMPACT_BYTES:
+            self._compact(chat_id, shard)
+
+
+    def _compact(self, chat_id: Optional[str], shard: IndexShard) -> None:
+        """
+        Write the shard as a new snapshot, publish it, then truncate the log.
+
+        Must be called inside `_writing`.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
+            shard (IndexShard): Up-to-date shard.
+        """
+        snapshots = SnapshotManager(self._shard_path(chat_id))
+        pinned = shard.base.meta.get("pinned_index_type") if shard.base else None
+        index_type = resolve_index_type(pinned or self.index_type, len(shard))
+        template = None
+        if index_type != "flat" and shard.base is not None and shard.base.meta.get("index_type") == index_type and shard.base.meta.get("metric") == METRIC:
+            template = load_template(shard.base.path)
+        if index_type != "flat" and template is None:
+            # Training (or building an HNSW graph) would hold the writer lock for too long.
+            self._schedule_reindex(chat_id)
+            index_type = "flat"
+        # The snapshot is on disk before the manifest points at it, and the
+        # manifest is on disk before the log that could rebuild it is emptied.
+        name = snapshots.write(shard.seq, lambda path: shard.save(path, index_type, template, pinned))
+        snapshots.publish(shard.seq, name, shard.seq, shard.incarnation)
+        self._wal(chat_id).truncate()
+        snapshots.remove_stale(name)
+        self.shards[self._shard_key(chat_id)] = self._open_shard(chat_id)
+
+
+    def compact(self, chat_id: Optional[str] = None) -> None:
+        """
+        Write the shard of a chat as a new snapshot and truncate its log.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
         """
         try:
-            os.makedirs(os.path.dirname(self.index_path), exist_ok = True)
-            self.vector_store.save_local(self.index_path)
-            logger.info("Index saved successfully.")
+            with self._writing(chat_id) as shard:
+                if shard is None:
+                    return
+                self._compact(chat_id, shard)
+            logger.info(f"Index compacted successfully for chat {chat_id}.")
         except Exception as e:
-            logger.error(f"Error saving index: {e}")
+            logger.error(f"Error compacting index: {e}")
             raise
 
 
-    def update_documents(self, doc_ids: List[str], texts: List[str], metadatas: Optional[List[Dict]] = None) -> None:
+    def reindex(self, chat_id: Optional[str] = None, index_type: Optional[str] = None) -> bool:
+        """
+        Rebuild a chat's snapshot with a trained approximate index and swap it in.
+
+        The shard is frozen and the new index trained without holding any lock.
+        The new snapshot is then published under the writer lock, with the log
+        records written in the meantime replayed on top of it. If the shard was
+        compacted while training, the result is discarded; that compaction
+        schedules a new re-index if one is still needed.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
+            index_type (Optional[str]): Index type to pin for this shard; by default
+                the store's type, applied once the shard passes ANN_MIN_CHUNKS.
+
+        Returns:
+            bool: Whether a new snapshot was published.
+        """
+        self.refresh(chat_id)
+        shard = self.load_index(chat_id)
+        if shard is None:
+            return False
+        with self._shard_lock(chat_id):
+            frozen = shard.freeze()
+        pinned = index_type or (frozen.base.meta.get("pinned_index_type") if frozen.base else None)
+        target = index_type or resolve_index_type(pinned or self.index_type, len(frozen))
+        resolve_index_type(target, 0)
+
+        started = time.perf_counter()
+        snapshots = SnapshotManager(self._shard_path(chat_id))
+        name = snapshots.write(frozen.seq, lambda path: frozen.save(path, target, None, pinned), tag=uuid.uuid4().hex[:8])
+        with self._writing(chat_id) as current:
+            manifest = snapshots.current()
+            if current is None or manifest is None or manifest["snapshot"] != frozen.snapshot:
+                shutil.rmtree(snapshots.snapshot_path(name), ignore_errors=True)
+                logger.info(f"Discarded re-index of chat {chat_id}: the shard was compacted meanwhile")
+                return False
+            snapshots.publish(manifest["generation"], name, frozen.seq, manifest.get("incarnation"))
+            snapshots.remove_stale(name)
+            self.shards[self._shard_key(chat_id)] = self._open_shard(chat_id)
+        logger.info(f"Re-indexed chat {chat_id} as {target} ({len(frozen)} chunks) in {time.perf_counter() - started:.1f}s")
+        return True
+
+
+    def _schedule_reindex(self, chat_id: Optional[str]) -> None:
+        """
+        Run `reindex` for a chat in the background, once at a time per shard.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
+        """
+        shard_key = self._shard_key(chat_id)
+        with self._lock:
+            if shard_key in self._reindexing:
+                return
+            self._reindexing.add(shard_key)
+
+        def run():
+            try:
+                self.reindex(chat_id)
+            except Exception as e:
+                logger.error(f"Error re-indexing chat {chat_id}: {e}")
+            finally:
+                with self._lock:
+                    self._reindexing.discard(shard_key)
+
+        self._reindexer.submit(run)
+
+
+    def update_documents(self, doc_ids: List[str], texts: List[str], metadatas: Optional[List[Dict]] = None, chat_id: Optional[str] = None) -> None:
         """
         Update documents in the FAISS index.
 
@@ -115,12 +928,13 @@ class FAISSVectorStore:
             doc_ids (List[str]): IDs of documents to update.
             texts (List[str]): Updated texts.
             metadatas (Optional[List[Dict]]): Updated metadata.
+            chat_id (Optional[str]): Chat ID of the shard holding the documents.
         """
         try:
             if not doc_ids or not texts:
                 raise ValueError("Document IDs and texts cannot be empty")
 
-            self.delete_documents(doc_ids)
+            self.delete_documents(doc_ids, chat_id = chat_id)
             self.add_documents(texts, metadatas)
             logger.info("Index updated successfully.")
         except Exception as e:
@@ -128,21 +942,39 @@ class FAISSVectorStore:
             raise
 
 
-    def delete_documents(self, doc_ids: List[str]) -> None:
+    def delete_documents(self, doc_ids: List[str], chat_id: Optional[str] = None) -> None:
         """
-        Delete documents from the FAISS index.
+        Delete documents from the FAISS shards in one pass.
+
+        Chunks are removed natively from the ID-mapped index, so nothing is
+        re-embedded, and every touched shard logs a single delete record.
 
         Args:
             doc_ids (List[str]): IDs of documents to delete.
+            chat_id (Optional[str]): Chat ID of the shard holding the documents.
+                When omitted, every shard on disk is checked.
         """
         try:
-            all_docs = self.vector_store.similarity_search("", k=1000)  
-            remaining_docs = [
-                doc for doc in all_docs
-                if doc.metadata.get("doc_id") not in doc_ids
-            ]
-            self.vector_store = FAISS.from_documents(remaining_docs, self.embeddings)
-            self._save_index()
+            if not doc_ids:
+                return
+            if chat_id:
+                chat_ids = [chat_id]
+            else:
+                chat_ids = [
+                    name for name in os.listdir(self.index_path)
+                    if os.path.isdir(os.path.join(self.index_path, name))
+                ]
+            for shard_chat_id in chat_ids:
+                with self._writing(shard_chat_id) as shard:
+                    if shard is None:
+                        continue
+                    shard_doc_ids = [doc_id for doc_id in doc_ids if doc_id in shard.doc_map]
+                    if not shard_doc_ids:
+                        continue
+                    self._write(shard_chat_id, shard, {"op": "delete", "doc_ids": shard_doc_ids})
+                    # Removed under the same locks, so an upload cannot land between the check and the removal.
+                    if not len(shard):
+                        self._remove_shard(shard_chat_id)
             logger.info(f"Deleted documents with IDs: {doc_ids}")
 
         except Exception as e:
@@ -150,42 +982,170 @@ class FAISSVectorStore:
             raise
 
 
-    def search(self, query: str, k: int = 5, filter: Optional[Dict] = None) -> List[Document]:
+    def _remove_shard(self, chat_id: Optional[str]) -> None:
+        """
+        Drop a chat's shard from memory and disk.
+
+        Must be called holding the shard's in-process and on-disk writer locks.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
+        """
+        self.shards.pop(self._shard_key(chat_id), None)
+        shutil.rmtree(self._shard_path(chat_id))
+        logger.info(f"Deleted index shard for chat {chat_id}")
+
+
+    def delete_chat(self, chat_id: Optional[str]) -> None:
+        """
+        Delete the whole FAISS shard of a chat.
+
+        Args:
+            chat_id (Optional[str]): Chat ID of the shard.
+        """
+        try:
+            with self._shard_lock(chat_id), file_lock(os.path.join(self._shard_path(chat_id), LOCK_FILE)):
+                self._remove_shard(chat_id)
+
+        except Exception as e:
+            logger.error(f"Error deleting index shard for chat {chat_id}: {e}")
+            raise
+
+
+    def _search_with_score(self, query: str, k: int, chat_id: Optional[str]) -> List[Tuple[Document, float]]:
         """
-        Search for similar documents in the FAISS index with optional metadata filtering.
+        Embed the query and search the FAISS shard of a chat.
 
         Args:
             query (str): Query text.
             k (int): Number of similar documents to retrieve.
-            filter (Optional[Dict]): Metadata filter (e.g., {"chat_id": "chat1"}).
+            chat_id (Optional[str]): Chat ID whose shard is searched.
+
+        Returns:
+            List[Tuple[Document, float]]: (Document, cosine similarity) pairs, most similar first.
+        """
+        shard = self.load_index(chat_id)
+        if shard is None:
+            return []
+        started = time.perf_counter()
+        generation = shard.generation
+        if self.result_cache is not None:
+            cached = self.result_cache.get(chat_id, generation, query, k)
+            if cached is not None:
+                documents = [(shard.document(chunk_id), score) for chunk_id, score in cached]
+                if all(doc is not None for doc, _ in documents):
+                    self.result_stats.record(True, (time.perf_counter() - started) * 1000)
+                    return documents
+
+        vector = self._embed_query(query)
+        with self._shard_lock(chat_id):
+            hits = shard.search_ids(vector, k)
+            results = [(shard.document(chunk_id), score) for chunk_id, score in hits]
+        if self.result_cache is not None:
+            self.result_cache.set(chat_id, generation, query, k, hits)
+            self.result_stats.record(False, (time.perf_counter() - started) * 1000)
+        return results
+
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        """
+        Embed a query through an in-process LRU of the last QUERY_EMBEDDING_CACHE_SIZE queries.
+
+        Args:
+            query (str): Query text.
+
+        Returns:
+            np.ndarray: Unit-length query vector.
+        """
+        started = time.perf_counter()
+        with self._query_lock:
+            vector = self._query_vectors.get(query)
+            if vector is not None:
+                self._query_vectors.move_to_end(query)
+        if vector is not None:
+            self.query_vector_stats.record(True, (time.perf_counter() - started) * 1000)
+            return vector
+
+        vector = normalize(self.embeddings.embed_query(query))
+        with self._query_lock:
+            self._query_vectors[query] = vector
+            while len(self._query_vectors) > config.QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_vectors.popitem(last=False)
+        self.query_vector_stats.record(False, (time.perf_counter() - started) * 1000)
+        return vector
+
+
+    def cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Hit ratios and time saved by the query-vector and search-result caches of this process.
+
+        Returns:
+            Dict[str, Dict[str, float]]: "query_vectors" and "results" counters.
+        """
+        return {
+            "query_vectors": self.query_vector_stats.as_dict(),
+            "results": self.result_stats.as_dict() if self.result_cache is not None else None,
+        }
+
+
+    def search(self, query: str, k: int = 5, chat_id: Optional[str] = None) -> List[Document]:
+        """
+        Search for similar documents in the FAISS shard of a chat.
+
+        Args:
+            query (str): Query text.
+            k (int): Number of similar documents to retrieve.
+            chat_id (Optional[str]): Chat ID whose shard is searched.
 
         Returns:
             List[Document]: List of similar documents.
         """
         try:
-            results = self.vector_store.similarity_search(query, k=k, filter=filter)
-            return results
+            return [doc for doc, _ in self._search_with_score(query, k, chat_id)]
         except Exception as e:
             logger.error(f"Error searching documents: {e}")
             return []
 
 
-    def similarity_search_with_score(self, query: str, k: int = 5, score_threshold: float = 0.2, filter: Optional[Dict] = None) -> List[tuple]:
+    def lexical_search(self, query: str, k: int = 5, chat_id: Optional[str] = None) -> List[Tuple[Document, float]]:
+        """
+        Search the BM25 index of a chat's shard.
+
+        Args:
+            query (str): Query text.
+            k (int): Number of documents to retrieve.
+            chat_id (Optional[str]): Chat ID whose shard is searched.
+
+        Returns:
+            List[Tuple[Document, float]]: (Document, BM25 score) pairs, best first.
+        """
+        try:
+            shard = self.load_index(chat_id)
+            if shard is None:
+                return []
+            with self._shard_lock(chat_id):
+                return [(shard.document(chunk_id), score) for chunk_id, score in shard.search_text(query, k)]
+        except Exception as e:
+            logger.error(f"Error searching documents lexically: {e}")
+            return []
+
+
+    def similarity_search_with_score(self, query: str, k: int = 5, score_threshold: float = 0.2, chat_id: Optional[str] = None) -> List[tuple]:
         """
-        Search for similar documents with similarity scores and optional metadata filtering.
+        Search for similar documents with similarity scores in the FAISS shard of a chat.
 
         Args:
             query (str): Query text.
             k (int): Number of similar documents to retrieve.
-            score_threshold (float): Minimum similarity score.
-            filter (Optional[Dict]): Metadata filter (e.g., {"chat_id": "chat1"}).
+            score_threshold (float): Minimum cosine similarity, between -1 and 1.
+            chat_id (Optional[str]): Chat ID whose shard is searched.
 
         Returns:
-            List[tuple]: List of (Document, score) tuples.
+            List[tuple]: List of (Document, cosine similarity) tuples, most similar first.
         """
         try:
-            results = self.vector_store.similarity_search_with_score(query, k = k, filter = filter)
+            results = self._search_with_score(query, k, chat_id)
             return [(doc, score) for doc, score in results if score >= score_threshold]
         except Exception as e:
             logger.error(f"Error in similarity search with score: {e}")
-            return []
\ No newline at end of file
+            return []
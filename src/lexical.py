@@ -0,0 +1,305 @@
+from typing import Optional, Dict, List, Tuple, Set, Iterable, Callable, Hashable
+from collections import Counter
+import numpy as np
+import logging
+import math
+import json
+import re
+import os
+
+logger = logging.getLogger(__name__)
+
+LEXICON_FILE = "lexicon.json"
+POSTINGS_FILE = "postings.npy"
+FREQUENCIES_FILE = "frequencies.npy"
+LENGTHS_FILE = "lengths.npy"
+
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./:]\w+)*")
+SUBTOKEN_SPLIT = re.compile(r"[-./:_]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase terms for BM25.
+
+    Identifiers such as "AB-1234.5" or "v2/api" are kept whole so an exact
+    match ranks first, and their parts are emitted as well so partial
+    queries still hit.
+
+    Args:
+        text (str): Text to tokenize.
+
+    Returns:
+        List[str]: Terms, with repetitions.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        parts = [part for part in SUBTOKEN_SPLIT.split(token) if part]
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class LexicalSegment:
+
+
+    def __init__(self, path: str):
+        """
+        Read-only BM25 posting lists of a shard snapshot.
+
+        The lexicon maps each term to the slice of its postings; postings hold
+        segment rows (not chunk IDs) with their term frequencies, and lengths
+        hold the number of terms per row. The arrays are memory-mapped like the
+        rest of the segment.
+
+        Args:
+            path (str): Segment directory.
+        """
+        with open(os.path.join(path, LEXICON_FILE), "rb") as f:
+            lexicon = json.loads(f.read())
+        self.terms: Dict[str, List[int]] = lexicon["terms"]
+        self.total_length = lexicon["total_length"]
+        self.count = lexicon["count"]
+        if lexicon["postings"]:
+            self.postings = np.load(os.path.join(path, POSTINGS_FILE), mmap_mode = "r")
+            self.frequencies = np.load(os.path.join(path, FREQUENCIES_FILE), mmap_mode = "r")
+        else:
+            self.postings = np.empty(0, dtype = np.int32)
+            self.frequencies = np.empty(0, dtype = np.uint16)
+        if self.count:
+            self.lengths = np.load(os.path.join(path, LENGTHS_FILE), mmap_mode = "r")
+        else:
+            self.lengths = np.empty(0, dtype = np.int32)
+
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """
+        Check whether a segment directory has posting lists.
+
+        Args:
+            path (str): Segment directory.
+
+        Returns:
+            bool: False for snapshots written before the lexical index existed.
+        """
+        return os.path.exists(os.path.join(path, LEXICON_FILE))
+
+
+    def document_frequency(self, term: str) -> int:
+        """
+        Number of segment rows containing a term.
+
+        Args:
+            term (str): Term.
+
+        Returns:
+            int: Document frequency.
+        """
+        entry = self.terms.get(term)
+        return entry[1] if entry else 0
+
+
+    def postings_of(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Posting list of a term.
+
+        Args:
+            term (str): Term.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Segment rows containing the term and its frequency in each.
+        """
+        start, count = self.terms[term]
+        return self.postings[start:start + count], self.frequencies[start:start + count]
+
+
+    @staticmethod
+    def write(path: str, texts: List[str]) -> None:
+        """
+        Write the posting lists of a segment directory.
+
+        Args:
+            path (str): Segment directory.
+            texts (List[str]): Chunk texts, one per segment row.
+        """
+        rows: Dict[str, List[int]] = {}
+        frequencies: Dict[str, List[int]] = {}
+        lengths = np.zeros(len(texts), dtype = np.int32)
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[row] = sum(counts.values())
+            for term, frequency in counts.items():
+                rows.setdefault(term, []).append(row)
+                frequencies.setdefault(term, []).append(frequency)
+
+        terms = {}
+        postings, posting_frequencies = [], []
+        start = 0
+        for term in sorted(rows):
+            terms[term] = [start, len(rows[term])]
+            postings.extend(rows[term])
+            posting_frequencies.extend(frequencies[term])
+            start += len(rows[term])
+
+        np.save(os.path.join(path, POSTINGS_FILE), np.asarray(postings, dtype = np.int32))
+        np.save(os.path.join(path, FREQUENCIES_FILE), np.minimum(np.asarray(posting_frequencies, dtype = np.int64), np.iinfo(np.uint16).max).astype(np.uint16))
+        np.save(os.path.join(path, LENGTHS_FILE), lengths)
+        with open(os.path.join(path, LEXICON_FILE), "wb") as f:
+            f.write(json.dumps({
+                "terms": terms,
+                "postings": len(postings),
+                "count": len(texts),
+                "total_length": int(lengths.sum()),
+            }).encode("utf-8"))
+
+
+class LexicalIndex:
+
+    K1 = 1.2
+    B = 0.75
+
+
+    def __init__(self, base_ids: Optional[np.ndarray] = None, base: Optional[LexicalSegment] = None):
+        """
+        BM25 index of a shard, kept next to its FAISS index.
+
+        Like the shard, it is a memory-mapped base segment plus an in-memory
+        delta updated on every add and remove. Chunks removed from the base are
+        filtered out at query time through the shard's tombstones and stop
+        counting towards the statistics at the next compaction.
+
+        Args:
+            base_ids (Optional[np.ndarray]): Chunk IDs of the base segment rows.
+            base (Optional[LexicalSegment]): Posting lists of the base segment.
+        """
+        self.base_ids = base_ids
+        self.base = base
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.terms: Dict[int, Counter] = {}
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+
+
+    def add(self, chunk_id: int, text: str) -> None:
+        """
+        Index a chunk.
+
+        Args:
+            chunk_id (int): Chunk ID.
+            text (str): Chunk text.
+        """
+        self.remove(chunk_id)
+        counts = Counter(tokenize(text))
+        self.terms[chunk_id] = counts
+        self.lengths[chunk_id] = sum(counts.values())
+        self.total_length += self.lengths[chunk_id]
+        for term, frequency in counts.items():
+            self.postings.setdefault(term, {})[chunk_id] = frequency
+
+
+    def remove(self, chunk_id: int) -> None:
+        """
+        Drop a chunk of the delta from the index.
+
+        Args:
+            chunk_id (int): Chunk ID.
+        """
+        counts = self.terms.pop(chunk_id, None)
+        if counts is None:
+            return
+        self.total_length -= self.lengths.pop(chunk_id)
+        for term in counts:
+            postings = self.postings[term]
+            postings.pop(chunk_id, None)
+            if not postings:
+                del self.postings[term]
+
+
+    def search(self, query: str, k: int, exclude: Set[int] = frozenset()) -> List[Tuple[int, float]]:
+        """
+        Rank chunks by BM25 score.
+
+        Args:
+            query (str): Query text.
+            k (int): Number of chunks to retrieve.
+            exclude (Set[int]): Chunk IDs to skip, e.g. the shard's tombstones.
+
+        Returns:
+            List[Tuple[int, float]]: (chunk ID, BM25 score) pairs, best first.
+        """
+        terms = set(tokenize(query))
+        base = self.base
+        count = len(self.terms) + (base.count if base else 0)
+        if not terms or not count or k <= 0:
+            return []
+        average_length = max((self.total_length + (base.total_length if base else 0)) / count, 1.0)
+
+        base_scores = np.zeros(base.count, dtype = np.float32) if base and base.count else None
+        delta_scores: Dict[int, float] = {}
+        for term in terms:
+            delta_postings = self.postings.get(term, {})
+            frequency = len(delta_postings) + (base.document_frequency(term) if base else 0)
+            if not frequency:
+                continue
+            idf = math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+
+            if base_scores is not None and term in base.terms:
+                rows, frequencies = base.postings_of(term)
+                tf = frequencies.astype(np.float32)
+                norm = self.K1 * (1 - self.B + self.B * base.lengths[rows] / average_length)
+                base_scores[rows] += idf * tf * (self.K1 + 1) / (tf + norm)
+            for chunk_id, tf in delta_postings.items():
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[chunk_id] / average_length)
+                delta_scores[chunk_id] = delta_scores.get(chunk_id, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+
+        hits = [(chunk_id, score) for chunk_id, score in delta_scores.items() if chunk_id not in exclude]
+        if base_scores is not None:
+            rows = np.flatnonzero(base_scores)
+            limit = k + len(exclude)
+            if len(rows) > limit:
+                rows = rows[np.argpartition(-base_scores[rows], limit)[:limit]]
+            hits.extend(
+                (int(self.base_ids[row]), float(base_scores[row]))
+                for row in rows.tolist()
+                if int(self.base_ids[row]) not in exclude
+            )
+        hits.sort(key = lambda hit: -hit[1])
+        return hits[:k]
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List],
+    k: int,
+    key: Callable[[object], Hashable],
+    weights: Optional[Iterable[float]] = None,
+    rank_constant: int = 60,
+) -> List:
+    """
+    Fuse ranked result lists with (weighted) reciprocal rank fusion.
+
+    Each item scores sum(weight / (rank_constant + rank)) over the lists it
+    appears in, so only ranks matter and BM25 scores and cosine similarities need no
+    calibration against each other.
+
+    Args:
+        rankings (List[List]): Result lists, best first.
+        k (int): Number of results to return.
+        key (Callable[[object], Hashable]): Identity of an item across lists.
+        weights (Optional[Iterable[float]]): Weight of each list, defaults to 1.0 each.
+        rank_constant (int): Damping constant; larger values flatten the rank curve.
+
+    Returns:
+        List: Fused results, best first; the first occurrence of each item is kept.
+    """
+    weights = list(weights) if weights is not None else [1.0] * len(rankings)
+    scores: Dict[Hashable, float] = {}
+    items: Dict[Hashable, object] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking, start = 1):
+            identity = key(item)
+            items.setdefault(identity, item)
+            scores[identity] = scores.get(identity, 0.0) + weight / (rank_constant + rank)
+    fused = sorted(scores, key = lambda identity: -scores[identity])
+    return [items[identity] for identity in fused[:k]]
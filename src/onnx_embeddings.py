@@ -0,0 +1,332 @@
+from typing import List, Optional
+from langchain_core.embeddings import Embeddings
+from Configuration import config
+from src.persistence import file_lock
+import numpy as np
+import argparse
+import tempfile
+import logging
+import shutil
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+SETTINGS_FILE = "embedding_config.json"
+
+PARITY_SAMPLES = [
+    "What is the termination clause of this contract?",
+    "The quarterly revenue grew by twelve percent compared to last year.",
+    "Patients should not take this medication with alcohol.",
+    "Section 4.2 describes the warranty period and its exclusions.",
+    "How do I reset my password?",
+    "The mitochondria is the powerhouse of the cell.",
+    "Interest accrues daily and is payable at the end of each month.",
+    "Summarize the main findings of the report.",
+]
+
+
+def model_dir(model_name: str) -> str:
+    """
+    Directory holding the exported ONNX model of a Hugging Face model.
+
+    Args:
+        model_name (str): Hugging Face model name.
+
+    Returns:
+        str: Directory under ONNX_MODEL_DIR.
+    """
+    return os.path.join(config.ONNX_MODEL_DIR, model_name.replace("/", "--"))
+
+
+def _pooling_settings(model_name: str, tokenizer) -> dict:
+    """
+    Read the pooling, normalization and sequence length of a sentence-transformers model.
+
+    Falls back to mean pooling without normalization for plain transformers models.
+
+    Args:
+        model_name (str): Hugging Face model name.
+        tokenizer: Tokenizer of the model.
+
+    Returns:
+        dict: "pooling", "normalize" and "max_length".
+    """
+    settings = {"pooling": "mean", "normalize": False, "max_length": min(tokenizer.model_max_length, 512)}
+    try:
+        from huggingface_hub import hf_hub_download
+        with open(hf_hub_download(model_name, "modules.json")) as f:
+            modules = json.load(f)
+        for module in modules:
+            if module["type"].endswith("Pooling"):
+                with open(hf_hub_download(model_name, f"{module['path']}/config.json")) as f:
+                    pooling = json.load(f)
+                settings["pooling"] = "cls" if pooling.get("pooling_mode_cls_token") else "mean"
+            elif module["type"].endswith("Normalize"):
+                settings["normalize"] = True
+        with open(hf_hub_download(model_name, "sentence_bert_config.json")) as f:
+            settings["max_length"] = json.load(f).get("max_seq_length", settings["max_length"])
+    except Exception as e:
+        logger.warning(f"Using default pooling settings for {model_name}: {str(e)}")
+    return settings
+
+
+def export_onnx_model(model_name: str, output_dir: Optional[str] = None) -> str:
+    """
+    Export a Hugging Face model to ONNX and quantize its weights to int8.
+
+    Exporting needs torch and transformers; running the exported model only
+    needs onnxruntime and tokenizers. Concurrent exports to the same directory
+    are serialized with a lock file next to it.
+
+    Args:
+        model_name (str): Hugging Face model name.
+        output_dir (Optional[str]): Destination directory, defaults to `model_dir(model_name)`.
+
+    Returns:
+        str: Directory holding the quantized model, tokenizer and pooling settings.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    output_dir = output_dir or model_dir(model_name)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    inputs = tokenizer(["An example sentence to trace the model."], return_tensors = "pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in inputs]
+
+    parent = os.path.dirname(os.path.abspath(output_dir))
+    os.makedirs(parent, exist_ok = True)
+    tmp_dir = tempfile.mkdtemp(prefix = ".export-", dir = parent)
+    try:
+        fp32_path = os.path.join(tmp_dir, "model.onnx")
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(inputs[name] for name in input_names),
+                fp32_path,
+                input_names = input_names,
+                output_names = ["last_hidden_state"],
+                dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+                opset_version = 14,
+                dynamo = False,
+            )
+        quantize_dynamic(fp32_path, os.path.join(tmp_dir, ONNX_MODEL_FILE), weight_type = QuantType.QInt8)
+        os.remove(fp32_path)
+
+        tokenizer.backend_tokenizer.save(os.path.join(tmp_dir, TOKENIZER_FILE))
+        settings = dict(
+            _pooling_settings(model_name, tokenizer),
+            model_name = model_name,
+            input_names = input_names,
+            pad_token = tokenizer.pad_token,
+            pad_id = tokenizer.pad_token_id,
+        )
+        with open(os.path.join(tmp_dir, SETTINGS_FILE), "w") as f:
+            json.dump(settings, f, indent = 2)
+
+        with file_lock(os.path.abspath(output_dir) + ".lock"):
+            if os.path.exists(output_dir):
+                shutil.rmtree(output_dir)
+            os.replace(tmp_dir, output_dir)
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+    logger.info(f"Exported int8 ONNX model of {model_name} to {output_dir}")
+    return output_dir
+
+
+class OnnxEmbeddings(Embeddings):
+
+
+    def __init__(self, model_path: str, threads: Optional[int] = None, batch_size: int = 64):
+        """
+        Embeddings computed by a dynamically quantized (int8) ONNX Runtime model.
+
+        Texts are tokenized with the model's fast tokenizer, sorted by length to
+        keep padding small, and pooled the way the sentence-transformers model
+        pools them (mean or CLS, optionally L2-normalized).
+
+        Args:
+            model_path (str): Directory written by `export_onnx_model`.
+            threads (Optional[int]): Intra-op threads of the ONNX Runtime session.
+            batch_size (int): Maximum number of texts per forward pass.
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_path, SETTINGS_FILE)) as f:
+            self.settings = json.load(f)
+        self.batch_size = batch_size
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_path, ONNX_MODEL_FILE), options, providers = ["CPUExecutionProvider"]
+        )
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length = self.settings["max_length"])
+        self.tokenizer.enable_padding(pad_id = self.settings["pad_id"] or 0, pad_token = self.settings["pad_token"] or "[PAD]")
+
+
+    def _forward(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed one batch of texts.
+
+        Args:
+            texts (List[str]): Texts to embed.
+
+        Returns:
+            np.ndarray: One float32 row per text.
+        """
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype = np.int64)
+        feeds = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype = np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype = np.int64),
+        }
+        hidden = self.session.run(None, {name: feeds[name] for name in self.settings["input_names"]})[0]
+
+        if self.settings["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis = 1) / np.maximum(mask.sum(axis = 1), 1e-9)
+        if self.settings["normalize"]:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis = 1, keepdims = True), 1e-12)
+        return pooled.astype(np.float32)
+
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed documents in length-sorted batches.
+
+        Args:
+            texts (List[str]): Texts to embed.
+
+        Returns:
+            List[List[float]]: One vector per text.
+        """
+        if not texts:
+            return []
+        order = sorted(range(len(texts)), key = lambda i: len(texts[i]))
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._forward([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query.
+
+        Args:
+            text (str): Query text.
+
+        Returns:
+            List[float]: Query vector.
+        """
+        return self.embed_documents([text])[0]
+
+
+def load_onnx_embeddings(model_name: str, threads: Optional[int] = None, batch_size: int = 64) -> OnnxEmbeddings:
+    """
+    Load the int8 ONNX model of a Hugging Face model.
+
+    The model must have been exported with `python -m src.onnx_embeddings export`;
+    exporting needs torch, which the serving processes do not.
+
+    Args:
+        model_name (str): Hugging Face model name.
+        threads (Optional[int]): Intra-op threads of the ONNX Runtime session.
+        batch_size (int): Maximum number of texts per forward pass.
+
+    Returns:
+        OnnxEmbeddings: Quantized embeddings model.
+
+    Raises:
+        FileNotFoundError: If the model has not been exported.
+    """
+    path = model_dir(model_name)
+    if not os.path.exists(os.path.join(path, SETTINGS_FILE)):
+        raise FileNotFoundError(
+            f"No ONNX export of {model_name} in {path}; create it with "
+            f"`python -m src.onnx_embeddings export --model {model_name}`"
+        )
+    return OnnxEmbeddings(path, threads = threads, batch_size = batch_size)
+
+
+def check_parity(model_name: str, texts: Optional[List[str]] = None, threads: Optional[int] = None) -> dict:
+    """
+    Compare the int8 ONNX model with the fp32 sentence-transformers model.
+
+    Args:
+        model_name (str): Hugging Face model name.
+        texts (Optional[List[str]]): Texts to embed, defaults to PARITY_SAMPLES.
+        threads (Optional[int]): Threads given to both models.
+
+    Returns:
+        dict: Mean, minimum and 1st-percentile cosine similarity between the two
+            models' vectors, the largest cosine drift, and the throughput of each model.
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    texts = texts or PARITY_SAMPLES
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    reference = HuggingFaceEmbeddings(model_name = model_name)
+    candidate = load_onnx_embeddings(model_name, threads = threads)
+
+    timings = {}
+    results = {}
+    for name, embeddings in (("fp32", reference), ("int8_onnx", candidate)):
+        embeddings.embed_documents(texts[:2])
+        started = time.perf_counter()
+        results[name] = np.asarray(embeddings.embed_documents(texts), dtype = np.float32)
+        timings[name] = len(texts) / (time.perf_counter() - started)
+
+    a, b = results["fp32"], results["int8_onnx"]
+    cosine = np.sum(a * b, axis = 1) / np.maximum(np.linalg.norm(a, axis = 1) * np.linalg.norm(b, axis = 1), 1e-12)
+    return {
+        "model": model_name,
+        "texts": len(texts),
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        "p1_cosine": float(np.percentile(cosine, 1)),
+        "max_drift": float(1.0 - cosine.min()),
+        "fp32_texts_per_second": timings["fp32"],
+        "int8_onnx_texts_per_second": timings["int8_onnx"],
+        "speedup": timings["int8_onnx"] / timings["fp32"],
+    }
+
+
+if __name__ == "__main__":
+    from src.embeddings import parse_model_spec
+
+    logging.basicConfig(level = logging.INFO)
+    parser = argparse.ArgumentParser(description = "Export and check int8 ONNX embedding models.")
+    parser.add_argument("command", choices = ["export", "parity"])
+    parser.add_argument("--model", default = parse_model_spec(config.EMBEDDING_MODEL)[1], help = "Hugging Face model name")
+    parser.add_argument("--texts", help = "File with one text per line for the parity check")
+    parser.add_argument("--threads", type = int, default = None, help = "Threads per model for the parity check")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(export_onnx_model(args.model))
+    else:
+        texts = None
+        if args.texts:
+            with open(args.texts, encoding = "utf-8") as f:
+                texts = [line.strip() for line in f if line.strip()]
+        print(json.dumps(check_parity(args.model, texts, threads = args.threads), indent = 2))
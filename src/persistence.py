@@ -0,0 +1,576 @@
+from typing import Optional, Iterator, Callable, Dict, List, Tuple
+from contextlib import contextmanager
+from langchain.docstore.document import Document
+import numpy as np
+import logging
+import shutil
+import base64
+import faiss
+import mmap
+import json
+import uuid
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "MANIFEST"
+LOCK_FILE = "LOCK"
+WAL_FILE = "wal.log"
+SNAPSHOT_PREFIX = "snapshot-"
+
+SEGMENT_META = "meta.json"
+SEGMENT_INDEX = "index.faiss"
+SEGMENT_IDS = "ids.npy"
+SEGMENT_VECTORS = "vectors.npy"
+SEGMENT_OFFSETS = "offsets.npy"
+SEGMENT_DOCSTORE = "docstore.bin"
+SEGMENT_DOC_MAP = "doc_map.json"
+
+
+def fsync_dir(path: str) -> None:
+    """
+    Flush a directory's entries (created, renamed or removed files) to disk.
+
+    Directories cannot be opened for fsync on Windows, where renames are durable once they return.
+
+    Args:
+        path (str): Directory.
+    """
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_tree(path: str) -> None:
+    """
+    Flush every file under a directory, then the directories themselves, to disk.
+
+    Args:
+        path (str): Directory.
+    """
+    for root, _, files in os.walk(path, topdown = False):
+        for name in files:
+            with open(os.path.join(root, name), "rb") as f:
+                os.fsync(f.fileno())
+        fsync_dir(root)
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """
+    Write a file atomically and durably: write a temporary sibling, fsync it,
+    rename it over `path`, then fsync the directory so the rename survives a crash.
+
+    Args:
+        path (str): Destination path.
+        data (bytes): File content.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        fsync_dir(os.path.dirname(path) or ".")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def encode_vectors(vectors: np.ndarray) -> str:
+    """
+    Encode float32 vectors for a JSON log record.
+
+    Args:
+        vectors (np.ndarray): Vectors to encode.
+
+    Returns:
+        str: Base64 of the raw float32 bytes.
+    """
+    return base64.b64encode(np.ascontiguousarray(vectors, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def decode_vectors(data: str, dimension: int) -> np.ndarray:
+    """
+    Decode vectors encoded with `encode_vectors`.
+
+    Args:
+        data (str): Base64 of the raw float32 bytes.
+        dimension (int): Dimension of the vectors.
+
+    Returns:
+        np.ndarray: Vectors, one row per vector.
+    """
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).reshape(-1, dimension)
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive inter-process lock on a lock file.
+
+    Args:
+        path (str): Lock file, created if missing.
+    """
+    while True:
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        f = open(path, "a+b")
+        try:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        except BaseException:
+            f.close()
+            raise
+        try:
+            current = os.stat(path).st_ino
+        except FileNotFoundError:
+            current = None
+        if not fcntl or current == os.fstat(f.fileno()).st_ino:
+            break
+        # The directory was deleted while we waited; a lock on the unlinked file protects nothing.
+        f.close()
+    with f:
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class WriteAheadLog:
+
+
+    def __init__(self, path: str):
+        """
+        Append-only log of shard mutations, one JSON record per line.
+
+        Args:
+            path (str): Path of the log file.
+        """
+        self.path = path
+
+
+    def append(self, record: Dict) -> None:
+        """
+        Append a record and fsync it before returning.
+
+        Args:
+            record (Dict): JSON-serializable record.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok = True)
+        created = not os.path.exists(self.path)
+        with open(self.path, "ab") as f:
+            f.write(json.dumps(record).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if created:
+            fsync_dir(os.path.dirname(self.path))
+
+
+    def recover(self, offset: int = 0) -> int:
+        """
+        Cut off a torn last record, left by a writer that crashed mid-append.
+
+        Records appended after such a fragment would never be read back, so
+        writers call this, holding the shard's file lock, before appending.
+
+        Args:
+            offset (int): Byte offset of a known record boundary to scan from.
+
+        Returns:
+            int: Byte offset right after the last complete record.
+        """
+        end = offset
+        for _, end in self.records(offset):
+            pass
+        if self.size() > end:
+            logger.warning(f"Truncating torn record at offset {end} of {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+                f.flush()
+                os.fsync(f.fileno())
+        return end
+
+
+    def records(self, offset: int = 0) -> Iterator[Tuple[Dict, int]]:
+        """
+        Iterate over the records in the log, starting at a byte offset.
+
+        Reading stops at a torn or still-being-written last line.
+
+        Args:
+            offset (int): Byte offset of the first record to read.
+
+        Yields:
+            Tuple[Dict, int]: Log record and the byte offset right after it.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    return
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Stopping at torn record in {self.path}")
+                    return
+                offset += len(line)
+                yield record, offset
+
+
+    def inode(self) -> Optional[int]:
+        """
+        Inode of the log file, which changes whenever the log is truncated.
+
+        Returns:
+            Optional[int]: Inode number, or None if the log does not exist.
+        """
+        try:
+            return os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return None
+
+
+    def size(self) -> int:
+        """
+        Size of the log in bytes.
+
+        Returns:
+            int: Log size.
+        """
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+
+    def truncate(self) -> None:
+        """
+        Atomically empty the log by replacing it with a new, empty file.
+        """
+        atomic_write(self.path, b"")
+
+
+class SnapshotManager:
+
+
+    def __init__(self, path: str):
+        """
+        Immutable, versioned snapshots of a shard and the manifest that points at them.
+
+        Each snapshot is written into a fresh `snapshot-<seq>` directory. The
+        `MANIFEST` file is atomically replaced on every write to the shard and
+        records:
+            generation: sequence number of the last log record written.
+            snapshot: name of the current snapshot directory, or None.
+            snapshot_seq: last log sequence number included in the snapshot.
+            incarnation: random ID given to the shard by its first manifest.
+        Sequence numbers restart at 0 when a shard is deleted and created
+        again; the incarnation does not repeat, so (incarnation, generation)
+        identifies a version of the shard for good. Readers compare both with
+        their in-memory copy to decide whether to replay the log tail or
+        reopen a newer snapshot.
+
+        Args:
+            path (str): Shard directory.
+        """
+        self.path = path
+
+
+    def current(self) -> Optional[Dict]:
+        """
+        Read the shard manifest.
+
+        Returns:
+            Optional[Dict]: Manifest, or None if the shard does not exist.
+        """
+        try:
+            with open(os.path.join(self.path, MANIFEST_FILE), "rb") as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+
+    def publish(self, generation: int, snapshot: Optional[str], snapshot_seq: int, incarnation: Optional[str] = None) -> str:
+        """
+        Atomically replace the shard manifest.
+
+        Args:
+            generation (int): Sequence number of the last log record written.
+            snapshot (Optional[str]): Name of the current snapshot directory.
+            snapshot_seq (int): Last log sequence number included in the snapshot.
+            incarnation (Optional[str]): Incarnation of the shard, or None to start a new one.
+
+        Returns:
+            str: Incarnation written to the manifest.
+        """
+        incarnation = incarnation or uuid.uuid4().hex
+        atomic_write(
+            os.path.join(self.path, MANIFEST_FILE),
+            json.dumps({
+                "generation": generation,
+                "snapshot": snapshot,
+                "snapshot_seq": snapshot_seq,
+                "incarnation": incarnation,
+            }).encode("utf-8")
+        )
+        return incarnation
+
+
+    def snapshot_path(self, name: str) -> str:
+        """
+        Directory of a snapshot.
+
+        Args:
+            name (str): Snapshot directory name.
+
+        Returns:
+            str: Snapshot directory.
+        """
+        return os.path.join(self.path, name)
+
+
+    def write(self, seq: int, save_fn: Callable[[str], None], tag: Optional[str] = None) -> str:
+        """
+        Write a new snapshot directory. It becomes current once published in the manifest.
+
+        Every file of the snapshot, the snapshot directory and its rename are
+        flushed to disk before this returns, so a manifest published afterwards
+        never points at data that a crash could lose, and the log it replaces
+        can be truncated safely.
+
+        Args:
+            seq (int): Last log sequence number included in the snapshot.
+            save_fn (Callable[[str], None]): Writes the snapshot files into the given directory.
+            tag (Optional[str]): Suffix telling apart snapshots of the same sequence
+                number, e.g. a re-indexed copy of the current one.
+
+        Returns:
+            str: Name of the new snapshot directory.
+        """
+        os.makedirs(self.path, exist_ok = True)
+        name = f"{SNAPSHOT_PREFIX}{seq:012d}" + (f"-{tag}" if tag else "")
+        if os.path.exists(self.snapshot_path(name)):
+            return name
+        tmp_path = os.path.join(self.path, f".tmp-{uuid.uuid4().hex}")
+        try:
+            save_fn(tmp_path)
+            fsync_tree(tmp_path)
+            os.rename(tmp_path, self.snapshot_path(name))
+            fsync_dir(self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                shutil.rmtree(tmp_path)
+        return name
+
+
+    def remove_stale(self, keep: str) -> None:
+        """
+        Remove snapshots other than the current one.
+
+        Processes still reading an older snapshot keep their memory mappings
+        valid after the files are unlinked.
+
+        Args:
+            keep (str): Name of the snapshot to keep.
+        """
+        for name in os.listdir(self.path):
+            if name.startswith(SNAPSHOT_PREFIX) and name != keep:
+                shutil.rmtree(self.snapshot_path(name), ignore_errors = True)
+
+
+def read_index(path: str) -> faiss.Index:
+    """
+    Read a FAISS index with its vectors memory-mapped instead of copied to the heap.
+
+    Falls back to a regular read on FAISS builds without mmap support for the index type.
+
+    Args:
+        path (str): Index file.
+
+    Returns:
+        faiss.Index: Read-only index.
+    """
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError:
+        logger.warning(f"Memory-mapped read not supported for {path}, loading into memory")
+        return faiss.read_index(path)
+
+
+def serialize_document(document: Document) -> bytes:
+    """
+    Serialize a chunk document for the segment docstore.
+
+    Args:
+        document (Document): Chunk document.
+
+    Returns:
+        bytes: JSON record.
+    """
+    return json.dumps({"page_content": document.page_content, "metadata": document.metadata}).encode("utf-8")
+
+
+class Segment:
+
+
+    def __init__(self, path: str):
+        """
+        Read-only, memory-mapped shard snapshot.
+
+        A segment directory holds the raw vectors (`vectors.npy`), their chunk
+        IDs in ascending order (`ids.npy`), a FAISS index over them, and an
+        offset-indexed docstore (`docstore.bin` + `offsets.npy`). Everything
+        except the small metadata files is memory-mapped, so processes opening
+        the same snapshot share the page cache and only touch the chunks they
+        actually return.
+
+        Args:
+            path (str): Segment directory.
+        """
+        self.path = path
+        with open(os.path.join(path, SEGMENT_META), "rb") as f:
+            self.meta = json.loads(f.read())
+        with open(os.path.join(path, SEGMENT_DOC_MAP), "rb") as f:
+            self.doc_map: Dict[str, List[int]] = json.loads(f.read())
+        self.dimension = self.meta["dim"]
+
+        if self.meta["count"]:
+            self.ids = np.load(os.path.join(path, SEGMENT_IDS), mmap_mode = "r")
+            self.vectors = np.load(os.path.join(path, SEGMENT_VECTORS), mmap_mode = "r")
+            self.offsets = np.load(os.path.join(path, SEGMENT_OFFSETS), mmap_mode = "r")
+            self.index = read_index(os.path.join(path, SEGMENT_INDEX))
+            with open(os.path.join(path, SEGMENT_DOCSTORE), "rb") as f:
+                self._docstore = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        else:
+            self.ids = np.empty(0, dtype = np.int64)
+            self.vectors = np.empty((0, self.dimension), dtype = np.float32)
+            self.offsets = np.zeros(1, dtype = np.int64)
+            self.index = None
+            self._docstore = b""
+
+
+    def __len__(self) -> int:
+        return int(self.meta["count"])
+
+
+    def position(self, chunk_id: int) -> Optional[int]:
+        """
+        Row of a chunk in the segment.
+
+        Args:
+            chunk_id (int): Chunk ID.
+
+        Returns:
+            Optional[int]: Row number, or None if the chunk is not in the segment.
+        """
+        position = int(np.searchsorted(self.ids, chunk_id))
+        if position < len(self) and int(self.ids[position]) == chunk_id:
+            return position
+        return None
+
+
+    def raw_document(self, position: int) -> bytes:
+        """
+        Serialized document stored at a row.
+
+        Args:
+            position (int): Row number.
+
+        Returns:
+            bytes: JSON record.
+        """
+        return bytes(self._docstore[int(self.offsets[position]):int(self.offsets[position + 1])])
+
+
+    def document(self, chunk_id: int) -> Optional[Document]:
+        """
+        Read a chunk document from the docstore.
+
+        Args:
+            chunk_id (int): Chunk ID.
+
+        Returns:
+            Optional[Document]: Chunk document, or None if the chunk is not in the segment.
+        """
+        position = self.position(chunk_id)
+        if position is None:
+            return None
+        record = json.loads(self.raw_document(position))
+        return Document(page_content = record["page_content"], metadata = record["metadata"])
+
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """
+        Search the segment's index.
+
+        Args:
+            vector (np.ndarray): Query vector of shape (1, dim).
+            k (int): Number of chunks to retrieve.
+
+        Returns:
+            List[Tuple[int, float]]: (chunk ID, score) pairs, best first.
+        """
+        if self.index is None or k <= 0:
+            return []
+        scores, ids = self.index.search(vector, min(k, len(self)))
+        return [
+            (chunk_id, float(score))
+            for chunk_id, score in zip(ids[0].tolist(), scores[0].tolist())
+            if chunk_id != -1
+        ]
+
+
+    @staticmethod
+    def write(path: str, dimension: int, ids: List[int], vectors: np.ndarray, records: List[bytes], doc_map: Dict[str, List[int]], meta: Dict, index: Optional[faiss.Index] = None) -> None:
+        """
+        Write a segment directory.
+
+        Args:
+            path (str): Segment directory to create.
+            dimension (int): Dimension of the vectors.
+            ids (List[int]): Chunk IDs in ascending order.
+            vectors (np.ndarray): Vectors, one row per chunk ID.
+            records (List[bytes]): Serialized documents, one per chunk ID.
+            doc_map (Dict[str, List[int]]): Document ID to chunk IDs.
+            meta (Dict): Extra metadata, e.g. the shard's next ID and log sequence number.
+            index (Optional[faiss.Index]): ID-mapped index over the vectors, defaults to a flat inner-product one.
+        """
+        os.makedirs(path, exist_ok = True)
+        ids = np.asarray(ids, dtype = np.int64)
+        vectors = np.asarray(vectors, dtype = np.float32).reshape(-1, dimension)
+        offsets = np.zeros(len(records) + 1, dtype = np.int64)
+        with open(os.path.join(path, SEGMENT_DOCSTORE), "wb") as f:
+            for i, record in enumerate(records):
+                f.write(record)
+                offsets[i + 1] = offsets[i] + len(record)
+        np.save(os.path.join(path, SEGMENT_IDS), ids)
+        np.save(os.path.join(path, SEGMENT_VECTORS), vectors)
+        np.save(os.path.join(path, SEGMENT_OFFSETS), offsets)
+
+        if index is None:
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+            if len(ids):
+                index.add_with_ids(vectors, ids)
+        faiss.write_index(index, os.path.join(path, SEGMENT_INDEX))
+
+        with open(os.path.join(path, SEGMENT_DOC_MAP), "wb") as f:
+            f.write(json.dumps(doc_map).encode("utf-8"))
+        with open(os.path.join(path, SEGMENT_META), "wb") as f:
+            f.write(json.dumps(dict(meta, dim = dimension, count = int(len(ids)))).encode("utf-8"))
@@ -0,0 +1,555 @@
+from typing import Optional, List, Dict, Any, Iterator, AsyncIterator
+from collections import deque
+from Configuration import config
+import threading
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class LLMUnavailableError(Exception):
+    """Raised when every LLM endpoint failed or has its circuit open."""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Whether an LLM call failure is transient.
+
+    Args:
+        error (Exception): Error raised by the client.
+
+    Returns:
+        bool: True for timeouts, connection errors, rate limits (429) and
+            server errors (5xx); False for errors of the request itself.
+    """
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in (408, 409, 429) or status >= 500
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+class CircuitBreaker:
+
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        """
+        Fail fast while an endpoint keeps failing.
+
+        After `failure_threshold` consecutive failures the circuit opens and
+        calls are refused for `reset_timeout` seconds. Then a single probe call
+        is let through (half-open): its success closes the circuit, its failure
+        opens it again.
+
+        Args:
+            name (str): Endpoint name, for logging.
+            failure_threshold (Optional[int]): Consecutive failures that open the circuit, defaults to LLM_BREAKER_FAILURES.
+            reset_timeout (Optional[float]): Seconds the circuit stays open, defaults to LLM_BREAKER_RESET.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold or config.LLM_BREAKER_FAILURES
+        self.reset_timeout = reset_timeout or config.LLM_BREAKER_RESET
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+
+    def allow(self) -> bool:
+        """
+        Ask to make a call.
+
+        Returns:
+            bool: False while the circuit is open, or half-open with a probe in flight.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._probing = False
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+
+    def retry_after(self) -> float:
+        """
+        Seconds until the circuit lets a probe through.
+
+        Returns:
+            float: 0 if calls are allowed now.
+        """
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+
+    def record_success(self) -> None:
+        """
+        Close the circuit after a successful call.
+        """
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuit of {self.name} closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+
+    def record_failure(self) -> None:
+        """
+        Count a failed call, opening the circuit at the threshold or after a failed probe.
+        """
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(f"Circuit of {self.name} opened after {self._failures} consecutive failures")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+    def release(self) -> None:
+        """
+        End a probe that neither succeeded nor failed, e.g. a rejected request.
+        """
+        with self._lock:
+            self._probing = False
+
+
+    def state(self) -> Dict[str, Any]:
+        """
+        Current state of the circuit.
+
+        Returns:
+            Dict[str, Any]: "state", "consecutive_failures" and "retry_after" seconds.
+        """
+        retry_after = self.retry_after()
+        with self._lock:
+            return {"state": self._state, "consecutive_failures": self._failures, "retry_after": round(retry_after, 1)}
+
+
+class LatencyTracker:
+
+
+    def __init__(self, window: Optional[int] = None):
+        """
+        Percentiles over the most recent latencies.
+
+        Args:
+            window (Optional[int]): Number of latencies kept, defaults to LLM_LATENCY_WINDOW.
+        """
+        self._samples = deque(maxlen = window or config.LLM_LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+
+    def record(self, seconds: float) -> None:
+        """
+        Add a latency.
+
+        Args:
+            seconds (float): Latency in seconds.
+        """
+        with self._lock:
+            self._samples.append(seconds)
+
+
+    def percentiles(self) -> Dict[str, Optional[float]]:
+        """
+        Latency percentiles in milliseconds.
+
+        Returns:
+            Dict[str, Optional[float]]: "count", "p50_ms", "p95_ms" and "p99_ms" (None without samples).
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        result: Dict[str, Optional[float]] = {"count": len(samples)}
+        for percentile in (50, 95, 99):
+            result[f"p{percentile}_ms"] = round(samples[min(len(samples) - 1, int(len(samples) * percentile / 100))] * 1000, 1) if samples else None
+        return result
+
+
+class Endpoint:
+
+
+    def __init__(self, name: str, model):
+        """
+        One LLM model with its circuit breaker and statistics.
+
+        Args:
+            name (str): Model name.
+            model: LangChain chat model.
+        """
+        self.name = name
+        self.model = model
+        self.breaker = CircuitBreaker(name)
+        self.latency = LatencyTracker()
+        self.first_token = LatencyTracker()
+        self.counts = {"calls": 0, "failures": 0, "retries": 0, "rejected": 0}
+        self._lock = threading.Lock()
+
+
+    def count(self, field: str) -> None:
+        """
+        Increment a counter.
+
+        Args:
+            field (str): Counter name.
+        """
+        with self._lock:
+            self.counts[field] += 1
+
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Breaker state, counters and latency percentiles.
+
+        Returns:
+            Dict[str, Any]: Statistics of the endpoint.
+        """
+        with self._lock:
+            counts = dict(self.counts)
+        return dict(
+            {"model": self.name, "breaker": self.breaker.state(), "latency": self.latency.percentiles(), "first_token": self.first_token.percentiles()},
+            **counts,
+        )
+
+
+class ResilientLLM:
+
+
+    def __init__(
+        self,
+        models: List[tuple],
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+    ):
+        """
+        Chat model wrapper with deadlines, retries, circuit breakers and fallback models.
+
+        Each call goes to the first model whose circuit is closed. Transient
+        failures (see `is_retryable`) are retried up to `max_retries` times
+        with full-jitter exponential backoff, then the next model is tried.
+        Open circuits are skipped without waiting, so when the provider is down
+        requests fail in microseconds instead of holding a thread for the
+        whole timeout. Streams are retried only until their first fragment.
+        `invoke`, `stream`, `ainvoke` and `astream` mirror the LangChain chat
+        model interface, so the wrapper replaces the client transparently.
+
+        Args:
+            models (List[tuple]): (name, chat model) pairs in order of preference.
+            timeout (Optional[float]): Deadline of one call in seconds (of the first
+                fragment for streams), defaults to LLM_TIMEOUT.
+            max_retries (Optional[int]): Retries per model, defaults to LLM_MAX_RETRIES.
+            backoff_base (Optional[float]): First backoff in seconds, defaults to LLM_BACKOFF_BASE.
+            backoff_max (Optional[float]): Backoff cap in seconds, defaults to LLM_BACKOFF_MAX.
+        """
+        self.endpoints = [Endpoint(name, model) for name, model in models]
+        self.timeout = timeout or config.LLM_TIMEOUT
+        self.max_retries = max_retries if max_retries is not None else config.LLM_MAX_RETRIES
+        self.backoff_base = backoff_base or config.LLM_BACKOFF_BASE
+        self.backoff_max = backoff_max or config.LLM_BACKOFF_MAX
+        self._fallbacks = 0
+        self._lock = threading.Lock()
+
+
+    def _backoff(self, attempt: int) -> float:
+        """
+        Full-jitter backoff before a retry.
+
+        Args:
+            attempt (int): Number of failed attempts so far, from 1.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+
+    def _attempts(self):
+        """
+        Yield (endpoint, attempt) pairs to try, skipping endpoints whose circuit is open.
+        """
+        for position, endpoint in enumerate(self.endpoints):
+            if not endpoint.breaker.allow():
+                endpoint.count("rejected")
+                continue
+            if position:
+                with self._lock:
+                    self._fallbacks += 1
+                logger.warning(f"Falling back to LLM {endpoint.name}")
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    if not endpoint.breaker.allow():
+                        break
+                    endpoint.count("retries")
+                yield endpoint, attempt
+
+
+    def _failed(self, endpoint: Endpoint, attempt: int, error: Exception) -> float:
+        """
+        Record a failed attempt.
+
+        Args:
+            endpoint (Endpoint): Endpoint called.
+            attempt (int): Attempt number, from 0.
+            error (Exception): Error raised.
+
+        Returns:
+            float: Seconds to wait before the next attempt of the same endpoint.
+
+        Raises:
+            Exception: `error` itself if it is not transient.
+        """
+        endpoint.count("failures")
+        if not is_retryable(error):
+            endpoint.breaker.release()
+            raise error
+        logger.warning(f"LLM {endpoint.name} attempt {attempt + 1} failed: {type(error).__name__}: {str(error)}")
+        endpoint.breaker.record_failure()
+        if attempt >= self.max_retries or endpoint.breaker.retry_after() > 0:
+            return 0.0
+        return self._backoff(attempt + 1)
+
+
+    def _abandoned(self, endpoint: Endpoint, answered: bool = False) -> None:
+        """
+        Settle the circuit of a call interrupted by a cancelled task or a closed stream.
+
+        Without an outcome a half-open circuit would wait for its probe forever.
+        A call abandoned before the model answered counts as failed, since it
+        is usually cut short by a deadline; a stream closed by its consumer
+        after the first fragment shows the model is answering.
+
+        Args:
+            endpoint (Endpoint): Endpoint called.
+            answered (bool): Whether the model had sent its first fragment.
+        """
+        if answered:
+            endpoint.breaker.record_success()
+        else:
+            endpoint.breaker.record_failure()
+
+
+    def _unavailable(self) -> LLMUnavailableError:
+        """
+        Error raised when no endpoint could answer.
+        """
+        retry_after = min((endpoint.breaker.retry_after() for endpoint in self.endpoints), default = 0.0)
+        return LLMUnavailableError("No LLM endpoint is available", retry_after = retry_after)
+
+
+    def invoke(self, prompt: Any, **kwargs) -> Any:
+        """
+        Call the LLM.
+
+        Args:
+            prompt (Any): Prompt, as for a LangChain chat model.
+
+        Returns:
+            Any: Model message.
+
+        Raises:
+            LLMUnavailableError: If every model failed or has its circuit open.
+        """
+        for endpoint, attempt in self._attempts():
+            endpoint.count("calls")
+            started = time.monotonic()
+            try:
+                response = endpoint.model.invoke(prompt, **kwargs)
+            except Exception as e:
+                time.sleep(self._failed(endpoint, attempt, e))
+                continue
+            except BaseException:
+                self._abandoned(endpoint)
+                raise
+            endpoint.latency.record(time.monotonic() - started)
+            endpoint.breaker.record_success()
+            return response
+        raise self._unavailable()
+
+
+    def stream(self, prompt: Any, **kwargs) -> Iterator[Any]:
+        """
+        Stream the LLM output.
+
+        Args:
+            prompt (Any): Prompt, as for a LangChain chat model.
+
+        Returns:
+            Iterator[Any]: Message chunks.
+
+        Raises:
+            LLMUnavailableError: If every model failed before its first fragment.
+        """
+        for endpoint, attempt in self._attempts():
+            endpoint.count("calls")
+            started = time.monotonic()
+            try:
+                chunks = endpoint.model.stream(prompt, **kwargs)
+                first = next(chunks)
+            except StopIteration:
+                endpoint.breaker.record_success()
+                return
+            except Exception as e:
+                time.sleep(self._failed(endpoint, attempt, e))
+                continue
+            except BaseException:
+                self._abandoned(endpoint)
+                raise
+            endpoint.first_token.record(time.monotonic() - started)
+            try:
+                yield first
+                yield from chunks
+            except Exception:
+                # Part of the answer was sent, a retry would repeat it.
+                endpoint.count("failures")
+                endpoint.breaker.record_failure()
+                raise
+            except BaseException:
+                self._abandoned(endpoint, answered = True)
+                raise
+            endpoint.latency.record(time.monotonic() - started)
+            endpoint.breaker.record_success()
+            return
+        raise self._unavailable()
+
+
+    async def ainvoke(self, prompt: Any, **kwargs) -> Any:
+        """
+        Async `invoke`; the deadline is also enforced on the awaiting side.
+
+        Args:
+            prompt (Any): Prompt, as for a LangChain chat model.
+
+        Returns:
+            Any: Model message.
+
+        Raises:
+            LLMUnavailableError: If every model failed or has its circuit open.
+        """
+        for endpoint, attempt in self._attempts():
+            endpoint.count("calls")
+            started = time.monotonic()
+            try:
+                response = await asyncio.wait_for(endpoint.model.ainvoke(prompt, **kwargs), self.timeout)
+            except Exception as e:
+                await asyncio.sleep(self._failed(endpoint, attempt, e))
+                continue
+            except BaseException:
+                self._abandoned(endpoint)
+                raise
+            endpoint.latency.record(time.monotonic() - started)
+            endpoint.breaker.record_success()
+            return response
+        raise self._unavailable()
+
+
+    async def astream(self, prompt: Any, **kwargs) -> AsyncIterator[Any]:
+        """
+        Async `stream`; the first fragment must arrive within the deadline.
+
+        Args:
+            prompt (Any): Prompt, as for a LangChain chat model.
+
+        Returns:
+            AsyncIterator[Any]: Message chunks.
+
+        Raises:
+            LLMUnavailableError: If every model failed before its first fragment.
+        """
+        for endpoint, attempt in self._attempts():
+            endpoint.count("calls")
+            started = time.monotonic()
+            chunks = endpoint.model.astream(prompt, **kwargs)
+            try:
+                first = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+            except StopAsyncIteration:
+                endpoint.breaker.record_success()
+                return
+            except Exception as e:
+                await asyncio.sleep(self._failed(endpoint, attempt, e))
+                continue
+            except BaseException:
+                self._abandoned(endpoint)
+                raise
+            endpoint.first_token.record(time.monotonic() - started)
+            try:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+            except Exception:
+                endpoint.count("failures")
+                endpoint.breaker.record_failure()
+                raise
+            except BaseException:
+                self._abandoned(endpoint, answered = True)
+                raise
+            endpoint.latency.record(time.monotonic() - started)
+            endpoint.breaker.record_success()
+            return
+        raise self._unavailable()
+
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Breaker state, counters and latency percentiles of every model.
+
+        Returns:
+            Dict[str, Any]: "endpoints" (one entry per model, preferred first) and "fallbacks".
+        """
+        with self._lock:
+            fallbacks = self._fallbacks
+        return {"endpoints": [endpoint.stats() for endpoint in self.endpoints], "fallbacks": fallbacks}
+
+
+def build_llm(model_name: str, temperature: float, fallback_model: Optional[str] = None, timeout: Optional[float] = None) -> ResilientLLM:
+    """
+    Resilient Groq chat model with an optional fallback model.
+
+    The Groq client's own retries are disabled so the wrapper's policy is the only one.
+
+    Args:
+        model_name (str): Primary Groq model.
+        temperature (float): Sampling temperature.
+        fallback_model (Optional[str]): Secondary Groq model, none if empty.
+        timeout (Optional[float]): Deadline of one call in seconds, defaults to LLM_TIMEOUT.
+
+    Returns:
+        ResilientLLM: Wrapped model(s).
+    """
+    from langchain_groq import ChatGroq
+
+    timeout = timeout or config.LLM_TIMEOUT
+    names = [model_name] + ([fallback_model] if fallback_model and fallback_model != model_name else [])
+    models = [
+        (name, ChatGroq(
+            model_name = name,
+            temperature = temperature,
+            groq_api_key = config.GROQ_API_KEY,
+            timeout = timeout,
+            max_retries = 0,
+        ))
+        for name in names
+    ]
+    return ResilientLLM(models, timeout = timeout)
@@ -0,0 +1,238 @@
+from typing import Optional, List, Dict, Any
+from collections import OrderedDict
+from langchain.docstore.document import Document
+from Configuration import config
+import threading
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key form of a web query.
+
+    Args:
+        query (str): Query text.
+
+    Returns:
+        str: Lowercase query with whitespace collapsed.
+    """
+    return " ".join(query.lower().split())
+
+
+class StubSearchClient:
+
+
+    def __init__(self, results: Optional[Dict[str, List[Dict[str, Any]]]] = None, delay: float = 0.0):
+        """
+        Offline stand-in for TavilyClient with the same `search` signature.
+
+        Args:
+            results (Optional[Dict[str, List[Dict[str, Any]]]]): Canned results by
+                normalized query; other queries get one result echoing the query.
+            delay (float): Seconds to sleep per call, to exercise the deadlines.
+        """
+        self.results = results or {}
+        self.delay = delay
+        self.calls = 0
+
+
+    @classmethod
+    def from_file(cls, path: str) -> "StubSearchClient":
+        """
+        Load canned results from a JSON file mapping queries to Tavily result lists.
+
+        Args:
+            path (str): JSON file.
+
+        Returns:
+            StubSearchClient: Stub serving the file's results.
+        """
+        with open(path, "r", encoding = "utf-8") as f:
+            results = json.load(f)
+        return cls({normalize_query(query): hits for query, hits in results.items()})
+
+
+    def search(self, query: str, max_results: int = 5, **kwargs) -> Dict[str, Any]:
+        """
+        Answer a search like the Tavily API.
+
+        Args:
+            query (str): Query text.
+            max_results (int): Maximum number of results.
+
+        Returns:
+            Dict[str, Any]: {"query", "results"} with "title", "url", "content" and "score" per result.
+        """
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        results = self.results.get(normalize_query(query))
+        if results is None:
+            results = [{
+                "title": f"Stub result for {query}",
+                "url": "https://example.com/search?q=" + "+".join(normalize_query(query).split()),
+                "content": f"No web search provider is configured; this is a stub result for: {query}",
+                "score": 0.0,
+            }]
+        return {"query": query, "results": results[:max_results]}
+
+
+def make_search_client(provider: Optional[str] = None):
+    """
+    Web search client for a provider name.
+
+    Args:
+        provider (Optional[str]): "tavily" or "stub", defaults to WEB_SEARCH_PROVIDER.
+
+    Returns:
+        Client with a Tavily-compatible `search(query, max_results=..., search_depth=...)`.
+    """
+    provider = provider or config.WEB_SEARCH_PROVIDER
+    if provider == "stub":
+        if config.WEB_SEARCH_STUB_FILE:
+            return StubSearchClient.from_file(config.WEB_SEARCH_STUB_FILE)
+        return StubSearchClient()
+    if provider != "tavily":
+        raise ValueError(f"Unknown web search provider {provider!r}, expected 'tavily' or 'stub'")
+    from tavily import TavilyClient
+    return TavilyClient(api_key = config.TAVILY_API_KEY or os.environ.get("TAVILY_API_KEY"))
+
+
+class TTLCache:
+
+
+    def __init__(self, max_entries: int, ttl: int):
+        """
+        In-process LRU cache whose entries expire after a fixed time.
+
+        Args:
+            max_entries (int): Maximum number of entries.
+            ttl (int): Lifetime of an entry in seconds.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a live entry.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            Optional[Any]: Cached value, or None if missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Store an entry, evicting the least recently used ones.
+
+        Args:
+            key (str): Cache key.
+            value (Any): Value.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+
+
+class WebSearch:
+
+
+    def __init__(self, client = None, cache = None):
+        """
+        Web search with results cached per normalized query.
+
+        Args:
+            client: Tavily-compatible client, built from WEB_SEARCH_PROVIDER on first use if None.
+            cache: Object with `get(key)` and `set(key, results)` shared between
+                processes, e.g. a Redis-backed cache; defaults to an in-process
+                TTLCache of WEB_SEARCH_CACHE_SIZE entries living WEB_SEARCH_CACHE_TTL seconds.
+        """
+        self._client = client
+        self._lock = threading.Lock()
+        self.cache = cache if cache is not None else TTLCache(config.WEB_SEARCH_CACHE_SIZE, config.WEB_SEARCH_CACHE_TTL)
+
+
+    @property
+    def client(self):
+        """
+        The search client, created on first use.
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = make_search_client()
+        return self._client
+
+
+    @staticmethod
+    def to_documents(results: List[Dict[str, Any]]) -> List[Document]:
+        """
+        Convert Tavily results to Documents citing their page.
+
+        Args:
+            results (List[Dict[str, Any]]): Tavily results.
+
+        Returns:
+            List[Document]: One Document per result with content, in result order.
+        """
+        return [
+            Document(
+                page_content = result["content"],
+                metadata = {
+                    "doc_id": result.get("url"),
+                    "filename": result.get("title") or result.get("url"),
+                    "source": result.get("url"),
+                    "origin": "web",
+                    "score": result.get("score"),
+                },
+            )
+            for result in results
+            if result.get("content")
+        ]
+
+
+    def search(self, query: str, k: int = 5) -> List[Document]:
+        """
+        Search the web, serving repeated queries from the cache.
+
+        Args:
+            query (str): Query text.
+            k (int): Number of results.
+
+        Returns:
+            List[Document]: Web results, best first.
+        """
+        key = f"{k}:{normalize_query(query)}"
+        results = self.cache.get(key)
+        if results is None:
+            started = time.perf_counter()
+            response = self.client.search(query, search_depth = config.WEB_SEARCH_DEPTH, max_results = k)
+            results = [
+                {field: result.get(field) for field in ("title", "url", "content", "score")}
+                for result in response.get("results", [])
+            ]
+            self.cache.set(key, results)
+            logger.info(f"Web search returned {len(results)} results in {time.perf_counter() - started:.2f}s")
+        return self.to_documents(results)
@@ -346,6 +346,9 @@ document.addEventListener("DOMContentLoaded", function () {
         documents.forEach((doc) => {
             addDocumentToList(doc);
             chats[chatId].documents.push(doc);
+            if (!["indexed", "failed"].includes(doc.status)) {
+                pollDocumentStatus(doc.id);
+            }
         });
         } catch (error) {
         console.error("Error loading documents:", error);
@@ -641,11 +644,12 @@ document.addEventListener("DOMContentLoaded", function () {
                 if (response.ok) {
                     const data = await response.json();
                     addDocumentToList(data);
-                    showSuccessMessage("Document uploaded successfully");
+                    showSuccessMessage("Document uploaded, indexing started");
                     if (!chats[currentChatId].documents) {
                         chats[currentChatId].documents = [];
                     }
                     chats[currentChatId].documents.push(data);
+                    pollDocumentStatus(data.id);
                 } else {
                     const errorData = await response.json();
                     throw new Error(errorData.error || "Failed to upload document");
@@ -659,6 +663,44 @@ document.addEventListener("DOMContentLoaded", function () {
         }
     }
 
+    // Format the indexing state of a document for the document list
+    function formatDocumentStatus(doc) {
+        const status = doc.status || "indexed";
+        const progress = doc.progress || { done: 0, total: 0 };
+        if (status === "indexed") {
+            return "";
+        }
+        if (status === "failed") {
+            return ` • <span class="text-red-500">Indexing failed</span>`;
+        }
+        const counts = progress.total ? ` ${progress.done}/${progress.total}` : "";
+        return ` • <span class="text-blue-500">${status.charAt(0).toUpperCase() + status.slice(1)}${counts}</span>`;
+    }
+
+    // Poll the indexing status of a document until it is indexed or failed
+    async function pollDocumentStatus(docId) {
+        try {
+            const response = await fetch(`/api/documents/${docId}/status`);
+            if (!response.ok) {
+                return;
+            }
+            const status = await response.json();
+            const statusElement = documentList.querySelector(`[data-id="${docId}"] .document-status`);
+            if (statusElement) {
+                statusElement.innerHTML = formatDocumentStatus(status);
+            }
+            if (status.status === "indexed") {
+                showSuccessMessage("Document indexed successfully");
+            } else if (status.status === "failed") {
+                showSuccessMessage(status.error || "Failed to index document", false);
+            } else {
+                setTimeout(() => pollDocumentStatus(docId), 2000);
+            }
+        } catch (error) {
+            console.error("Error polling document status:", error);
+        }
+    }
+
     // Add a document to the document list
     function addDocumentToList(doc) {
         let iconClass = "ri-file-text-line";
@@ -688,7 +730,7 @@ document.addEventListener("DOMContentLoaded", function () {
         </div>
         <div class="flex-1">
             <h4 class="text-sm font-medium text-gray-800">${doc.filename}</h4>
-            <p class="text-xs text-gray-500">Uploaded ${doc.upload_date} • ${doc.size}</p>
+            <p class="text-xs text-gray-500">Uploaded ${doc.upload_date} • ${doc.size}<span class="document-status">${formatDocumentStatus(doc)}</span></p>
         </div>
         <div class="w-8 h-8 flex items-center justify-center text-gray-400 hover:text-gray-600">
             <i class="ri-more-2-fill"></i>
@@ -842,25 +884,81 @@ document.addEventListener("DOMContentLoaded", function () {
         }
     }
 
-    // Send a message to the server
+    // Parse one Server-Sent Events block into its event name and JSON data
+    function parseSseEvent(block) {
+        let event = "message";
+        const data = [];
+        block.split("\n").forEach((line) => {
+            if (line.startsWith("event:")) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith("data:")) {
+                data.push(line.slice(5).trimStart());
+            }
+        });
+        return { event, data: data.length ? JSON.parse(data.join("\n")) : null };
+    }
+
+    // Send a message to the server and render the bot response as it streams in
     async function sendMessageToServer(message) {
-        try {
-            const typingIndicator = addTypingIndicator();
+        const chatId = currentChatId;
+        const typingIndicator = addTypingIndicator();
+        let botText = null;
+        let botMessage = null;
+        let content = "";
+
+        // Replace the typing indicator with the bot message on the first token
+        function appendToken(text) {
+            if (!botText) {
+                removeTypingIndicator(typingIndicator);
+                addBotMessage("", false);
+                const messages = chats[chatId] ? chats[chatId].messages : [];
+                botMessage = messages[messages.length - 1] || null;
+                botText = chatMessages.lastElementChild.querySelector(".bot-message p");
+            }
+            content += text;
+            botText.textContent = content;
+            if (botMessage) {
+                botMessage.content = content;
+            }
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        }
 
-            const response = await fetch(`/api/chats/${currentChatId}/messages`, {
+        try {
+            const response = await fetch(`/api/chats/${chatId}/messages/stream`, {
                 method: "POST",
                 headers: {
                     "Content-Type": "application/json",
+                    Accept: "text/event-stream",
                 },
                 body: JSON.stringify({ content: message }),
             });
-            if (response.ok) {
-                const data = await response.json();
-                removeTypingIndicator(typingIndicator);
-                addBotMessage(data.bot_response.content); // Changed from data.reply to data.bot_response.content
-            } else {
+            if (!response.ok || !response.body) {
                 throw new Error("Failed to send message");
             }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true }).replace(/\r\n/g, "\n");
+                let boundary;
+                while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                    const { event, data } = parseSseEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+                    if (event === "token") {
+                        appendToken(data.text);
+                    } else if (event === "error") {
+                        appendToken(content ? `\n\n${data.error}` : data.error);
+                    } else if (event === "done" && botMessage) {
+                        botMessage.id = data.bot_response.id;
+                    }
+                }
+            }
+            if (!botText) {
+                appendToken("");
+            }
         } catch (error) {
             console.error("Error sending message:", error);
             removeTypingIndicator(typingIndicator);
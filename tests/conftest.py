@@ -0,0 +1,58 @@
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configuration is validated on import; the tests never reach the database or the APIs.
+for name in ("DB_USER", "DB_PASSWORD", "DB_HOST", "TAVILY_API_KEY", "GROQ_API_KEY"):
+    os.environ.setdefault(name, "test")
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings: texts sharing words get similar vectors."""
+
+    dimension = 64
+
+    def __init__(self):
+        self.calls = 0
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dimension] += 1.0
+        return (vector + 0.01).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self._embed(text)
+
+
+@pytest.fixture
+def embeddings():
+    return HashEmbeddings()
+
+
+@pytest.fixture
+def make_store(tmp_path, embeddings):
+    """Build vector stores sharing one index directory, like the app and a Celery worker."""
+    from src.indexers import FAISSVectorStore
+
+    def make(**kwargs):
+        kwargs.setdefault("embeddings", embeddings)
+        return FAISSVectorStore(index_path=str(tmp_path / "index"), use_semantic_chunking=False, index_type="flat", **kwargs)
+    return make
+
+
+@pytest.fixture
+def store(make_store):
+    return make_store()
+
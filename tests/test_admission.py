@@ -0,0 +1,132 @@
+import asyncio
+import threading
+
+import pytest
+
+from modules.admission import AdmissionController, AdmissionRejected
+
+
+def controller(**kwargs):
+    kwargs = {"max_concurrent": 1, "max_queue": 10, "tenant_share": 0.5, "max_wait": 5, **kwargs}
+    return AdmissionController(**kwargs)
+
+
+def grant_order(admission, requests):
+    """Queue (tenant, priority) requests behind a held slot, in order, and return the order they are admitted in."""
+    async def scenario():
+        holder = await admission.aacquire("holder")
+        order = []
+
+        async def request(tenant, priority):
+            with await admission.aacquire(tenant, priority):
+                order.append((tenant, priority))
+                await asyncio.sleep(0)
+        tasks = []
+        for tenant, priority in requests:
+            tasks.append(asyncio.ensure_future(request(tenant, priority)))
+            await asyncio.sleep(0)
+        holder.release()
+        await asyncio.gather(*tasks)
+        return order
+    return asyncio.run(scenario())
+
+
+def test_interactive_requests_go_before_bulk():
+    order = grant_order(controller(), [("a", "bulk"), ("b", "bulk"), ("c", "interactive")])
+    assert order == [("c", "interactive"), ("a", "bulk"), ("b", "bulk")]
+
+
+def test_tenants_take_turns_within_a_class():
+    order = grant_order(controller(), [("a", "interactive")] * 3 + [("b", "interactive")])
+    assert [tenant for tenant, _ in order] == ["a", "b", "a", "a"]
+
+
+def test_tenant_over_its_queue_share_gets_429():
+    admission = controller(max_queue=4)
+    admission.acquire("holder")
+
+    async def scenario():
+        waiting = [asyncio.ensure_future(admission.aacquire("a")) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.aacquire("a")
+        for task in waiting:
+            task.cancel()
+        return rejected.value
+    rejected = asyncio.run(scenario())
+
+    assert rejected.status == 429
+    assert rejected.retry_after >= 1
+    assert admission.stats()["rejected_tenant"] == 1
+
+
+def test_full_queue_sheds_bulk_for_interactive_and_rejects_bulk():
+    admission = controller(max_queue=1)
+    admission.acquire("holder")
+
+    async def scenario():
+        bulk = asyncio.ensure_future(admission.aacquire("a", "bulk"))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(admission.aacquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as shed:
+            await bulk
+        with pytest.raises(AdmissionRejected) as full:
+            await admission.aacquire("c", "bulk")
+        interactive.cancel()
+        return shed.value, full.value
+    shed, full = asyncio.run(scenario())
+
+    assert (shed.status, full.status) == (503, 503)
+    assert admission.stats()["shed"] == 1
+    assert admission.stats()["rejected_full"] == 1
+
+
+def test_waiting_past_max_wait_is_rejected():
+    admission = controller(max_wait=0.05)
+    admission.acquire("holder")
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire("a")
+    assert rejected.value.status == 503
+    stats = admission.stats()
+    assert stats["timed_out"] == 1
+    assert stats["queued"] == {"interactive": 0, "bulk": 0}
+
+
+def test_cancelled_waiter_leaves_the_queue_and_release_is_idempotent():
+    admission = controller()
+    holder = admission.acquire("holder")
+
+    async def scenario():
+        waiter = asyncio.ensure_future(admission.aacquire("a"))
+        await asyncio.sleep(0)
+        assert admission.stats()["queued"]["interactive"] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+    asyncio.run(scenario())
+
+    assert admission.stats()["queued"]["interactive"] == 0
+    holder.release()
+    holder.release()
+    assert admission.stats()["running"] == 0
+
+
+def test_threads_block_until_a_slot_is_released():
+    admission = controller()
+    holder = admission.acquire("holder")
+    admitted = threading.Event()
+
+    def request():
+        with admission.acquire("a"):
+            admitted.set()
+    thread = threading.Thread(target=request)
+    thread.start()
+    assert not admitted.wait(0.05)
+    holder.release()
+    thread.join(5)
+
+    assert admitted.is_set()
+    assert admission.stats()["running"] == 0
+    assert admission.stats()["mean_wait"] > 0
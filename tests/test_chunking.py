@@ -0,0 +1,38 @@
+from langchain_core.documents import Document
+
+from src.chunking import RAGChunker
+from src.context import ContextBuilder
+
+
+TEXT = (
+    "Apples grow on trees in the orchard.  Pears grow there too!\n"
+    "Rust prevents data races at compile time. The borrow checker enforces it. "
+    "Ownership moves values between scopes. Lifetimes bound every reference."
+)
+
+
+def test_mean_mode_chunks_are_exact_spans_of_the_source(embeddings):
+    chunker = RAGChunker(use_semantic_chunking=True, embeddings=embeddings, chunk_vector_mode="mean")
+    chunks = chunker.chunk_text_with_vectors(TEXT, {"page": 1})
+
+    assert chunks
+    for document, vector in chunks:
+        start = document.metadata["start_index"]
+        assert TEXT[start:start + len(document.page_content)] == document.page_content
+        assert vector is not None
+    assert chunks[0][0].page_content.startswith("Apples")
+    assert chunks[-1][0].page_content.endswith("reference.")
+
+
+def test_contained_chunk_does_not_shrink_merged_block():
+    page = {"doc_id": "a", "page": 1}
+    text = "one two three four five six seven eight nine ten"
+    outer = Document(page_content=text[:27], metadata=dict(page, start_index=0))
+    inner = Document(page_content=text[5:15], metadata=dict(page, start_index=5))
+    tail = Document(page_content=text[28:], metadata=dict(page, start_index=28))
+
+    blocks = ContextBuilder(duplicate_threshold=1.1)._merge([outer, inner, tail])
+
+    assert len(blocks) == 1
+    assert blocks[0]["text"] == text
+    assert blocks[0]["end"] == len(text)
@@ -0,0 +1,17 @@
+import pytest
+
+from Configuration.config import Config
+
+
+def test_default_admission_limit_fits_the_database_pool():
+    config = Config()
+    config.validate()
+    assert config.ADMISSION_MAX_CONCURRENT <= config.DB_POOL_SIZE
+
+
+def test_admission_limit_above_the_database_pool_is_rejected():
+    config = Config()
+    config.DB_POOL_SIZE = 8
+    config.ADMISSION_MAX_CONCURRENT = 9
+    with pytest.raises(ValueError, match="DB_POOL_SIZE"):
+        config.validate()
@@ -0,0 +1,54 @@
+import sqlite3
+import threading
+
+from src.embeddings import CachedEmbeddings
+
+
+def test_hits_skip_the_model_and_fresh_entries_are_not_rewritten(tmp_path, embeddings):
+    cache = CachedEmbeddings(embeddings, "test", str(tmp_path / "cache.sqlite3"))
+    first = cache.embed_documents(["hello  world", "foo"])
+    stamps = dict(sqlite3.connect(cache.cache_path).execute("SELECT key, last_used FROM embeddings"))
+
+    assert cache.embed_documents(["hello world", "foo"]) == first
+    assert embeddings.calls == 2
+    assert dict(sqlite3.connect(cache.cache_path).execute("SELECT key, last_used FROM embeddings")) == stamps
+    assert cache.stats()["hits"] == 2
+
+
+def test_stale_hits_refresh_last_used(tmp_path, embeddings):
+    cache = CachedEmbeddings(embeddings, "test", str(tmp_path / "cache.sqlite3"))
+    cache.embed_documents(["foo"])
+    conn = sqlite3.connect(cache.cache_path, isolation_level=None)
+    conn.execute("UPDATE embeddings SET last_used = 0")
+
+    cache.embed_documents(["foo"])
+    assert conn.execute("SELECT last_used FROM embeddings").fetchone()[0] > 0
+
+
+def test_eviction_keeps_the_most_recent_entries(tmp_path, embeddings):
+    cache = CachedEmbeddings(embeddings, "test", str(tmp_path / "cache.sqlite3"), max_entries=5)
+    for i in range(12):
+        cache.embed_documents([f"text {i}"])
+
+    assert cache.stats()["entries"] == 5
+    embeddings.calls = 0
+    cache.embed_documents([f"text {i}" for i in range(7, 12)])
+    assert embeddings.calls == 0
+
+
+def test_concurrent_threads_share_the_cache(tmp_path, embeddings):
+    cache = CachedEmbeddings(embeddings, "test", str(tmp_path / "cache.sqlite3"))
+    texts = [f"text {i}" for i in range(50)]
+    expected = embeddings.embed_documents(texts)
+    results = []
+
+    def embed():
+        results.append(cache.embed_documents(texts))
+    threads = [threading.Thread(target=embed) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [expected] * 8
+    assert cache.stats()["entries"] == 50
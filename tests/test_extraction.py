@@ -0,0 +1,30 @@
+import PyPDF2
+
+from src import extraction
+
+
+def write_pdf(path, pages):
+    writer = PyPDF2.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def test_sequential_extraction_parses_the_file_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "doc.pdf")
+    write_pdf(path, 31)
+    readers = []
+    reader = PyPDF2.PdfReader
+
+    def counting_reader(*args, **kwargs):
+        readers.append(1)
+        return reader(*args, **kwargs)
+    monkeypatch.setattr(extraction.PyPDF2, "PdfReader", counting_reader)
+    monkeypatch.setattr(extraction.config, "EXTRACTION_WORKERS", 0)
+
+    pages = list(extraction._iter_pdf_pages(path, {"doc_id": "d"}))
+
+    assert [page.metadata["page"] for page in pages] == list(range(1, 32))
+    assert {page.metadata["page_count"] for page in pages} == {31}
+    assert len(readers) == 1
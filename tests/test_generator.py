@@ -0,0 +1,38 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.generator import ChatDocs
+
+
+def test_search_deadline_counts_from_when_it_starts_running():
+    pool = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    blocker, _ = ChatDocs._submit(pool, release.wait, 5)
+    search, started = ChatDocs._submit(pool, lambda: (time.sleep(0.1), ["chunk"])[1])
+    # Queued for 0.15s then running for 0.1s: counted from submission it would miss its 0.2s deadline.
+    threading.Timer(0.15, release.set).start()
+
+    assert ChatDocs._collect(search, started, 0.2, "local", "chat") == ["chunk"]
+    assert blocker.result()
+    pool.shutdown()
+
+
+def test_search_that_overruns_its_deadline_is_dropped():
+    pool = ThreadPoolExecutor(max_workers=1)
+    search, started = ChatDocs._submit(pool, lambda: (time.sleep(0.3), ["chunk"])[1])
+
+    assert ChatDocs._collect(search, started, 0.05, "local", "chat") == []
+    pool.shutdown()
+
+
+def test_search_stuck_in_the_queue_is_dropped():
+    pool = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    ChatDocs._submit(pool, release.wait, 5)
+    search, started = ChatDocs._submit(pool, lambda: ["chunk"])
+
+    assert ChatDocs._collect(search, started, 0.05, "local", "chat") == []
+    assert search.cancelled()
+    release.set()
+    pool.shutdown()
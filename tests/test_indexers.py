@@ -0,0 +1,71 @@
+import threading
+import time
+
+from langchain_core.documents import Document
+
+
+def chunk(text, doc_id, chat_id="chat"):
+    return Document(page_content=text, metadata={"doc_id": doc_id, "chat_id": chat_id, "filename": f"{doc_id}.pdf"})
+
+
+class DictResultCache:
+    """In-memory stand-in for RetrievalCache."""
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, chat_id, generation, query, k):
+        return self.entries.get((chat_id, generation, query, k))
+
+    def set(self, chat_id, generation, query, k, results):
+        self.entries[(chat_id, generation, query, k)] = results
+
+
+def scored(store, query):
+    return [(doc.metadata["doc_id"], round(score, 6)) for doc, score in store._search_with_score(query, 1, "chat")]
+
+
+def test_reuploaded_shard_does_not_reuse_cached_results(make_store):
+    store = make_store(result_cache=DictResultCache())
+    store.add_chunks([chunk("apples grow on trees", "a")])
+    before = store.generation("chat")
+    assert scored(store, "apples grow on trees")[0][0] == "a"
+
+    # Deleting the last document removes the shard, so its sequence numbers and chunk IDs start over.
+    store.delete_documents(["a"], chat_id="chat")
+    store.add_chunks([chunk("rust prevents data races", "b")])
+
+    assert store.generation("chat") != before
+    assert scored(store, "apples grow on trees") == scored(make_store(), "apples grow on trees")
+
+
+def test_refresh_notices_shard_rebuilt_by_another_process(make_store):
+    reader, writer = make_store(), make_store()
+    writer.add_chunks([chunk("apples grow on trees", "a")])
+    assert [doc.metadata["doc_id"] for doc in reader.search("apples", k=1, chat_id="chat")] == ["a"]
+
+    writer.delete_documents(["a"], chat_id="chat")
+    writer.add_chunks([chunk("rust prevents data races", "b")])
+
+    assert reader.load_index("chat").seq == writer.load_index("chat").seq
+    reader.refresh("chat")
+    assert [doc.metadata["doc_id"] for doc in reader.search("apples", k=1, chat_id="chat")] == ["b"]
+
+
+def test_upload_waiting_on_the_last_delete_is_kept(make_store, monkeypatch):
+    from src.indexers import FAISSVectorStore
+
+    deleter, uploader = make_store(), make_store()
+    deleter.add_chunks([chunk("apples grow on trees", "a")])
+    upload = threading.Thread(target=uploader.add_chunks, args=([chunk("rust prevents data races", "b")],))
+    remove_shard = FAISSVectorStore._remove_shard
+
+    def remove_while_upload_waits(self, chat_id):
+        upload.start()
+        time.sleep(0.1)
+        remove_shard(self, chat_id)
+    monkeypatch.setattr(FAISSVectorStore, "_remove_shard", remove_while_upload_waits)
+    deleter.delete_documents(["a"], chat_id="chat")
+    upload.join(5)
+
+    assert [doc.metadata["doc_id"] for doc in make_store().search("apples", k=2, chat_id="chat")] == ["b"]
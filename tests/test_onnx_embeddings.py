@@ -0,0 +1,11 @@
+import pytest
+
+from src import onnx_embeddings
+
+
+def test_missing_export_names_the_export_command(tmp_path, monkeypatch):
+    monkeypatch.setattr(onnx_embeddings.config, "ONNX_MODEL_DIR", str(tmp_path))
+
+    with pytest.raises(FileNotFoundError, match="python -m src.onnx_embeddings export"):
+        onnx_embeddings.load_onnx_embeddings("sentence-transformers/all-MiniLM-L6-v2")
+    assert not list(tmp_path.iterdir())
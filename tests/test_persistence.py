@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+from src import persistence
+from src.persistence import WriteAheadLog, SnapshotManager, file_lock, MANIFEST_FILE, WAL_FILE
+
+
+def chunk(text, doc_id, chat_id="chat"):
+    return Document(page_content=text, metadata={"doc_id": doc_id, "chat_id": chat_id, "filename": f"{doc_id}.pdf"})
+
+
+def doc_ids(results):
+    return {doc.metadata["doc_id"] for doc in results}
+
+
+def test_wal_stops_at_torn_record(tmp_path):
+    wal = WriteAheadLog(str(tmp_path / WAL_FILE))
+    wal.append({"seq": 1})
+    wal.append({"seq": 2})
+    with open(wal.path, "ab") as f:
+        f.write(b'{"seq": 3')
+
+    records = list(wal.records())
+    assert [record["seq"] for record, _ in records] == [1, 2]
+    assert list(wal.records(records[0][1]))[0][0] == {"seq": 2}
+
+
+def test_append_after_torn_tail_is_not_lost(make_store):
+    store = make_store()
+    store.add_chunks([chunk("apples grow on trees", "a")])
+    with open(store._wal("chat").path, "ab") as f:
+        f.write(b'{"op": "add", "seq": 2')
+    store.add_chunks([chunk("rust prevents data races", "b")])
+
+    assert doc_ids(store.search("apples trees", k=2, chat_id="chat")) == {"a", "b"}
+    assert doc_ids(make_store().search("apples trees", k=2, chat_id="chat")) == {"a", "b"}
+
+
+@pytest.mark.skipif(persistence.fcntl is None, reason="needs flock")
+def test_lock_waiter_relocks_a_recreated_lock_file(tmp_path):
+    path = str(tmp_path / "shard" / "LOCK")
+    held = []
+
+    def wait_for_lock():
+        with file_lock(path):
+            held.append(os.path.exists(path))
+    waiter = threading.Thread(target=wait_for_lock)
+    with file_lock(path):
+        waiter.start()
+        time.sleep(0.1)
+        shutil.rmtree(tmp_path / "shard")
+    waiter.join(5)
+
+    assert held == [True]
+
+
+def test_writes_survive_reopen_through_log_replay(make_store):
+    make_store().add_chunks([chunk("apples grow on trees", "a"), chunk("rust prevents data races", "b")])
+
+    reopened = make_store()
+    assert doc_ids(reopened.search("apples trees", k=2, chat_id="chat")) == {"a", "b"}
+    assert len(reopened.load_index("chat")) == 2
+
+
+def test_tombstoned_chunks_stay_deleted_after_compaction_and_reopen(make_store):
+    store = make_store()
+    store.add_chunks([chunk("apples grow on trees", "a"), chunk("rust prevents data races", "b")])
+    store.compact("chat")
+    store.delete_documents(["a"], chat_id="chat")
+
+    assert store.load_index("chat").tombstones
+    assert doc_ids(store.search("apples trees", k=2, chat_id="chat")) == {"b"}
+    assert doc_ids(make_store().search("apples trees", k=2, chat_id="chat")) == {"b"}
+    store.compact("chat")
+    assert doc_ids(make_store().search("apples trees", k=2, chat_id="chat")) == {"b"}
+
+
+def test_crash_before_publishing_snapshot_keeps_log(make_store, monkeypatch):
+    store = make_store()
+    store.add_chunks([chunk("apples grow on trees", "a")])
+
+    def crash(*args, **kwargs):
+        raise OSError("crash")
+    monkeypatch.setattr(SnapshotManager, "publish", crash)
+    with pytest.raises(OSError):
+        store.compact("chat")
+    monkeypatch.undo()
+
+    reopened = make_store()
+    assert doc_ids(reopened.search("apples", k=1, chat_id="chat")) == {"a"}
+
+
+def test_crash_between_publish_and_truncate_does_not_duplicate(make_store, monkeypatch):
+    store = make_store()
+    store.add_chunks([chunk("apples grow on trees", "a"), chunk("pears grow on trees", "b")])
+
+    def crash(self):
+        raise OSError("crash")
+    monkeypatch.setattr(WriteAheadLog, "truncate", crash)
+    with pytest.raises(OSError):
+        store.compact("chat")
+    monkeypatch.undo()
+
+    reopened = make_store().load_index("chat")
+    assert reopened.snapshot is not None
+    assert len(reopened) == 2
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc to map descriptors to paths")
+def test_compaction_flushes_snapshot_before_manifest_and_log(store, monkeypatch):
+    store.add_chunks([chunk("apples grow on trees", "a")])
+    synced = []
+    fsync = os.fsync
+
+    def recording_fsync(fd):
+        synced.append(os.readlink(f"/proc/self/fd/{fd}"))
+        fsync(fd)
+    monkeypatch.setattr(persistence.os, "fsync", recording_fsync)
+    store.compact("chat")
+
+    shard_path = store._shard_path("chat")
+    with open(os.path.join(shard_path, MANIFEST_FILE)) as f:
+        snapshot = json.load(f)["snapshot"]
+    snapshot_files = os.listdir(os.path.join(shard_path, snapshot))
+    manifest_at = max(i for i, path in enumerate(synced) if os.path.basename(path).startswith(MANIFEST_FILE))
+    wal_at = max(i for i, path in enumerate(synced) if os.path.basename(path).startswith(WAL_FILE))
+    for name in snapshot_files:
+        flushed = [i for i, path in enumerate(synced) if os.path.basename(path) == name]
+        assert flushed and flushed[-1] < manifest_at, name
+    # The directory entry of the renamed snapshot is flushed before the manifest points at it.
+    assert any(path == shard_path for path in synced[:manifest_at])
+    assert manifest_at < wal_at
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from modules import redis_client
+from modules.redis_client import AsyncRedisClient
+
+
+def test_hits_beyond_the_limit_are_refused_per_key(monkeypatch):
+    monkeypatch.setattr(redis_client.time, "time", lambda: 1_000_040.0)
+
+    async def scenario():
+        client = AsyncRedisClient()
+        client.client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        hits = [await client.hit_rate_limit("send_message:alice", 3) for _ in range(4)]
+        other = await client.hit_rate_limit("send_message:bob", 3)
+        return hits, other
+    hits, other = asyncio.run(scenario())
+
+    assert [allowed for allowed, _ in hits] == [True, True, True, False]
+    assert hits[-1][1] == 40
+    assert other[0]
+
+
+def test_a_new_window_starts_a_new_count(monkeypatch):
+    now = [1_000_040.0]
+    monkeypatch.setattr(redis_client.time, "time", lambda: now[0])
+
+    async def scenario():
+        client = AsyncRedisClient()
+        client.client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        first, _ = await client.hit_rate_limit("get_chats:alice", 1)
+        refused, _ = await client.hit_rate_limit("get_chats:alice", 1)
+        now[0] += 60
+        later, _ = await client.hit_rate_limit("get_chats:alice", 1)
+        return first, refused, later
+    assert asyncio.run(scenario()) == (True, False, True)
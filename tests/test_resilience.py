@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import pytest
+
+from src.resilience import CircuitBreaker, ResilientLLM, CLOSED, OPEN, HALF_OPEN
+
+RESET = 0.02
+
+
+class FakeModel:
+    """Chat model answering with fixed chunks, or never when `hang` is set."""
+
+    def __init__(self, chunks=("a", "b", "c"), hang=False):
+        self.chunks = chunks
+        self.hang = hang
+
+    def invoke(self, prompt, **kwargs):
+        return "".join(self.chunks)
+
+    def stream(self, prompt, **kwargs):
+        yield from self.chunks
+
+    async def ainvoke(self, prompt, **kwargs):
+        if self.hang:
+            await asyncio.sleep(3600)
+        return "".join(self.chunks)
+
+    async def astream(self, prompt, **kwargs):
+        if self.hang:
+            await asyncio.sleep(3600)
+        for chunk in self.chunks:
+            yield chunk
+
+
+def half_open_llm(model):
+    """A wrapper whose only circuit lets its next call through as the probe."""
+    llm = ResilientLLM([("fake", model)], timeout=60, max_retries=0)
+    breaker = llm.endpoints[0].breaker = CircuitBreaker("fake", failure_threshold=1, reset_timeout=RESET)
+    breaker.record_failure()
+    time.sleep(RESET * 1.5)
+    return llm, breaker
+
+
+def test_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker("fake", failure_threshold=2, reset_timeout=RESET)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state()["state"] == OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() > 0
+
+    time.sleep(RESET * 1.5)
+    assert breaker.allow()
+    assert breaker.state()["state"] == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state()["state"] == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_circuit():
+    breaker = CircuitBreaker("fake", failure_threshold=1, reset_timeout=RESET)
+    breaker.record_failure()
+    time.sleep(RESET * 1.5)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state()["state"] == OPEN
+    assert not breaker.allow()
+
+
+def test_stream_closed_by_consumer_settles_probe():
+    llm, breaker = half_open_llm(FakeModel())
+    stream = llm.stream("hi")
+    assert next(stream) == "a"
+    stream.close()
+
+    assert breaker.state()["state"] == CLOSED
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize("call", [
+    lambda llm: llm.ainvoke("hi"),
+    lambda llm: llm.astream("hi").__anext__(),
+], ids=["ainvoke", "astream"])
+def test_cancelled_probe_reopens_circuit(call):
+    llm, breaker = half_open_llm(FakeModel(hang=True))
+
+    async def cancel():
+        task = asyncio.ensure_future(call(llm))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(cancel())
+
+    assert breaker.state()["state"] == OPEN
+    time.sleep(RESET * 1.5)
+    assert breaker.allow()
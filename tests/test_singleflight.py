@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from modules.singleflight import SingleFlight, AsyncSingleFlight
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def group(server=None, **kwargs):
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    return SingleFlight(SimpleNamespace(client=client), wait_timeout=5, poll_interval=0.01, **kwargs)
+
+
+def run_concurrently(flight, key, fn, callers):
+    results = [None] * callers
+
+    def call(position):
+        try:
+            results[position] = flight.do(key, fn)
+        except Exception as e:
+            results[position] = e
+    threads = [threading.Thread(target=call, args=(position,)) for position in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_callers_share_one_call():
+    flight = group()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return ["answer", []]
+    threads, results = run_concurrently(flight, "key", work, 5)
+    wait_until(lambda: flight.stats()["local_followers"] == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [["answer", []]] * 5
+    assert flight.stats()["leader"] == 1
+    assert flight.stats()["coalesced_ratio"] == pytest.approx(0.8)
+
+
+def test_followers_run_the_work_when_the_leader_fails():
+    flight = group()
+    release = threading.Event()
+    calls = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            calls.append(1)
+            leader = len(calls) == 1
+        if leader:
+            release.wait(5)
+            raise RuntimeError("LLM down")
+        return "answer"
+    threads, results = run_concurrently(flight, "key", work, 3)
+    wait_until(lambda: flight.stats()["local_followers"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert [type(result) for result in results].count(RuntimeError) == 1
+    assert [result for result in results if result == "answer"] == ["answer", "answer"]
+    assert len(calls) == 3
+    assert flight.stats()["fallbacks"] == 2
+
+
+def test_other_process_waiting_on_the_leader_gets_its_result():
+    server = fakeredis.FakeServer()
+    leader, other = group(server), group(server)
+    release = threading.Event()
+
+    def work():
+        release.wait(5)
+        return {"answer": 42}
+    threads, results = run_concurrently(leader, "key", work, 1)
+    wait_until(lambda: leader.stats()["leader"] == 1)
+    follower_threads, follower_results = run_concurrently(other, "key", lambda: pytest.fail("work ran twice"), 1)
+    time.sleep(0.05)
+    release.set()
+    for thread in threads + follower_threads:
+        thread.join()
+
+    assert results == follower_results == [{"answer": 42}]
+    assert other.stats()["remote_followers"] == 1
+
+
+def test_call_after_the_work_finished_runs_it_again():
+    server = fakeredis.FakeServer()
+    first = group(server)
+    assert first.do("key", lambda: {"answer": 42}) == {"answer": 42}
+    # fakeredis has no Lua, so release the lock the way the leader's script would.
+    first.client.delete("singleflight:key:lock")
+
+    other = group(server)
+    assert other.do("key", lambda: {"answer": 43}) == {"answer": 43}
+    assert other.stats()["remote_followers"] == 0
+
+
+def async_group():
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    return AsyncSingleFlight(SimpleNamespace(client=client), wait_timeout=5, poll_interval=0.01)
+
+
+def test_cancelled_follower_does_not_cancel_the_leader():
+    async def scenario():
+        flight = async_group()
+        release = asyncio.Event()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return "answer"
+        leader = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flight.do("key", work))
+        other = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        release.set()
+
+        assert await leader == "answer"
+        assert await other == "answer"
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        assert len(calls) == 1
+    asyncio.run(scenario())
+
+
+def test_followers_take_over_from_a_cancelled_leader():
+    async def scenario():
+        flight = async_group()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(3600)
+            return "answer"
+        leader = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        assert await follower == "answer"
+        assert flight.stats()["fallbacks"] == 1
+    asyncio.run(scenario())